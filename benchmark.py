@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the organize engine on a synthetic corpus
+
+    python generate_test_photos.py /tmp/corpus --count 100000
+    python benchmark.py /tmp/corpus --output bench-$(git rev-parse --short HEAD).json
+    python benchmark.py /tmp/corpus --compare bench-old.json bench-new.json
+
+Each stage runs in a fresh child process, so that its peak memory and
+system calls are its own:
+
+- scan: list the photos of the corpus
+- index: index the corpus as a destination (duplicate detection)
+- metadata: date every photo through the default chain of date sources
+- hash: full digest of every photo
+- copy: copy every photo into an empty folder
+- organize: the whole engine, end to end, into an empty destination
+- rerun: organize again into the same destination (everything is a duplicate)
+
+The report is JSON: files/s, MB/s, wall time, peak RSS, read/write system
+calls and bytes (Linux /proc/<pid>/io) for each stage, plus the corpus
+summary and the commit, so that two reports can be compared.
+
+Memory should not grow with the size of the library, except for the
+destination index (about 50 bytes per file). `rss_per_file` is the peak
+RSS growth of a stage divided by its files: run two corpora of different
+sizes to check it, and `--max-rss-mb` to fail when a stage exceeds a limit.
+
+`--startup` also measures how long a launch takes, the median of several
+fresh processes (`--stages=` to measure only that):
+
+- interpreter: `python -c pass`, the floor of everything below
+- import: import the engine
+- cli_first_file: the command line organizing one photo of the corpus
+- gui_first_window: the interface until its window is on screen (needs a display)
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+STAGES = ['scan', 'index', 'metadata', 'hash', 'copy', 'organize', 'rerun']
+
+# Report fields compared by --compare (higher is better)
+COMPARED = ['files_per_second', 'mb_per_second']
+
+# Launches measured by --startup, and how many times each one runs
+STARTUP_RUNS = 10
+FIRST_WINDOW_LINE = 'first-window'
+
+
+def read_proc_io():
+    """Counters of /proc/self/io (Linux only), empty elsewhere"""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            return {key: int(value) for key, value in (line.split(': ') for line in f)}
+    except OSError:
+        return {}
+
+
+def current_rss_mb():
+    """Resident memory of this process (Linux only), None elsewhere"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def list_photos(source):
+    from photo_organizer_engine.engine import iter_photos
+    return [entry.path for entry in iter_photos(source)]
+
+
+def run_stage(stage, source, workdir):
+    """Run one stage in this process, return its measurements"""
+    from photo_organizer_engine.engine import OrganizerConfig, organize, iter_photos
+    from photo_organizer_engine.dates import DateResolver
+    from photo_organizer_engine.dedupe import DestinationIndex
+    from photo_organizer_engine.hashing import full_digest
+    from photo_organizer_engine.pipeline import default_metadata_workers, default_copy_workers
+    from photo_organizer_engine.transfer import copy_atomic
+
+    destination = os.path.join(workdir, 'organized')
+    # Listing is part of the measured work only for the scan stage
+    paths = list_photos(source) if stage in ('metadata', 'hash', 'copy') else None
+
+    rss_start = current_rss_mb()
+    io_before = read_proc_io()
+    started = time.perf_counter()
+    files = 0
+    nbytes = 0
+    extra = {}
+
+    if stage == 'scan':
+        files = sum(1 for _ in iter_photos(source))
+    elif stage == 'index':
+        index = DestinationIndex().build(iter_photos(source))
+        files = index.files
+        extra = {'index_bytes': index.nbytes()}
+    elif stage == 'metadata':
+        dates = DateResolver()
+        with ThreadPoolExecutor(default_metadata_workers()) as executor:
+            files = sum(1 for _ in executor.map(dates.resolve, paths))
+        extra = {'date_sources': dates.counts}
+    elif stage == 'hash':
+        with ThreadPoolExecutor(default_metadata_workers()) as executor:
+            files = sum(1 for _ in executor.map(full_digest, paths))
+        nbytes = sum(os.path.getsize(path) for path in paths)
+    elif stage == 'copy':
+        target = os.path.join(workdir, 'copy')
+        os.makedirs(target, exist_ok=True)
+
+        def copy(item):
+            index, path = item
+            copy_atomic(path, os.path.join(target, f"{index}_{os.path.basename(path)}"))
+            return os.path.getsize(path)
+
+        with ThreadPoolExecutor(default_copy_workers()) as executor:
+            sizes = list(executor.map(copy, enumerate(paths)))
+        files = len(sizes)
+        nbytes = sum(sizes)
+    elif stage in ('organize', 'rerun'):
+        config = OrganizerConfig(source, destination, cache_path=None, resume=False)
+        result = organize(config)
+        files = result.done
+        nbytes = result.bytes_transferred
+        extra = {'organized': result.processed, 'duplicates': result.skipped_duplicates,
+                 'errors': result.errors}
+    else:
+        raise ValueError(f"unknown stage {stage}")
+
+    seconds = time.perf_counter() - started
+    io_after = read_proc_io()
+    report = {
+        'files': files,
+        'bytes': nbytes,
+        'seconds': round(seconds, 4),
+        'files_per_second': round(files / seconds, 1) if seconds else None,
+        'mb_per_second': round(nbytes / (1024 * 1024) / seconds, 2) if seconds else None,
+    }
+    for key in ('syscr', 'syscw', 'read_bytes', 'write_bytes'):
+        if key in io_after:
+            report[key] = io_after[key] - io_before.get(key, 0)
+    if rss_start is not None:
+        report['rss_start_mb'] = round(rss_start, 1)
+    report.update(extra)
+    return report
+
+
+def measure_stage(stage, source, workdir):
+    """Run a stage in a child process, add its wall time and peak RSS"""
+    command = [sys.executable, os.path.abspath(__file__), source,
+               '--run-stage', stage, '--workdir', workdir]
+    started = time.perf_counter()
+    child = subprocess.Popen(command, stdout=subprocess.PIPE)
+    output = child.stdout.read()
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(child.pid, 0)
+        child.returncode = os.waitstatus_to_exitcode(status)
+    else:
+        usage = None
+        child.wait()
+    wall = time.perf_counter() - started
+    if child.returncode != 0:
+        raise RuntimeError(f"stage {stage} failed with exit code {child.returncode}")
+
+    report = json.loads(output)
+    report['wall_seconds'] = round(wall, 4)
+    if usage is not None:
+        # Kilobytes on Linux, bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        report['peak_rss_mb'] = round(usage.ru_maxrss * scale / (1024 * 1024), 1)
+        report['user_seconds'] = round(usage.ru_utime, 3)
+        report['system_seconds'] = round(usage.ru_stime, 3)
+        report['context_switches'] = usage.ru_nvcsw + usage.ru_nivcsw
+        if 'rss_start_mb' in report and report['files']:
+            # Memory the stage added, per file (the listing of metadata/hash/copy included)
+            growth = max(report['peak_rss_mb'] - report['rss_start_mb'], 0)
+            report['rss_per_file'] = round(growth * 1024 * 1024 / report['files'])
+    return report
+
+
+def drop_caches():
+    """Empty the Linux page cache for cold runs (needs root), True on success"""
+    try:
+        os.sync()
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+        return True
+    except OSError:
+        return False
+
+
+def time_launch(command, env=None, until=None):
+    """Seconds from starting `command` to its exit, or to its first output line equal to `until`"""
+    started = time.perf_counter()
+    child = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             env=env, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    seen = until is None
+    for line in child.stdout:
+        if until is not None and line.strip() == until:
+            seen = True
+            break
+    else:
+        child.wait()
+    seconds = time.perf_counter() - started
+    child.stdout.read()
+    if child.wait() != 0 or not seen:
+        raise RuntimeError(f"{' '.join(command)} failed with exit code {child.returncode}")
+    return seconds
+
+
+def has_display():
+    return sys.platform in ('win32', 'darwin') or bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+
+def measure_startup(source, workdir, runs=STARTUP_RUNS):
+    """Median and fastest launch times, in milliseconds"""
+    from photo_organizer_engine.engine import iter_photos
+
+    # One photo of the corpus, organized into an empty folder at every run
+    photo = next(iter(iter_photos(source)), None)
+    if photo is None:
+        raise RuntimeError(f"no photo in {source}")
+    inbox = os.path.join(workdir, 'startup_inbox')
+    os.makedirs(inbox, exist_ok=True)
+    shutil.copy2(photo.path, inbox)
+    organized = os.path.join(workdir, 'startup_organized')
+
+    launches = {
+        'interpreter': ([sys.executable, '-c', 'pass'], None, None),
+        'import': ([sys.executable, '-c', 'import photo_organizer_engine.engine'], None, None),
+        'cli_first_file': ([sys.executable, '-m', 'photo_organizer_engine', inbox, organized,
+                            '--no-resume', '--quiet'], None, None),
+    }
+    if has_display():
+        env = dict(os.environ, PHOTO_ORGANIZER_STARTUP_PROBE='1')
+        launches['gui_first_window'] = ([sys.executable, 'photo_organizer.py'], env, FIRST_WINDOW_LINE)
+
+    # gui_first_window stays None without a display
+    report = {'runs': runs, 'gui_first_window': None}
+    for name, (command, env, until) in launches.items():
+        times = []
+        for _ in range(runs):
+            shutil.rmtree(organized, ignore_errors=True)
+            times.append(time_launch(command, env, until))
+        report[name] = {
+            'median_ms': round(statistics.median(times) * 1000, 1),
+            'min_ms': round(min(times) * 1000, 1),
+        }
+    shutil.rmtree(inbox, ignore_errors=True)
+    shutil.rmtree(organized, ignore_errors=True)
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def benchmark(source, stages, workdir, cold=False, startup=False):
+    """Run `stages` on the corpus in `source`, return the JSON report"""
+    corpus = None
+    try:
+        with open(os.path.join(source, 'corpus.json'), 'r', encoding='utf-8') as f:
+            corpus = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'source': os.path.abspath(source),
+        'corpus': corpus,
+        'cold_cache': cold,
+        'stages': {},
+    }
+    for stage in stages:
+        if stage == 'organize':
+            # Always into an empty destination; rerun reuses it
+            shutil.rmtree(os.path.join(workdir, 'organized'), ignore_errors=True)
+        if cold and not drop_caches():
+            print("warning: cannot drop the page cache (needs root)", file=sys.stderr)
+            cold = report['cold_cache'] = False
+        print(f"{stage}...", file=sys.stderr)
+        report['stages'][stage] = measure_stage(stage, source, workdir)
+        shutil.rmtree(os.path.join(workdir, 'copy'), ignore_errors=True)
+    if startup:
+        print("startup...", file=sys.stderr)
+        report['startup'] = measure_startup(source, workdir)
+    return report
+
+
+def compare(old_path, new_path):
+    """Print the speedup of each stage between two reports"""
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{'stage':<10} {'metric':<18} {'old':>12} {'new':>12} {'change':>8}")
+    for stage, new_stage in new['stages'].items():
+        old_stage = old['stages'].get(stage)
+        if not old_stage:
+            continue
+        for key in COMPARED + ['peak_rss_mb', 'rss_per_file', 'syscr', 'syscw']:
+            before, after = old_stage.get(key), new_stage.get(key)
+            if not before or after is None:
+                continue
+            print(f"{stage:<10} {key:<18} {before:>12} {after:>12} {(after / before - 1) * 100:>+7.1f}%")
+    for launch, new_times in (new.get('startup') or {}).items():
+        old_times = (old.get('startup') or {}).get(launch)
+        if isinstance(new_times, dict) and isinstance(old_times, dict):
+            before, after = old_times['median_ms'], new_times['median_ms']
+            print(f"{'startup':<10} {launch:<18} {before:>12} {after:>12} {(after / before - 1) * 100:>+7.1f}%")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the photo organizer engine")
+    parser.add_argument('source', nargs='?', help="corpus made by generate_test_photos.py")
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f"comma separated stages (default: {','.join(STAGES)})")
+    parser.add_argument('--workdir', help="scratch folder for copies (default: a temporary folder)")
+    parser.add_argument('--cold', action='store_true',
+                        help="drop the page cache before each stage (Linux, needs root)")
+    parser.add_argument('-o', '--output', help="write the JSON report to this file (default: stdout)")
+    parser.add_argument('--startup', action='store_true',
+                        help="also measure launch times: import, first file, first window")
+    parser.add_argument('--max-rss-mb', type=float, metavar='MB',
+                        help="exit with status 1 if a stage's peak RSS exceeds MB")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two reports")
+    parser.add_argument('--run-stage', help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    if not args.source:
+        parser.error("the corpus folder is required")
+
+    if args.run_stage:
+        # Child process of measure_stage
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        print(json.dumps(run_stage(args.run_stage, args.source, args.workdir)))
+        return 0
+
+    stages = [stage for stage in args.stages.split(',') if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='photo_organizer_bench_')
+    try:
+        report = benchmark(args.source, stages, workdir, cold=args.cold, startup=args.startup)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.max_rss_mb:
+        over = [stage for stage, result in report['stages'].items()
+                if result.get('peak_rss_mb', 0) > args.max_rss_mb]
+        if over:
+            print(f"peak RSS above {args.max_rss_mb} MB: {', '.join(over)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,17 @@
 #!/usr/bin/env python3
 """
 Build script to create the Windows executable for Photo Organizer
+
+    python build.py            # dist/PhotoTransfer.exe, a single file
+    python build.py --onedir   # dist/PhotoTransfer/, starts faster
+
+A single-file executable unpacks the whole Python runtime into a temporary
+folder at every launch, which slows down every start. The
+folder layout is already unpacked: install it once (e.g. copy the folder to
+Program Files) on machines where the tool is launched many times a day.
 """
 
+import argparse
 import os
 import subprocess
 import sys
@@ -20,8 +29,8 @@ def safe_print(message, fallback=None):
             clean_msg = ''.join(char for char in message if ord(char) < 128)
             print(clean_msg)
 
-def build_executable():
-    """Generate executable with PyInstaller"""
+def build_executable(onedir=False):
+    """Generate executable with PyInstaller (a folder instead of one file with `onedir`)"""
     
     safe_print("🔨 Building Photo Organizer executable...", "Building Photo Organizer executable...")
     
@@ -40,7 +49,7 @@ def build_executable():
     # PyInstaller options
     pyinstaller_args = [
         "pyinstaller",
-        "--onefile",                    # Single executable file
+        "--onedir" if onedir else "--onefile",  # Folder, or single executable file
         "--windowed",                   # No console (GUI only)
         f"--name={app_name}",          # Executable name
         "--clean",                      # Clean cache
@@ -69,12 +78,13 @@ def build_executable():
         result = subprocess.run(pyinstaller_args, check=True, capture_output=True, text=True)
         
         safe_print("✅ Build successful!", "Build successful!")
-        safe_print(f"📦 Executable generated: dist/{app_name}.exe", f"Executable generated: dist/{app_name}.exe")
+        exe_path = Path("dist") / app_name / f"{app_name}.exe" if onedir else Path("dist") / f"{app_name}.exe"
+        safe_print(f"📦 Executable generated: {exe_path.as_posix()}", f"Executable generated: {exe_path.as_posix()}")
         
         # Check if file exists
-        exe_path = Path("dist") / f"{app_name}.exe"
         if exe_path.exists():
-            size_mb = exe_path.stat().st_size / (1024 * 1024)
+            files = [path for path in exe_path.parent.rglob("*") if path.is_file()] if onedir else [exe_path]
+            size_mb = sum(path.stat().st_size for path in files) / (1024 * 1024)
             safe_print(f"📏 Size: {size_mb:.1f} MB", f"Size: {size_mb:.1f} MB")
         
         return True
@@ -107,6 +117,11 @@ def clean_build_files():
 
 def main():
     """Main function"""
+    parser = argparse.ArgumentParser(description="Build the Photo Organizer executable")
+    parser.add_argument("--onedir", action="store_true",
+                        help="build a folder instead of a single file: no unpacking at each launch")
+    args = parser.parse_args()
+
     safe_print("📸 Photo Organizer - Build Script", "Photo Organizer - Build Script")
     print("=" * 50)
     
@@ -121,7 +136,7 @@ def main():
         subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
     
     # Generate executable
-    success = build_executable()
+    success = build_executable(onedir=args.onedir)
     
     if success:
         safe_print("\n🎉 Build completed successfully!", "\nBuild completed successfully!")
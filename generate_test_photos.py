@@ -1,51 +1,140 @@
 #!/usr/bin/env python3
 """
-Script to generate test images with random EXIF dates
+Script to generate a synthetic photo library for tests and benchmarks
+
+    python generate_test_photos.py /tmp/photos_test --count 100000 --workers 8
+
+Writes `--count` files (up to millions) with a process pool, in nested
+folders, with random EXIF dates and a configurable mix of:
+
+- JPEG photos with EXIF dates
+- JPEG photos without EXIF (only the file date is set)
+- RAW-like TIFF containers (.nef, .cr2, .arw, .tif)
+- exact duplicates (same name and content, in another folder)
+- renamed duplicates (same content, another name)
+- name collisions (same name, different content, e.g. IMG_0001.jpg)
+
+Each file is derived from the seed and its index only, so a corpus can be
+regenerated identically. A `corpus.json` summary (counts per kind, bytes,
+expected organize results) is written at the root for the benchmark.
 """
 
+import argparse
+import io
+import json
 import os
 import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from PIL import Image, ImageDraw
-from PIL.ExifTags import TAGS
+
+from PIL import Image
 import piexif
 
-def generate_random_date():
-    """Generate a random date between 2020 and 2024"""
-    start_date = datetime(2020, 1, 1)
-    end_date = datetime(2024, 12, 31)
-    
-    # Generate a random date
-    time_between = end_date - start_date
-    days_between = time_between.days
-    random_days = random.randrange(days_between)
-    random_date = start_date + timedelta(days=random_days)
-    
-    # Add a random time
-    random_hour = random.randint(0, 23)
-    random_minute = random.randint(0, 59)
-    random_second = random.randint(0, 59)
-    
-    return random_date.replace(hour=random_hour, minute=random_minute, second=random_second)
-
-def create_test_image(filename, date, size=(800, 600)):
-    """Create a test image with a specific EXIF date"""
-    
-    # Create a simple colored image
-    colors = ['red', 'blue', 'green', 'yellow', 'purple', 'orange', 'pink', 'cyan']
-    color = random.choice(colors)
-    
-    # Create the image
-    img = Image.new('RGB', size, color=color)
-    draw = ImageDraw.Draw(img)
-    
-    # Add text with the date
-    text = f"Image de test\n{date.strftime('%d/%m/%Y %H:%M')}"
-    draw.text((50, 50), text, fill='white')
-    
-    # Create EXIF data
+CORPUS_FILE = "corpus.json"
+
+KIND_PHOTO = 'photo'
+KIND_NO_EXIF = 'no_exif'
+KIND_RAW = 'raw'
+KIND_COLLISION = 'collision'
+KIND_DUPLICATE = 'duplicate'
+KIND_RENAMED = 'renamed_duplicate'
+
+RAW_EXTENSIONS = ('.nef', '.cr2', '.arw', '.tif')
+# Colliding files share this many names: IMG_0001.jpg ... IMG_0100.jpg
+COLLISION_NAMES = 100
+COLORS = ['red', 'blue', 'green', 'yellow', 'purple', 'orange', 'pink', 'cyan']
+
+START_DATE = datetime(2015, 1, 1)
+END_DATE = datetime(2024, 12, 31)
+
+# Random block repeated to pad files to their size (random bytes are slow)
+PAD_BLOCK = 64 * 1024
+
+# Base JPEG per color, rendered once per worker process
+_base_images = {}
+
+
+def parse_size(text):
+    """'500', '64K', '3M', '1.5G' -> bytes"""
+    text = text.strip().upper()
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def parse_size_distribution(text):
+    """'50K:30,500K:60,4M:10' -> [(50 KB, 30), (500 KB, 60), (4 MB, 10)]"""
+    buckets = []
+    for part in text.split(','):
+        size, _, weight = part.partition(':')
+        buckets.append((parse_size(size), float(weight or 1)))
+    return buckets
+
+
+def generate_random_date(rng):
+    """Generate a random date and time between START_DATE and END_DATE"""
+    seconds = int((END_DATE - START_DATE).total_seconds())
+    return START_DATE + timedelta(seconds=rng.randrange(seconds))
+
+
+def random_folder(rng, options):
+    """Relative folder with a random depth between 0 and max_depth"""
+    depth = rng.randint(0, options.max_depth)
+    return os.path.join('', *(f"Album_{rng.randrange(options.fanout):02d}" for _ in range(depth)))
+
+
+def file_spec(index, options):
+    """
+    Describe file `index`: (kind, relative folder, name, content index).
+
+    The content of a duplicate is the content of an earlier file, so it is
+    always written by the same run.
+    """
+    rng = random.Random(f"{options.seed}:{index}")
+    folder = random_folder(rng, options)
+    roll = rng.random() * 100
+
+    threshold = options.duplicates
+    if roll < threshold and index:
+        original = rng.randrange(index)
+        _, original_folder, name, content = file_spec(original, options)
+        if folder == original_folder:
+            folder = os.path.join(folder, 'Copies')
+        return KIND_DUPLICATE, folder, name, content
+    threshold += options.renamed_duplicates
+    if roll < threshold and index:
+        original = rng.randrange(index)
+        _, _, name, content = file_spec(original, options)
+        stem, ext = os.path.splitext(name)
+        return KIND_RENAMED, folder, f"{stem} - copy{index}{ext}", content
+    threshold += options.no_exif
+    if roll < threshold:
+        return KIND_NO_EXIF, folder, f"Screenshot_{index:07d}.jpg", index
+    threshold += options.raw
+    if roll < threshold:
+        return KIND_RAW, folder, f"DSC_{index:07d}{rng.choice(RAW_EXTENSIONS)}", index
+    threshold += options.collisions
+    if roll < threshold:
+        return KIND_COLLISION, folder, f"IMG_{rng.randrange(COLLISION_NAMES) + 1:04d}.jpg", index
+    return KIND_PHOTO, folder, f"IMG_{index:07d}.jpg", index
+
+
+def base_jpeg(color):
+    """Small JPEG without EXIF, rendered once per process and color"""
+    data = _base_images.get(color)
+    if data is None:
+        buffer = io.BytesIO()
+        Image.new('RGB', (160, 120), color=color).save(buffer, "JPEG", quality=85)
+        data = _base_images[color] = buffer.getvalue()
+    return data
+
+
+def exif_tiff(date):
+    """TIFF structure holding the EXIF dates (without the 'Exif' JPEG header)"""
     date_str = date.strftime("%Y:%m:%d %H:%M:%S")
-    
     exif_dict = {
         "0th": {
             piexif.ImageIFD.Make: "TestCamera",
@@ -57,52 +146,145 @@ def create_test_image(filename, date, size=(800, 600)):
             piexif.ExifIFD.DateTimeOriginal: date_str,
             piexif.ExifIFD.DateTimeDigitized: date_str,
         },
-        "GPS": {},
-        "1st": {},
-        "thumbnail": None
     }
-    
-    # Convert to EXIF bytes
-    exif_bytes = piexif.dump(exif_dict)
-    
-    # Save image with EXIF data
-    img.save(filename, "JPEG", exif=exif_bytes, quality=85)
-    print(f"Created: {os.path.basename(filename)} - {date.strftime('%B %Y')}")
-
-def main():
-    # Destination folder
-    test_folder = "/mnt/d/PhotoTransfer/photos_test"
-    
-    # Create subfolders to simulate a real structure
-    subfolders = [
-        "",  # Root
-        "Vacances",
-        "Famille", 
-        "Vacances/Ete_2023",
-        "Travail"
-    ]
-    
-    for subfolder in subfolders:
-        full_path = os.path.join(test_folder, subfolder)
-        os.makedirs(full_path, exist_ok=True)
-    
-    # Generate 30 images with random dates
-    for i in range(1, 31):
-        # Choose a subfolder randomly
-        subfolder = random.choice(subfolders)
-        
-        # Generate a random date
-        random_date = generate_random_date()
-        
-        # Filename
-        filename = f"IMG_{i:04d}.jpg"
-        full_path = os.path.join(test_folder, subfolder, filename)
-        
-        # Create the image
-        create_test_image(full_path, random_date)
-    
-    print(f"\n30 test images created in {test_folder}")
+    return piexif.dump(exif_dict)[6:]
+
+
+def padding(rng, size):
+    block = rng.randbytes(min(size, PAD_BLOCK))
+    count, rest = divmod(size, len(block)) if block else (0, 0)
+    return block * count + block[:rest]
+
+
+def file_content(kind, content_index, options):
+    """Bytes and capture date of content `content_index`"""
+    rng = random.Random(f"{options.seed}:content:{content_index}")
+    date = generate_random_date(rng)
+    sizes, weights = zip(*options.size_distribution)
+    target = int(rng.choices(sizes, weights)[0] * rng.uniform(0.5, 1.5))
+
+    if kind == KIND_RAW:
+        head = exif_tiff(date)
+    else:
+        image = base_jpeg(rng.choice(COLORS))
+        # Unique comment so that files never share their first bytes
+        comment = rng.randbytes(16)
+        segments = b'\xff\xfe' + (len(comment) + 2).to_bytes(2, 'big') + comment
+        if kind != KIND_NO_EXIF:
+            exif = b'Exif\x00\x00' + exif_tiff(date)
+            segments = b'\xff\xe1' + (len(exif) + 2).to_bytes(2, 'big') + exif + segments
+        head = image[:2] + segments + image[2:]
+    # Camera makers append data after the image, so do we to reach the size
+    return head + padding(rng, max(target - len(head), 0)), date
+
+
+def write_file(path, data, date, index):
+    """Write without replacing anything, return the path actually written"""
+    try:
+        f = open(path, 'xb')
+    except FileExistsError:
+        # Two files drew the same name in the same folder
+        stem, ext = os.path.splitext(path)
+        path = f"{stem}_{index}{ext}"
+        f = open(path, 'xb')
+    with f:
+        f.write(data)
+    timestamp = date.timestamp()
+    os.utime(path, (timestamp, timestamp))
+    return path
+
+
+def generate_chunk(start, stop, options):
+    """Write files start..stop-1, return (bytes written, files per kind)"""
+    kinds = {}
+    written = 0
+    folders = set()
+    for index in range(start, stop):
+        kind, folder, name, content_index = file_spec(index, options)
+        content_kind = kind
+        if kind in (KIND_DUPLICATE, KIND_RENAMED):
+            content_kind = file_spec(content_index, options)[0]
+        data, date = file_content(content_kind, content_index, options)
+
+        folder = os.path.join(options.destination, folder)
+        if folder not in folders:
+            os.makedirs(folder, exist_ok=True)
+            folders.add(folder)
+        write_file(os.path.join(folder, name), data, date, index)
+        written += len(data)
+        kinds[kind] = kinds.get(kind, 0) + 1
+    return written, kinds
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate a synthetic photo library")
+    parser.add_argument('destination', help="folder to create the photos in")
+    parser.add_argument('-n', '--count', type=int, default=1000, help="number of files (default: 1000)")
+    parser.add_argument('--sizes', dest='size_distribution', type=parse_size_distribution,
+                        default=parse_size_distribution('50K:30,500K:60,4M:10'),
+                        help="file sizes and weights, each +/-50%% (default: 50K:30,500K:60,4M:10)")
+    parser.add_argument('--max-depth', type=int, default=3, help="maximum folder depth (default: 3)")
+    parser.add_argument('--fanout', type=int, default=10, help="subfolders per level (default: 10)")
+    parser.add_argument('--duplicates', type=float, default=5.0, metavar='PCT',
+                        help="%% of exact duplicates (default: 5)")
+    parser.add_argument('--renamed-duplicates', type=float, default=5.0, metavar='PCT',
+                        help="%% of renamed duplicates (default: 5)")
+    parser.add_argument('--no-exif', type=float, default=5.0, metavar='PCT',
+                        help="%% of photos without EXIF (default: 5)")
+    parser.add_argument('--raw', type=float, default=5.0, metavar='PCT',
+                        help="%% of RAW-like TIFF files (default: 5)")
+    parser.add_argument('--collisions', type=float, default=5.0, metavar='PCT',
+                        help="%% of files named IMG_0001.jpg to IMG_0100.jpg (default: 5)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: CPU count)")
+    return parser
+
+
+def generate(options):
+    """Generate the corpus described by `options`, return its summary"""
+    os.makedirs(options.destination, exist_ok=True)
+    started = time.perf_counter()
+    chunk = max(1, min(1000, options.count // (options.workers * 8) or 1))
+    starts = range(0, options.count, chunk)
+    total_bytes = 0
+    kinds = {}
+    done = 0
+
+    with ProcessPoolExecutor(max_workers=options.workers) as executor:
+        futures = [executor.submit(generate_chunk, start, min(start + chunk, options.count), options)
+                   for start in starts]
+        for start, future in zip(starts, futures):
+            written, chunk_kinds = future.result()
+            total_bytes += written
+            for kind, count in chunk_kinds.items():
+                kinds[kind] = kinds.get(kind, 0) + count
+            done = min(start + chunk, options.count)
+            print(f"\r{done}/{options.count} files", end='', file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+
+    duplicates = kinds.get(KIND_DUPLICATE, 0) + kinds.get(KIND_RENAMED, 0)
+    summary = {
+        'files': options.count,
+        'bytes': total_bytes,
+        'kinds': kinds,
+        'expected_organized': options.count - duplicates,
+        'expected_duplicates': duplicates,
+        'seconds': round(time.perf_counter() - started, 3),
+        'options': {key: value for key, value in vars(options).items() if key != 'destination'},
+    }
+    with open(os.path.join(options.destination, CORPUS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    summary = generate(options)
+    print(f"{summary['files']} test files ({summary['bytes'] / (1024 * 1024):.1f} MB) "
+          f"created in {options.destination} in {summary['seconds']:.1f}s")
     print("You can now test your photo organizer!")
 
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
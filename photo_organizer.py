@@ -8,122 +8,21 @@ Interface designed for non-technical users
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
-import shutil
-from datetime import datetime
-from pathlib import Path
+import queue
 import threading
 import json
-import hashlib
-from PIL import Image
-from PIL.ExifTags import TAGS
 
-# Translation dictionaries
-TRANSLATIONS = {
-    'en': {
-        # Months
-        'months': {
-            1: "January", 2: "February", 3: "March", 4: "April",
-            5: "May", 6: "June", 7: "July", 8: "August", 
-            9: "September", 10: "October", 11: "November", 12: "December"
-        },
-        # Interface
-        'app_title': "📸 Photo Organizer - Simple and Efficient",
-        'app_subtitle': "Sort your photos automatically by date in just a few clicks",
-        'folders_section': " 📁 Folder Selection ",
-        'source_label': "🔍 Folder containing your photos:",
-        'source_help': "(All photos will be found automatically, even in subfolders)",
-        'dest_label': "💾 Folder to save sorted photos:",
-        'dest_help': "(Photos will be organized by year then by month)",
-        'choose_button': "📂 Choose",
-        'options_section': " ⚙️ Processing Options ",
-        'sort_option': "📅 Sort photos by date",
-        'sort_help_on': "✓ Will create folders by year (e.g.: 2023, 2024) then by month (e.g.: January, February)",
-        'sort_help_off': "○ All photos will be placed directly in the destination folder",
-        'copy_option': "📋 Keep original photos",
-        'copy_help_on': "✓ Original photos remain in their current folder (recommended for safety)",
-        'copy_help_off': "○ Photos will be moved (deleted from their current location)",
-        'organize_button': "🚀 ORGANIZE MY PHOTOS",
-        'organize_processing': "⏳ Processing...",
-        'language_label': "🌍 Language:",
-        # Status
-        'status_ready': "✨ Ready to organize your photos!",
-        'status_source_selected': "📁 Source folder selected",
-        'status_dest_selected': "💾 Destination folder selected",
-        'status_searching': "🔍 Searching for photos...",
-        'status_found': "📊 {} photos found - Processing...",
-        'status_processing': "📸 Processing... {}/{} photos",
-        'status_done_success': "🎉 Done! {} photos organized successfully",
-        'status_done_duplicates': "✅ Done! {} new photos, {} duplicates ignored",
-        'status_done_errors': "✅ Done! {} photos processed, {} duplicates ignored, {} errors",
-        # Messages
-        'error_folders': "Please select source and destination folders",
-        'error_source_missing': "Source folder does not exist",
-        'info_no_photos': "No photos found in source folder",
-        'success_title': "🎉 Success",
-        'success_message': "Organization completed!\n\n{}\n\n📁 Your photos are in: {}",
-        'warning_title': "⚠️ Completed with warnings", 
-        'warning_message': "Organization completed!\n\n{}",
-        'photos_organized': "✅ {} photos organized",
-        'duplicates_ignored': "🔄 {} duplicates ignored",
-        'errors_found': "⚠️ {} errors",
-        # Dialogs
-        'choose_source_title': "Choose folder containing your photos",
-        'choose_dest_title': "Choose destination folder",
-        'unknown_folder': "Unknown"
-    },
-    'fr': {
-        # Months
-        'months': {
-            1: "Janvier", 2: "Février", 3: "Mars", 4: "Avril",
-            5: "Mai", 6: "Juin", 7: "Juillet", 8: "Août",
-            9: "Septembre", 10: "Octobre", 11: "Novembre", 12: "Décembre"
-        },
-        # Interface
-        'app_title': "📸 Organisateur de Photos - Simple et Efficace",
-        'app_subtitle': "Triez automatiquement vos photos par date en quelques clics",
-        'folders_section': " 📁 Sélection des dossiers ",
-        'source_label': "🔍 Dossier contenant vos photos:",
-        'source_help': "(Toutes les photos seront trouvées automatiquement, même dans les sous-dossiers)",
-        'dest_label': "💾 Dossier où sauvegarder les photos triées:",
-        'dest_help': "(Les photos seront organisées par année puis par mois)",
-        'choose_button': "📂 Choisir",
-        'options_section': " ⚙️ Options de traitement ",
-        'sort_option': "📅 Trier les photos par date",
-        'sort_help_on': "✓ Créera des dossiers par année (ex: 2023, 2024) puis par mois (ex: Janvier, Février)",
-        'sort_help_off': "○ Toutes les photos seront placées directement dans le dossier de destination",
-        'copy_option': "📋 Conserver les photos originales",
-        'copy_help_on': "✓ Les photos originales restent dans leur dossier actuel (recommandé pour la sécurité)",
-        'copy_help_off': "○ Les photos seront déplacées (supprimées de leur emplacement actuel)",
-        'organize_button': "🚀 ORGANISER MES PHOTOS",
-        'organize_processing': "⏳ Traitement en cours...",
-        'language_label': "🌍 Langue:",
-        # Status
-        'status_ready': "✨ Prêt à organiser vos photos !",
-        'status_source_selected': "📁 Dossier source sélectionné",
-        'status_dest_selected': "💾 Dossier de destination sélectionné",
-        'status_searching': "🔍 Recherche des photos...",
-        'status_found': "📊 {} photos trouvées - Traitement en cours...",
-        'status_processing': "📸 Traitement... {}/{} photos",
-        'status_done_success': "🎉 Terminé ! {} photos organisées avec succès",
-        'status_done_duplicates': "✅ Terminé ! {} nouvelles photos, {} doublons ignorés",
-        'status_done_errors': "✅ Terminé ! {} photos traitées, {} doublons ignorés, {} erreurs",
-        # Messages
-        'error_folders': "Veuillez sélectionner les dossiers source et destination",
-        'error_source_missing': "Le dossier source n'existe pas",
-        'info_no_photos': "Aucune photo trouvée dans le dossier source",
-        'success_title': "🎉 Succès",
-        'success_message': "Organisation terminée !\n\n{}\n\n📁 Vos photos sont dans: {}",
-        'warning_title': "⚠️ Terminé avec avertissements",
-        'warning_message': "Organisation terminée !\n\n{}",
-        'photos_organized': "✅ {} photos organisées",
-        'duplicates_ignored': "🔄 {} doublons ignorés", 
-        'errors_found': "⚠️ {} erreurs",
-        # Dialogs
-        'choose_source_title': "Choisir le dossier contenant vos photos",
-        'choose_dest_title': "Choisir le dossier de destination",
-        'unknown_folder': "Inconnu"
-    }
-}
+# Only the texts and file names are needed to draw the window: the engine is imported in
+# the background once it is on screen (see preload_engine)
+from photo_organizer_engine.cache import DEFAULT_CACHE_FILE
+from photo_organizer_engine.translations import get_translations
+
+REPORT_FILE = "photo_organizer_report.json"
+# Set by benchmark.py --startup: print a line once the window is shown, then quit
+STARTUP_PROBE_ENV = "PHOTO_ORGANIZER_STARTUP_PROBE"
+
+# Progress display refresh rate, independent of the number of files processed
+UI_REFRESH_HZ = 10
 
 class PhotoOrganizer:
     def __init__(self, root):
@@ -134,6 +33,10 @@ class PhotoOrganizer:
         
         # Configuration file
         self.config_file = "photo_organizer_config.json"
+        # Dates and digests remembered between runs, next to the configuration
+        self.cache_file = os.path.join(os.path.dirname(os.path.abspath(self.config_file)), DEFAULT_CACHE_FILE)
+        # Details of the last run (stage timings, slowest files, errors)
+        self.report_file = os.path.join(os.path.dirname(os.path.abspath(self.config_file)), REPORT_FILE)
         
         self.source_folder = tk.StringVar()
         self.dest_folder = tk.StringVar()
@@ -152,6 +55,9 @@ class PhotoOrganizer:
         self.setup_style()
         self.setup_ui()
         
+        # Events sent by the worker thread, applied by poll_ui_events
+        self.ui_events = queue.Queue()
+        
         # Save config on close
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
     
@@ -206,7 +112,7 @@ class PhotoOrganizer:
     def get_text(self, key):
         """Get translated text according to current language"""
         lang = self.current_language.get()
-        return TRANSLATIONS.get(lang, TRANSLATIONS['en']).get(key, key)
+        return get_translations(lang).get(key, key)
     
     def change_language(self, *args):
         """Change interface language"""
@@ -385,6 +291,11 @@ class PhotoOrganizer:
                                      style='Info.TLabel', anchor='center')
         self.status_label.grid(row=1, column=0, sticky=(tk.W, tk.E))
         
+        # Speed and remaining time while processing
+        self.speed_label = ttk.Label(progress_frame, text="", 
+                                    style='Info.TLabel', anchor='center')
+        self.speed_label.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(5, 0))
+        
     def on_sort_option_changed(self):
         """Update help text for sorting option"""
         if self.sort_by_date.get():
@@ -420,164 +331,95 @@ class PhotoOrganizer:
         self.status_label.config(text=message)
         self.root.update_idletasks()
     
-    def get_photo_date(self, filepath):
-        """Extract photo date from EXIF metadata"""
+    def on_progress(self, stage, result):
+        """Progress callback of the organize engine (called from worker threads)"""
+        # Never touch a widget here: hand the event over to the Tk main loop
+        self.ui_events.put(('progress', stage, result))
+
+    def poll_ui_events(self):
+        """Apply worker events in the Tk main loop, at most UI_REFRESH_HZ times per second"""
+        latest_progress = None
+        finished = None
+        while True:
+            try:
+                event = self.ui_events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == 'progress':
+                # Only the most recent progress matters
+                latest_progress = event
+            else:
+                finished = event
+
+        if latest_progress is not None:
+            self.show_progress(latest_progress[1], latest_progress[2])
+        if finished is not None:
+            self.show_finished(*finished[1:])
+        else:
+            self.root.after(1000 // UI_REFRESH_HZ, self.poll_ui_events)
+
+    def show_progress(self, stage, result):
+        """Update progress bar and status texts (Tk main loop only)"""
+        from photo_organizer_engine.engine import STAGE_SEARCHING, STAGE_FOUND, format_duration
+
+        if stage == STAGE_SEARCHING:
+            if result.scan.entries:
+                self.status_label.config(text=self.get_text('status_scanning').format(result.total_files, result.scan.directories))
+            else:
+                self.status_label.config(text=self.get_text('status_searching'))
+            return
+
+        # The scan runs alongside the copies, so the total keeps growing
+        self.progress['maximum'] = max(result.total_files, 1)
+        self.progress['value'] = result.done
+        if stage == STAGE_FOUND and not result.done:
+            self.status_label.config(text=self.get_text('status_found').format(result.total_files))
+        else:
+            self.status_label.config(text=self.get_text('status_processing').format(result.done, result.total_files))
+
+        eta = result.eta_seconds
+        if eta is None:
+            speed = self.get_text('status_speed').format(result.files_per_second, result.mb_per_second)
+        else:
+            speed = self.get_text('status_speed_eta').format(result.files_per_second, result.mb_per_second, format_duration(eta))
+        self.speed_label.config(text=speed)
+
+    def organize_photos(self, config):
+        """Organize photos by date (worker thread)"""
+        from photo_organizer_engine import OrganizeError, organize
+
         try:
-            with Image.open(filepath) as image:
-                exifdata = image.getexif()
-                
-                # Search for photo date
-                for tag_id in exifdata:
-                    tag = TAGS.get(tag_id, tag_id)
-                    data = exifdata.get(tag_id)
-                    
-                    if tag in ["DateTime", "DateTimeOriginal", "DateTimeDigitized"]:
-                        try:
-                            return datetime.strptime(data, "%Y:%m:%d %H:%M:%S")
-                        except:
-                            continue
+            result = organize(config, progress=self.on_progress)
+        except OrganizeError as e:
+            self.ui_events.put(('finished', config, None, e.key))
         except Exception as e:
-            pass  # Silent EXIF errors for non-technical users
-        
-        # If no EXIF data, use file modification date
-        try:
-            return datetime.fromtimestamp(os.path.getmtime(filepath))
-        except:
-            return datetime.now()
-    
-    def get_year_month_path(self, date):
-        """Generate folder path in 'Year/Month' format"""
-        try:
-            lang = self.current_language.get()
-            months = TRANSLATIONS[lang]['months']
-            month_name = months[date.month]
-            year = date.strftime("%Y")
-            return os.path.join(year, month_name)
-        except:
-            return os.path.join(str(datetime.now().year), self.get_text('unknown_folder'))
-    
-    def files_are_identical(self, file1_path, file2_path):
-        """Check if two files are identical (same size and content)"""
-        try:
-            # Quick size check
-            if os.path.getsize(file1_path) != os.path.getsize(file2_path):
-                return False
-            
-            # If same size, hash verification (more reliable)
-            def get_file_hash(filepath):
-                hash_md5 = hashlib.md5()
-                with open(filepath, "rb") as f:
-                    # Read in chunks for large files
-                    for chunk in iter(lambda: f.read(4096), b""):
-                        hash_md5.update(chunk)
-                return hash_md5.hexdigest()
-            
-            return get_file_hash(file1_path) == get_file_hash(file2_path)
-        except:
-            return False
-    
-    def organize_photos(self):
-        """Organize photos by date"""
-        source = self.source_folder.get()
-        destination = self.dest_folder.get()
-        
-        if not source or not destination:
-            messagebox.showerror("❌ Error", self.get_text('error_folders'))
-            return
-        
-        if not os.path.exists(source):
-            messagebox.showerror("❌ Error", self.get_text('error_source_missing'))
+            print(f"Error organizing photos: {e}")
+            self.ui_events.put(('finished', config, None, 'error_unexpected'))
+        else:
+            self.ui_events.put(('finished', config, result, None))
+
+    def show_finished(self, config, result, error_key):
+        """Final status and notification (Tk main loop only)"""
+        # Re-enable button
+        self.start_button.config(state='normal', text=self.get_text('organize_button'))
+        self.speed_label.config(text='')
+
+        if error_key is not None:
+            self.status_label.config(text=self.get_text('status_ready'))
+            messagebox.showerror("❌ Error", self.get_text(error_key))
             return
-        
-        # Disable button during processing
-        self.start_button.config(state='disabled', text=self.get_text('organize_processing'))
-        
-        # Supported photo file extensions
-        photo_extensions = {'.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp', '.gif', '.raw', '.cr2', '.nef', '.arw', '.heic', '.webp'}
-        
-        # Collect all photo files
-        self.update_status(self.get_text('status_searching'))
-        photo_files = []
-        for root, dirs, files in os.walk(source):
-            for file in files:
-                if Path(file).suffix.lower() in photo_extensions:
-                    photo_files.append(os.path.join(root, file))
-        
-        total_files = len(photo_files)
-        if total_files == 0:
+
+        if result.total_files == 0:
+            self.status_label.config(text=self.get_text('status_ready'))
             messagebox.showinfo("ℹ️ Information", self.get_text('info_no_photos'))
-            self.start_button.config(state='normal', text=self.get_text('organize_button'))
             return
-        
-        # Status update
-        self.update_status(self.get_text('status_found').format(total_files))
-        self.progress['maximum'] = total_files
-        
-        processed = 0
-        errors = 0
-        skipped_duplicates = 0
-        
-        for i, photo_path in enumerate(photo_files):
-            try:
-                filename = os.path.basename(photo_path)
-                
-                # Determine destination folder based on sorting option
-                if self.sort_by_date.get():
-                    # Get photo date and create folder by date
-                    photo_date = self.get_photo_date(photo_path)
-                    year_month_path = self.get_year_month_path(photo_date)
-                    dest_folder_path = os.path.join(destination, year_month_path)
-                    dest_info = f"{filename} → {year_month_path.replace(os.sep, '/')}"
-                else:
-                    # No sorting, directly in destination folder
-                    dest_folder_path = destination
-                    dest_info = f"{filename} → dossier destination"
-                
-                # Create folder if it doesn't exist
-                os.makedirs(dest_folder_path, exist_ok=True)
-                
-                # Destination file name
-                dest_file_path = os.path.join(dest_folder_path, filename)
-                
-                # Check if file already exists
-                if os.path.exists(dest_file_path):
-                    # Check if it's exactly the same file
-                    if self.files_are_identical(photo_path, dest_file_path):
-                        # Identical file already present, ignore it
-                        skipped_duplicates += 1
-                        if (processed + skipped_duplicates) % 10 == 0:
-                            self.update_status(self.get_text('status_processing').format(processed + skipped_duplicates, total_files))
-                        continue
-                    else:
-                        # Different file with same name, add a number
-                        counter = 1
-                        original_dest_path = dest_file_path
-                        while os.path.exists(dest_file_path):
-                            name, ext = os.path.splitext(original_dest_path)
-                            dest_file_path = f"{name}_{counter}{ext}"
-                            counter += 1
-                
-                # Copy or move based on chosen option
-                if self.copy_mode.get():
-                    shutil.copy2(photo_path, dest_file_path)
-                    action = "📋"
-                else:
-                    shutil.move(photo_path, dest_file_path)
-                    action = "📦"
-                
-                # Occasional status update
-                if (processed + skipped_duplicates) % 10 == 0:  # Every 10 photos
-                    self.update_status(self.get_text('status_processing').format(processed + skipped_duplicates, total_files))
-                processed += 1
-                
-            except Exception as e:
-                errors += 1
-                # Silent errors for simplicity
-            
-            # Update progress bar
-            self.progress['value'] = i + 1
-            self.root.update_idletasks()
-        
+
+        processed = result.processed
+        errors = result.errors
+        skipped_duplicates = result.skipped_duplicates
+        destination = config.dest_folder
+        self.progress['value'] = self.progress['maximum']
+
         # Final status
         if errors == 0 and skipped_duplicates == 0:
             self.update_status(self.get_text('status_done_success').format(processed))
@@ -586,9 +428,6 @@ class PhotoOrganizer:
         else:
             self.update_status(self.get_text('status_done_errors').format(processed, skipped_duplicates, errors))
         
-        # Re-enable button
-        self.start_button.config(state='normal', text=self.get_text('organize_button'))
-        
         # Final notification
         message_parts = []
         if processed > 0:
@@ -597,6 +436,7 @@ class PhotoOrganizer:
             message_parts.append(self.get_text('duplicates_ignored').format(skipped_duplicates))
         if errors > 0:
             message_parts.append(self.get_text('errors_found').format(errors))
+            message_parts.append(self.get_text('errors_report').format(self.report_file))
             
         if errors == 0:
             messagebox.showinfo(self.get_text('success_title'), 
@@ -609,11 +449,46 @@ class PhotoOrganizer:
         """Start organization in a separate thread"""
         # Save config before starting
         self.save_config()
-        threading.Thread(target=self.organize_photos, daemon=True).start()
+
+        from photo_organizer_engine import OrganizerConfig
+
+        # Tk variables are read here, in the main loop, never by the worker
+        config = OrganizerConfig(
+            self.source_folder.get(),
+            self.dest_folder.get(),
+            sort_by_date=self.sort_by_date.get(),
+            copy_mode=self.copy_mode.get(),
+            language=self.current_language.get(),
+            cache_path=self.cache_file,
+            report_path=self.report_file,
+        )
+
+        # Disable button during processing
+        self.start_button.config(state='disabled', text=self.get_text('organize_processing'))
+        self.progress['value'] = 0
+
+        threading.Thread(target=self.organize_photos, args=(config,), daemon=True).start()
+        self.root.after(1000 // UI_REFRESH_HZ, self.poll_ui_events)
+
+def preload_engine():
+    """Import the engine while the user picks folders (background thread)"""
+    import photo_organizer_engine.engine
+
+
+def report_first_window(root):
+    """Startup benchmark: tell benchmark.py the window is on screen, then quit"""
+    root.wait_visibility()
+    print("first-window", flush=True)
+    root.destroy()
+
 
 def main():
     root = tk.Tk()
     app = PhotoOrganizer(root)
+    if os.environ.get(STARTUP_PROBE_ENV):
+        root.after_idle(report_first_window, root)
+    else:
+        root.after_idle(lambda: threading.Thread(target=preload_engine, daemon=True).start())
     root.mainloop()
 
 if __name__ == "__main__":
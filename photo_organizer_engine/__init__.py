@@ -0,0 +1,42 @@
+"""
+Photo Organizer engine - sorts photos by date without any user interface
+
+    from photo_organizer_engine import OrganizerConfig, organize
+    result = organize(OrganizerConfig('/photos/inbox', '/photos/sorted'))
+
+The names below are imported on first use: `import photo_organizer_engine.translations`
+does not load the engine, so the interface can show its window first.
+"""
+
+import importlib
+
+# Public name -> module defining it
+_EXPORTS = {
+    'PHOTO_EXTENSIONS': 'engine',
+    'VIDEO_EXTENSIONS': 'engine',
+    'OrganizerConfig': 'engine',
+    'OrganizeResult': 'engine',
+    'OrganizeError': 'engine',
+    'organize': 'engine',
+    'scan_photos': 'engine',
+    'get_photo_date': 'engine',
+    'get_year_month_path': 'engine',
+    'files_are_identical': 'hashing',
+    'TRANSLATIONS': 'translations',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    # Later lookups do not come back here
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,198 @@
+"""
+Persistent metadata cache
+
+Remembers, for every file seen in a previous run, its capture date,
+content digest and perceptual hash, so nightly re-runs over a mostly unchanged library do not
+reopen and rehash every file. Entries are keyed by the file's stat identity
+(device, inode) and are only trusted while its size and modification time
+are unchanged. The database is capped in size: the least recently used
+entries are evicted when the run ends.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+# Default location, next to photo_organizer_config.json
+DEFAULT_CACHE_FILE = "photo_organizer_cache.db"
+
+# Bumped whenever the meaning of a stored column changes
+SCHEMA_VERSION = 4
+
+# Number of pending writes kept in memory before they are committed
+FLUSH_EVERY = 1000
+
+_MISSING = object()
+
+
+def stat_key(st):
+    """(device, inode) identity of a stat result, or None if the OS has no inodes"""
+    if not st.st_ino:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def identity_stat(path, st=None):
+    """
+    Stat result of a file that carries its identity: on Windows the stat of
+    an os.DirEntry has no inode (st_ino 0), so the file is stat'ed again.
+    """
+    if st is None or not st.st_ino:
+        return os.stat(path)
+    return st
+
+
+class MetadataCache:
+    """SQLite-backed cache of per-file dates and digests (thread-safe)"""
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, max_entries=1_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._touched = set()
+        self._stamp = int(time.time())
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        version, = self._db.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS files")
+            self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                date TEXT,
+                digest TEXT,
+                partial_digest TEXT,
+                similarity TEXT,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (dev, ino)
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_last_used ON files (last_used)")
+        self._db.commit()
+
+    def _row(self, key, st):
+        """Cached (size, mtime, date, digest, partial digest, similarity) if the stat identity still matches"""
+        row = self._pending.get(key, _MISSING)
+        if row is _MISSING:
+            row = self._db.execute(
+                "SELECT size, mtime_ns, date, digest, partial_digest, similarity "
+                "FROM files WHERE dev=? AND ino=?", key
+            ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None
+        return row
+
+    def _lookup(self, st, column):
+        key = stat_key(st)
+        if key is None:
+            return False, None
+        with self._lock:
+            row = self._row(key, st)
+            value = row[column] if row is not None else None
+            if value is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            self._touched.add(key)
+            return True, value
+
+    def _store(self, st, column, value):
+        key = stat_key(st)
+        if key is None:
+            return
+        with self._lock:
+            row = self._row(key, st)
+            row = list(row) if row is not None else [st.st_size, st.st_mtime_ns, None, None, None, None]
+            row[column] = value
+            self._pending[key] = tuple(row)
+            if len(self._pending) >= FLUSH_EVERY:
+                self._flush()
+
+    def get_date(self, st):
+        """Date record of a file (what each date source found, see dates.py), or None if unknown or stale"""
+        return self._lookup(st, 2)[1]
+
+    def put_date(self, st, value):
+        self._store(st, 2, value)
+
+    def get_digest(self, st):
+        """Full content digest of a file, or None if unknown or stale"""
+        return self._lookup(st, 3)[1]
+
+    def put_digest(self, st, digest):
+        self._store(st, 3, digest)
+
+    def get_partial_digest(self, st):
+        """Head/tail digest of a file (see hashing.py), or None if unknown or stale"""
+        return self._lookup(st, 4)[1]
+
+    def put_partial_digest(self, st, digest):
+        self._store(st, 4, digest)
+
+    def get_similarity(self, st):
+        """Perceptual hash record of a file (see similar.py), or None if unknown or stale"""
+        return self._lookup(st, 5)[1]
+
+    def put_similarity(self, st, value):
+        self._store(st, 5, value)
+
+    def _flush(self):
+        if self._pending:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO files "
+                "(dev, ino, size, mtime_ns, date, digest, partial_digest, similarity, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [key + row + (self._stamp,) for key, row in self._pending.items()],
+            )
+            self._touched.difference_update(self._pending)
+            self._pending.clear()
+        if self._touched:
+            self._db.executemany(
+                "UPDATE files SET last_used=? WHERE dev=? AND ino=?",
+                [(self._stamp,) + key for key in self._touched],
+            )
+            self._touched.clear()
+        self._db.commit()
+
+    def flush(self):
+        """Write pending entries to disk"""
+        with self._lock:
+            self._flush()
+
+    def evict(self):
+        """Drop the least recently used entries above `max_entries`"""
+        with self._lock:
+            count, = self._db.execute("SELECT COUNT(*) FROM files").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM files WHERE rowid IN "
+                    "(SELECT rowid FROM files ORDER BY last_used LIMIT ?)", (excess,))
+                self._db.commit()
+
+    def close(self):
+        self.flush()
+        self.evict()
+        with self._lock:
+            self._db.close()
+
+
+def open_cache(path, max_entries=1_000_000):
+    """Open the metadata cache, or return None (no caching) if it cannot be used"""
+    if not path:
+        return None
+    try:
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        return MetadataCache(path, max_entries)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error opening metadata cache: {e}")
+        return None
@@ -0,0 +1,98 @@
+"""
+Per-folder checksum files of the copied photos
+
+With checksums enabled, every copy is hashed while it streams through one
+buffer (see transfer.copy_checked), and its digest is appended to a
+`B2SUMS` file in the destination folder, in the format of GNU coreutils:
+
+    3f2a...9c1e  IMG_0001.jpg
+
+Digests are BLAKE2b-160, the digests used for duplicate detection, so a
+folder can be checked without this program:
+
+    cd 2023/August && b2sum -l 160 -c B2SUMS
+
+The same digests are stored in the metadata cache, so later runs compare
+files against the destination without reading it again, and
+`check_checksums` verifies a whole destination against its checksum files.
+On an object store, where nothing can be appended to, the lines of a run
+are written when it ends (see storage.py).
+"""
+
+import os
+import threading
+
+from .hashing import full_digest
+from .storage import LocalStorage
+
+CHECKSUM_FILE = 'B2SUMS'
+
+
+def checksum_line(digest, name):
+    """One line of a checksum file; names with a backslash or newline are escaped like coreutils"""
+    if '\\' in name or '\n' in name or '\r' in name:
+        name = name.replace('\\', '\\\\').replace('\n', '\\n').replace('\r', '\\r')
+        return f"\\{digest}  {name}\n"
+    return f"{digest}  {name}\n"
+
+
+class ChecksumWriter:
+    """Appends digests to the checksum file of each destination folder (thread-safe)"""
+
+    def __init__(self, storage=None):
+        self.storage = storage if storage is not None else LocalStorage()
+        self._lock = threading.Lock()
+        self.lines = 0
+
+    def add(self, path, digest):
+        folder, name = os.path.split(path)
+        line = checksum_line(digest, name)
+        with self._lock:
+            self.storage.append_text(os.path.join(folder, CHECKSUM_FILE), line)
+            self.lines += 1
+
+
+def read_checksums(folder):
+    """Name -> digest of the checksum file of `folder` (empty if there is none)"""
+    digests = {}
+    try:
+        with open(os.path.join(folder, CHECKSUM_FILE), 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                escaped = line.startswith('\\')
+                if escaped:
+                    line = line[1:]
+                digest, separator, name = line.partition('  ')
+                if not separator:
+                    continue
+                if escaped:
+                    name = (name.replace('\\\\', '\0').replace('\\n', '\n')
+                            .replace('\\r', '\r').replace('\0', '\\'))
+                # Later lines win: a name reused after its file was replaced
+                digests[name] = digest
+    except FileNotFoundError:
+        pass
+    return digests
+
+
+def check_checksums(destination):
+    """
+    Compare every file listed in the checksum files below `destination`
+    with its digest. Returns {'checked', 'missing': [paths], 'mismatched': [paths]}.
+    """
+    report = {'checked': 0, 'missing': [], 'mismatched': []}
+    for folder, _, files in os.walk(destination):
+        if CHECKSUM_FILE not in files:
+            continue
+        for name, digest in sorted(read_checksums(folder).items()):
+            path = os.path.join(folder, name)
+            try:
+                actual = full_digest(path)
+            except FileNotFoundError:
+                # Moved away since (near-duplicate review, manual sorting)
+                report['missing'].append(path)
+                continue
+            report['checked'] += 1
+            if actual != digest:
+                report['mismatched'].append(path)
+    return report
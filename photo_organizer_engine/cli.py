@@ -0,0 +1,332 @@
+"""
+Command line interface: `photo-organizer SOURCE DEST [options]`
+
+`--plan FILE` only writes the manifest of what a run would do;
+`photo-organizer --apply FILE` applies it later (see manifest.py).
+`--check DEST` verifies the checksum files written with `--checksums`.
+`--watch` keeps running and organizes new photos as they arrive (see watch.py).
+A destination `s3://bucket/prefix` is written to an S3-compatible object store (see storage.py).
+
+Runs the organize engine without any display, for servers and batch jobs,
+and prints the throughput at the end of the run.
+"""
+
+import argparse
+import sys
+import time
+
+from .engine import (
+    OrganizerConfig, OrganizeError, organize,
+    STAGE_SEARCHING, STAGE_FOUND, STAGE_PROCESSING, STAGE_SIMILAR, STAGE_WATCHING, format_duration,
+    NEAR_DUPLICATES_REPORT, NEAR_DUPLICATES_REVIEW,
+)
+from .checksums import check_checksums
+from .dates import DEFAULT_DATE_SOURCES, SOURCE_PILLOW, parse_date_sources
+from .manifest import execute_manifest
+from .similar import DEFAULT_THRESHOLD, METHODS
+from .storage import DEFAULT_UPLOAD_WORKERS
+from .translations import TRANSLATIONS, get_translations
+from .watch import DEFAULT_SETTLE, watch
+
+
+def parse_shard(text):
+    """'2/4' -> (1, 4)"""
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected I/N, e.g. 1/4")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("I must be between 1 and N")
+    return index - 1, count
+
+
+def parse_date_chain(text):
+    """'filename,exif,mtime' -> ('filename', 'exif', 'mtime')"""
+    try:
+        return parse_date_sources(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='photo-organizer',
+        description="Sort photos into Year/Month folders using their EXIF date",
+    )
+    parser.add_argument('paths', nargs='*', metavar='SOURCE [SOURCE ...] DESTINATION',
+                        help="folders containing the photos (searched recursively), "
+                             "then the folder receiving the sorted photos "
+                             "(or s3://bucket/prefix for an S3-compatible object store)")
+    parser.add_argument('--no-sort', dest='sort_by_date', action='store_false',
+                        help="put every photo directly in the destination folder")
+    parser.add_argument('--move', dest='copy_mode', action='store_false',
+                        help="move photos instead of copying them")
+    parser.add_argument('--hardlink', action='store_true',
+                        help="hard link instead of copying when source and destination "
+                             "share a filesystem (originals and copies share the same data)")
+    parser.add_argument('--checksums', action='store_true',
+                        help="hash every copy while writing it and append the digest to a B2SUMS "
+                             "file in its folder (check with: b2sum -l 160 -c B2SUMS)")
+    parser.add_argument('--verify', action='store_true',
+                        help="read every copy back from the disk and compare it with its source")
+    parser.add_argument('--s3-endpoint', metavar='URL',
+                        help="S3-compatible server of an s3:// destination (MinIO, Ceph, moto...; "
+                             "default: AWS). Credentials come from the AWS environment variables or ~/.aws")
+    parser.add_argument('--upload-workers', type=int, default=DEFAULT_UPLOAD_WORKERS, metavar='N',
+                        help=f"with an s3:// destination, threads uploading the parts of large files "
+                             f"(default: {DEFAULT_UPLOAD_WORKERS})")
+    parser.add_argument('--check', dest='check_path', metavar='DEST',
+                        help="verify the photos of DEST against their B2SUMS files and exit")
+    parser.add_argument('--date-sources', type=parse_date_chain, default=DEFAULT_DATE_SOURCES,
+                        metavar='LIST',
+                        help=f"where capture dates come from, first match wins "
+                             f"(default: {','.join(DEFAULT_DATE_SOURCES)}; also: {SOURCE_PILLOW}). "
+                             f"Files no source can date go to the 'Unknown' folder")
+    parser.add_argument('--exclude', action='append', default=[], metavar='GLOB',
+                        help="skip files and folders matching GLOB (name or path relative "
+                             "to the source, e.g. '*/Thumbnails'); can be repeated")
+    parser.add_argument('--include-hidden', dest='skip_hidden', action='store_false',
+                        help="also scan hidden and system folders")
+    parser.add_argument('--language', choices=sorted(TRANSLATIONS), default='en',
+                        help="language of the month folder names (default: en)")
+    parser.add_argument('--metadata-workers', type=int, default=None, metavar='N',
+                        help="threads reading photo dates (default: CPU count + 4)")
+    parser.add_argument('--copy-workers', type=int, default=None, metavar='N',
+                        help="threads copying/moving files (default: 4)")
+    parser.add_argument('--hdd-workers', type=int, default=1, metavar='N',
+                        help="metadata and copy workers for sources on a spinning disk, and writers "
+                             "of a destination on one (default: 1, sequential reads)")
+    parser.add_argument('--queue-size', type=int, default=256, metavar='N',
+                        help="capacity of the queues between pipeline stages (default: 256)")
+    parser.add_argument('--cache', dest='cache_path', metavar='FILE',
+                        help="SQLite file remembering dates and digests between runs")
+    parser.add_argument('--cache-size', type=int, default=1_000_000, metavar='N',
+                        help="maximum number of files kept in the cache (default: 1000000)")
+    parser.add_argument('--no-resume', dest='resume', action='store_false',
+                        help="do not journal the job nor resume an interrupted one")
+    parser.add_argument('--journal', dest='journal_path', metavar='FILE',
+                        help="journal file (default: DEST/.photo_organizer/journal-<job>.jsonl, "
+                             "./.photo_organizer/ for an s3:// destination)")
+    parser.add_argument('--near-duplicates', choices=[NEAR_DUPLICATES_REPORT, NEAR_DUPLICATES_REVIEW],
+                        help="after sorting, look for visually identical photos in the destination "
+                             "(re-encoded, resized...) and list them, or move them to a review folder")
+    parser.add_argument('--similarity-threshold', type=int, default=DEFAULT_THRESHOLD, metavar='BITS',
+                        help=f"maximum perceptual hash difference, 0-16 (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument('--similarity-method', choices=METHODS, default=METHODS[0],
+                        help="perceptual hash (default: dhash; phash needs NumPy)")
+    parser.add_argument('--plan', dest='plan_path', metavar='MANIFEST',
+                        help="dry run: write every planned copy, rename and duplicate to MANIFEST "
+                             "(JSON lines) without touching any file")
+    parser.add_argument('--apply', dest='apply_path', metavar='MANIFEST',
+                        help="apply a manifest made with --plan; SOURCE and DESTINATION, if given, "
+                             "replace the folders recorded in it")
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N',
+                        help="with --apply, only apply the I-th of N disjoint parts (1/4 ... 4/4)")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and organize new photos as soon as they are written "
+                             "(stop with Ctrl+C)")
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE, metavar='SECONDS',
+                        help=f"with --watch, how long a new file must stay unchanged "
+                             f"(default: {DEFAULT_SETTLE})")
+    parser.add_argument('--poll', dest='poll_interval', type=float, metavar='SECONDS',
+                        help="with --watch, check the folders every SECONDS instead of using "
+                             "inotify (network shares, non-Linux systems)")
+    parser.add_argument('--report', dest='report_path', metavar='FILE',
+                        help="write a JSON run report (stage timings, slowest files, errors)")
+    parser.add_argument('--profile', dest='profile_path', metavar='FILE',
+                        help="cProfile every worker thread into FILE (read it with python -m pstats)")
+    parser.add_argument('--progress-interval', type=int, default=1000, metavar='N',
+                        help="print progress every N files (default: 1000)")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="only print the final summary")
+    return parser
+
+
+def format_summary(result):
+    """One-line summary of a finished run, including throughput"""
+    resumed = f"{result.resumed} already done, " if result.resumed else ""
+    return (f"{result.processed} organized, {result.skipped_duplicates} duplicates ignored, {resumed}"
+            f"{result.errors} errors in {result.elapsed:.2f}s "
+            f"({result.files_per_second:.1f} files/s, {result.mb_per_second:.1f} MB/s)")
+
+
+def format_stages(metrics):
+    """Busy time per stage, slowest first, summed over the worker threads"""
+    stages = sorted(metrics.stages.items(), key=lambda item: item[1].total, reverse=True)
+    return "time per stage: " + ", ".join(
+        f"{stage} {histogram.total:.2f}s (p99 {histogram.percentile(99) * 1000:.1f} ms)"
+        for stage, histogram in stages)
+
+
+def format_errors(metrics):
+    """One line per error category"""
+    return [f"  {category}: {count} (e.g. {examples[0]['path']}: {examples[0]['message']})"
+            for category, (count, examples) in sorted(metrics.errors.items())]
+
+
+def format_near_duplicates(groups):
+    """Kept photo, then its near duplicates with their hash distance"""
+    lines = []
+    for group in groups:
+        lines.append(group['keep'])
+        for photo in group['similar']:
+            where = f" -> {photo['moved_to']}" if 'moved_to' in photo else ""
+            lines.append(f"  ~{photo['distance']} {photo['path']}{where}")
+    return lines
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.check_path:
+        return check_destination(args.check_path)
+    if args.apply_path:
+        if len(args.paths) not in (0, 2):
+            parser.error("--apply takes either no folder or SOURCE and DESTINATION")
+        return apply_manifest(args)
+    if len(args.paths) < 2:
+        parser.error("SOURCE and DESTINATION are required")
+    if args.watch and (args.plan_path or args.near_duplicates):
+        parser.error("--watch cannot be combined with --plan or --near-duplicates")
+    config = OrganizerConfig(
+        args.paths[:-1], args.paths[-1],
+        sort_by_date=args.sort_by_date,
+        date_sources=args.date_sources,
+        copy_mode=args.copy_mode,
+        hardlink=args.hardlink,
+        checksums=args.checksums,
+        verify=args.verify,
+        s3_endpoint=args.s3_endpoint,
+        upload_workers=max(args.upload_workers, 1),
+        exclude=args.exclude,
+        skip_hidden=args.skip_hidden,
+        language=args.language,
+        progress_interval=max(args.progress_interval, 1),
+        metadata_workers=args.metadata_workers,
+        copy_workers=args.copy_workers,
+        hdd_workers=max(args.hdd_workers, 1),
+        queue_size=args.queue_size,
+        cache_path=args.cache_path,
+        cache_max_entries=args.cache_size,
+        resume=args.resume,
+        journal_path=args.journal_path,
+        report_path=args.report_path,
+        profile_path=args.profile_path,
+        plan_path=args.plan_path,
+        near_duplicates=args.near_duplicates,
+        similarity_threshold=args.similarity_threshold,
+        similarity_method=args.similarity_method,
+    )
+
+    def progress(stage, result):
+        if args.quiet:
+            return
+        if stage == STAGE_SEARCHING and result.scan.entries:
+            print(f"scanning: {result.total_files} photos in {result.scan.directories} folders",
+                  file=sys.stderr)
+        elif stage == STAGE_FOUND:
+            print(f"{result.total_files} photos found", file=sys.stderr)
+        elif stage == STAGE_SIMILAR:
+            print("looking for near duplicates...", file=sys.stderr)
+        elif stage == STAGE_PROCESSING:
+            eta = result.eta_seconds
+            remaining = f", {format_duration(eta)} left" if eta is not None else ""
+            print(f"{result.done}/{result.total_files} "
+                  f"({result.files_per_second:.1f} files/s{remaining})", file=sys.stderr)
+
+    if args.watch:
+        return watch_sources(config, args)
+    try:
+        result = organize(config, progress=progress)
+    except OrganizeError as e:
+        print(f"error: {get_translations(args.language).get(e.key, e.key)}", file=sys.stderr)
+        return 2
+
+    if args.plan_path:
+        print(f"planned: {result.processed} to {'copy' if args.copy_mode else 'move'} "
+              f"({result.bytes_transferred / (1024 * 1024):.1f} MB), "
+              f"{result.skipped_duplicates} duplicates, {result.errors} errors "
+              f"in {result.elapsed:.2f}s -> {args.plan_path}")
+    else:
+        print(format_summary(result))
+    if args.near_duplicates and not args.plan_path:
+        similar = sum(len(group['similar']) for group in result.near_duplicates)
+        print(f"{similar} near duplicates in {len(result.near_duplicates)} groups")
+        if not args.quiet:
+            for line in format_near_duplicates(result.near_duplicates):
+                print(line)
+    if not args.quiet:
+        print(format_stages(result.metrics), file=sys.stderr)
+    if result.errors:
+        print("errors:", file=sys.stderr)
+        for line in format_errors(result.metrics):
+            print(line, file=sys.stderr)
+    return 1 if result.errors else 0
+
+
+def check_destination(destination):
+    report = check_checksums(destination)
+    for path in report['mismatched']:
+        print(f"MISMATCH {path}")
+    for path in report['missing']:
+        print(f"missing {path}", file=sys.stderr)
+    print(f"{report['checked']} checked, {len(report['mismatched'])} mismatched, "
+          f"{len(report['missing'])} missing")
+    return 1 if report['mismatched'] else 0
+
+
+def watch_sources(config, args):
+    # Files counted at the last line printed, and whether 'watching' was announced
+    printed = [0, False]
+
+    def progress(stage, result):
+        if stage == STAGE_WATCHING and not args.quiet and not printed[1]:
+            printed[1] = True
+            print(f"watching {', '.join(config.sources)} ({result.watcher})...", file=sys.stderr)
+        elif stage == STAGE_PROCESSING and result.done > printed[0]:
+            printed[0] = result.done
+            print(f"{time.strftime('%H:%M:%S')} {result.processed} organized, "
+                  f"{result.skipped_duplicates} duplicates ignored, {result.errors} errors",
+                  flush=True)
+
+    try:
+        result = watch(config, progress=progress, settle=max(args.settle, 0),
+                       poll_interval=args.poll_interval)
+    except (OrganizeError, OSError) as e:
+        key = getattr(e, 'key', None)
+        print(f"error: {get_translations(args.language).get(key, key) if key else e}", file=sys.stderr)
+        return 2
+    print(format_summary(result))
+    if result.errors:
+        print("errors:", file=sys.stderr)
+        for line in format_errors(result.metrics):
+            print(line, file=sys.stderr)
+    return 1 if result.errors else 0
+
+
+def apply_manifest(args):
+    def progress(stage, result):
+        if not args.quiet and stage == STAGE_PROCESSING:
+            print(f"{result.done}/{result.total_files} "
+                  f"({result.files_per_second:.1f} files/s)", file=sys.stderr)
+
+    try:
+        source, destination = args.paths or (None, None)
+        result = execute_manifest(args.apply_path, source, destination,
+                                  workers=args.copy_workers, shard=args.shard, progress=progress,
+                                  progress_interval=max(args.progress_interval, 1),
+                                  hdd_workers=max(args.hdd_workers, 1),
+                                  checksums=args.checksums, verify=args.verify)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(format_summary(result))
+    if result.errors:
+        print("errors:", file=sys.stderr)
+        for line in format_errors(result.metrics):
+            print(line, file=sys.stderr)
+    return 1 if result.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Locating the EXIF block inside container formats
+
+HEIC files are ISO-BMFF (a tree of size/type boxes), WebP files are RIFF
+(a list of fourcc/size chunks) and PNG files a list of size/type chunks.
+In all cases the EXIF data is a plain TIFF structure stored somewhere in
+the file; these helpers jump from header to header to find its offset
+without reading any image data.
+"""
+
+import struct
+
+# Upper bound for the HEIC 'meta' box, which only holds item tables
+MAX_META_BOX_SIZE = 4 * 1024 * 1024
+MAX_BOXES = 4096
+
+
+def iter_boxes(f, start, end):
+    """
+    Yield (box type, payload offset, payload size) for the ISO-BMFF boxes
+    between `start` and `end` (None = end of file). Only box headers are read.
+    """
+    position = start
+    for _ in range(MAX_BOXES):
+        if end is not None and position + 8 > end:
+            return
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            # 64-bit size follows the type
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size, = struct.unpack('>Q', large)
+            header_size = 16
+        elif size == 0:
+            # Box extends to the end of the enclosing box / file
+            if end is None:
+                f.seek(0, 2)
+                size = f.tell() - position
+            else:
+                size = end - position
+        if size < header_size:
+            return
+        yield box_type, position + header_size, size - header_size
+        position += size
+
+
+def _child_boxes(data, start, end):
+    """Same as iter_boxes, for a box tree already loaded in memory"""
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, position)
+        header_size = 8
+        if size == 1:
+            size, = struct.unpack_from('>Q', data, position + 8)
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size:
+            return
+        yield box_type, position + header_size, min(position + size, end)
+        position += size
+
+
+def _read_uint(data, position, size):
+    if size == 0:
+        return 0, position
+    if size == 2:
+        return struct.unpack_from('>H', data, position)[0], position + 2
+    if size == 4:
+        return struct.unpack_from('>I', data, position)[0], position + 4
+    if size == 8:
+        return struct.unpack_from('>Q', data, position)[0], position + 8
+    raise ValueError("unsupported integer size")
+
+
+def _exif_item_id(data, start, end):
+    """Item ID of the 'Exif' entry of an 'iinf' box"""
+    version = data[start]
+    position = start + 4
+    if version == 0:
+        position += 2
+    else:
+        position += 4
+    for box_type, payload, box_end in _child_boxes(data, position, end):
+        if box_type != b'infe':
+            continue
+        infe_version = data[payload]
+        if infe_version < 2:
+            continue
+        position = payload + 4
+        if infe_version == 2:
+            item_id, = struct.unpack_from('>H', data, position)
+            position += 2
+        else:
+            item_id, = struct.unpack_from('>I', data, position)
+            position += 4
+        # Skip item_protection_index
+        item_type = data[position + 2:position + 6]
+        if item_type == b'Exif':
+            return item_id
+    return None
+
+
+def _item_location(data, start, end, wanted_id):
+    """(file offset, length) of the first extent of an item, from an 'iloc' box"""
+    version = data[start]
+    position = start + 4
+    sizes = data[position]
+    offset_size, length_size = sizes >> 4, sizes & 0x0F
+    sizes = data[position + 1]
+    base_offset_size = sizes >> 4
+    index_size = sizes & 0x0F if version in (1, 2) else 0
+    position += 2
+    if version < 2:
+        item_count, position = _read_uint(data, position, 2)
+    else:
+        item_count, position = _read_uint(data, position, 4)
+
+    for _ in range(item_count):
+        item_id, position = _read_uint(data, position, 2 if version < 2 else 4)
+        construction_method = 0
+        if version in (1, 2):
+            construction_method = struct.unpack_from('>H', data, position)[0] & 0x0F
+            position += 2
+        position += 2  # data_reference_index
+        base_offset, position = _read_uint(data, position, base_offset_size)
+        extent_count, position = _read_uint(data, position, 2)
+        extents = []
+        for _ in range(extent_count):
+            _, position = _read_uint(data, position, index_size)
+            extent_offset, position = _read_uint(data, position, offset_size)
+            extent_length, position = _read_uint(data, position, length_size)
+            extents.append((extent_offset, extent_length))
+        if item_id == wanted_id:
+            # Only items stored at a file offset are supported (not 'idat')
+            if construction_method != 0 or not extents:
+                return None
+            extent_offset, extent_length = extents[0]
+            return base_offset + extent_offset, extent_length
+    return None
+
+
+def find_heic_exif(f):
+    """File offset of the TIFF header of the Exif item of a HEIC file, or None"""
+    for box_type, payload, size in iter_boxes(f, 0, None):
+        if box_type != b'meta':
+            continue
+        if size > MAX_META_BOX_SIZE:
+            return None
+        f.seek(payload)
+        data = f.read(size)
+        # 'meta' is a full box: skip version and flags
+        children = list(_child_boxes(data, 4, len(data)))
+        item_id = location = None
+        for child_type, child_start, child_end in children:
+            if child_type == b'iinf':
+                item_id = _exif_item_id(data, child_start, child_end)
+        if item_id is None:
+            return None
+        for child_type, child_start, child_end in children:
+            if child_type == b'iloc':
+                location = _item_location(data, child_start, child_end, item_id)
+        if location is None:
+            return None
+        item_offset, item_length = location
+        # The Exif item starts with the offset of the TIFF header
+        f.seek(item_offset)
+        prefix = f.read(4)
+        if len(prefix) < 4:
+            return None
+        tiff_offset, = struct.unpack('>I', prefix)
+        if tiff_offset + 4 >= item_length:
+            return None
+        return item_offset + 4 + tiff_offset
+    return None
+
+
+def find_webp_exif(f):
+    """File offset of the TIFF header of the 'EXIF' chunk of a WebP file, or None"""
+    f.seek(0)
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WEBP':
+        return None
+    riff_end = 8 + struct.unpack('<I', header[4:8])[0]
+    position = 12
+    for _ in range(MAX_BOXES):
+        if position + 8 > riff_end:
+            return None
+        f.seek(position)
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        fourcc, size = struct.unpack('<4sI', chunk)
+        if fourcc == b'EXIF':
+            # Some writers keep the JPEG-style 'Exif\0\0' prefix
+            if f.read(6) == b'Exif\x00\x00':
+                return position + 14
+            return position + 8
+        # Chunks are padded to an even size
+        position += 8 + size + (size & 1)
+    return None
+
+
+def find_png_exif(f):
+    """File offset of the TIFF header of the 'eXIf' chunk of a PNG file, or None"""
+    position = 8
+    for _ in range(MAX_BOXES):
+        f.seek(position)
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        size, chunk_type = struct.unpack('>I4s', chunk)
+        if chunk_type == b'eXIf':
+            return position + 8
+        # eXIf belongs before the image data: not worth walking every IDAT chunk
+        if chunk_type in (b'IDAT', b'IEND'):
+            return None
+        # Length, type, data, CRC
+        position += 12 + size
+    return None
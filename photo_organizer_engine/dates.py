@@ -0,0 +1,207 @@
+"""
+Capture date of a file, from an ordered chain of date sources
+
+Each source either knows the date of a file or passes, and the chain stops
+at the first one that knows. Cheap sources come first:
+
+- filename: a timestamp in the name (`IMG_20230714_153012.jpg`,
+  `PXL_20240101_093512345.jpg`, `Screenshot_2023-05-02-14-33-12.png`,
+  `IMG-20230714-WA0001.jpg`...), no I/O at all
+- exif: the EXIF header, read directly (see exif.py)
+- xmp: a sidecar written by photo editors, `IMG_0001.xmp` or `IMG_0001.jpg.xmp`
+- container: the creation date of MP4/MOV clips (see video.py)
+- pillow: EXIF through Pillow, for formats the fast reader does not know
+  (not in the default chain: opening an image costs far more than the rest)
+- mtime: the modification time of the file, always known
+
+The chain is configurable (`OrganizerConfig.date_sources`). A file no
+source can date has no date: it goes to the 'Unknown' folder rather than
+under the current year. The resolver counts which source dated each file.
+"""
+
+import os
+import re
+import threading
+from datetime import datetime
+
+from .cache import identity_stat
+from .exif import parse_iso_datetime, read_exif_date, read_pillow_date
+from .video import VIDEO_EXTENSIONS, read_video_date
+
+SOURCE_FILENAME = 'filename'
+SOURCE_EXIF = 'exif'
+SOURCE_XMP = 'xmp'
+SOURCE_CONTAINER = 'container'
+SOURCE_PILLOW = 'pillow'
+SOURCE_MTIME = 'mtime'
+# Counted for files no source could date
+SOURCE_NONE = 'none'
+
+DATE_SOURCES = (SOURCE_FILENAME, SOURCE_EXIF, SOURCE_XMP, SOURCE_CONTAINER, SOURCE_PILLOW, SOURCE_MTIME)
+DEFAULT_DATE_SOURCES = (SOURCE_FILENAME, SOURCE_EXIF, SOURCE_XMP, SOURCE_CONTAINER, SOURCE_MTIME)
+# Sources reading the file itself: their answers are kept by the metadata cache
+CACHED_SOURCES = frozenset({SOURCE_EXIF, SOURCE_CONTAINER, SOURCE_PILLOW})
+
+# Year, month and day, with the same separator (or none) between them, then
+# optionally a time: '20230714_153012', '2023-05-02-14-33-12', '2023-05-02 at 14.33.12'.
+# No digit right before or after, so counters and IDs are not taken for dates.
+FILENAME_DATE = re.compile(
+    r'(?<!\d)((?:19|20)\d\d)([-_.]?)(0[1-9]|1[0-2])\2(0[1-9]|[12]\d|3[01])'
+    r'(?:(?:[-_ T.]|[ _]at[ _])?([01]\d|2[0-3])[-_.:h]?([0-5]\d)[-_.:m]?([0-5]\d)\d{0,3})?'
+    r'(?!\d)')
+# Older dates in names are more likely counters or part numbers than capture dates
+MIN_FILENAME_YEAR = 1990
+
+_VIDEO_SUFFIXES = tuple(VIDEO_EXTENSIONS)
+
+# XMP properties holding the capture date, in order of preference
+XMP_DATE_PROPERTIES = ('exif:DateTimeOriginal', 'photoshop:DateCreated', 'xmp:CreateDate')
+XMP_DATES = [re.compile(rf'{name}\s*=\s*"([^"]+)"|<{name}>([^<]+)</{name}>') for name in XMP_DATE_PROPERTIES]
+# Sidecars are small; anything bigger is not one
+MAX_XMP_SIZE = 1024 * 1024
+
+
+def date_from_filename(name):
+    """Date of the first plausible timestamp in a file name, or None"""
+    latest = datetime.now().year + 1
+    for match in FILENAME_DATE.finditer(name):
+        year, _, month, day, hour, minute, second = match.groups()
+        if not MIN_FILENAME_YEAR <= int(year) <= latest:
+            continue
+        try:
+            return datetime(int(year), int(month), int(day),
+                            int(hour or 0), int(minute or 0), int(second or 0))
+        except ValueError:
+            # February 30th and the like
+            continue
+    return None
+
+
+def read_xmp_date(filepath):
+    """Capture date from the XMP sidecar of a file, None if it has none"""
+    stem, _ = os.path.splitext(filepath)
+    for sidecar in (stem + '.xmp', filepath + '.xmp'):
+        try:
+            with open(sidecar, 'rb') as f:
+                text = f.read(MAX_XMP_SIZE).decode('utf-8', 'replace')
+        except OSError:
+            continue
+        for pattern in XMP_DATES:
+            match = pattern.search(text)
+            if match is not None:
+                date = parse_iso_datetime(match.group(1) or match.group(2))
+                if date is not None:
+                    return date
+    return None
+
+
+def _filename(path, st):
+    return date_from_filename(os.path.basename(path))
+
+
+def _exif(path, st):
+    return read_exif_date(path)
+
+
+def _xmp(path, st):
+    return read_xmp_date(path)
+
+
+def _container(path, st):
+    if path.lower().endswith(_VIDEO_SUFFIXES):
+        return read_video_date(path)
+    return None
+
+
+def _pillow(path, st):
+    if path.lower().endswith(_VIDEO_SUFFIXES):
+        return None
+    return read_pillow_date(path)
+
+
+def _mtime(path, st):
+    try:
+        return datetime.fromtimestamp((st or os.stat(path)).st_mtime)
+    except (OSError, OverflowError, ValueError):
+        return None
+
+
+READERS = {
+    SOURCE_FILENAME: _filename,
+    SOURCE_EXIF: _exif,
+    SOURCE_XMP: _xmp,
+    SOURCE_CONTAINER: _container,
+    SOURCE_PILLOW: _pillow,
+    SOURCE_MTIME: _mtime,
+}
+
+
+def parse_date_sources(text):
+    """'filename,exif,mtime' -> ('filename', 'exif', 'mtime'); ValueError for unknown names"""
+    sources = tuple(source.strip() for source in text.split(',') if source.strip())
+    unknown = [source for source in sources if source not in READERS]
+    if unknown:
+        raise ValueError(f"unknown date sources: {', '.join(unknown)} (known: {', '.join(DATE_SOURCES)})")
+    return sources
+
+
+def _parse_record(record):
+    """Cache record 'exif=2023-07-14T15:30:12;container=' -> {source: date or None}"""
+    answers = {}
+    for item in (record or '').split(';'):
+        source, separator, value = item.partition('=')
+        if separator:
+            answers[source] = datetime.fromisoformat(value) if value else None
+    return answers
+
+
+def _format_record(answers):
+    return ';'.join(f"{source}={date.isoformat() if date is not None else ''}"
+                    for source, date in answers.items())
+
+
+class DateResolver:
+    """
+    Ordered chain of date sources (thread-safe). `counts` maps each source
+    to the number of files it dated, SOURCE_NONE to the files left undated.
+    """
+
+    def __init__(self, sources=DEFAULT_DATE_SOURCES, cache=None):
+        unknown = [source for source in sources if source not in READERS]
+        if unknown:
+            raise ValueError(f"unknown date sources: {', '.join(unknown)}")
+        self.sources = tuple(sources)
+        self.cache = cache
+        self._readers = [(source, READERS[source]) for source in self.sources]
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def resolve(self, path, st=None):
+        """(date, source) of a file, or (None, None) when no source of the chain knows it"""
+        cache = self.cache if st is not None else None
+        if cache is not None:
+            st = identity_stat(path, st)
+        # What the cached sources said about this file in earlier runs
+        answers = None
+        changed = False
+        date = found = None
+        for source, read in self._readers:
+            if cache is not None and source in CACHED_SOURCES:
+                if answers is None:
+                    answers = _parse_record(cache.get_date(st))
+                if source in answers:
+                    date = answers[source]
+                else:
+                    date = answers[source] = read(path, st)
+                    changed = True
+            else:
+                date = read(path, st)
+            if date is not None:
+                found = source
+                break
+        if changed:
+            cache.put_date(st, _format_record(answers))
+        key = found or SOURCE_NONE
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+        return date, found
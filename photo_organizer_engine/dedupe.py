@@ -0,0 +1,259 @@
+"""
+Content-addressed index of the destination
+
+Duplicates are detected against everything already organized, whatever
+its name or folder: files are grouped by size, and digests are only
+computed when two files share a size, cheapest first (see hashing.py).
+Each digest is computed at most once per file per run, and remembered
+across runs by the metadata cache when enabled.
+The index is built once at the start of a run and updated as files are
+written, so repeat imports become near no-ops.
+
+Indexed files are kept in compact size-sorted columns (see records.py),
+with a 20-byte slot for their partial digest: about 70 bytes per file.
+Files written during the run are first kept as objects, then merged into
+the columns in batches.
+
+Files of the destination are digested by its storage backend (see
+storage.py); files being written are compared through their local source.
+"""
+
+import os
+import sys
+import threading
+
+from .hashing import DIGEST_SIZE, PARTIAL_COVERS_ALL, full_digest, partial_digest
+from .records import FileTable, FolderTable
+from .storage import LocalStorage
+
+# Files written during the run are merged into the columns when they are
+# this many, or a quarter of the columns (so merging costs O(n) overall)
+MERGE_AT_LEAST = 65536
+MERGE_RATIO = 4
+# Full digests of indexed files remembered in memory (the metadata cache keeps them all)
+ROW_DIGESTS = 65536
+# Partial digest slot of a row not hashed yet
+_NO_DIGEST = bytes(DIGEST_SIZE)
+
+
+class IndexEntry:
+    """A file being written to the destination, or written during this run"""
+
+    __slots__ = ('folder', 'name', 'partial', 'digest', 'discarded', 'written')
+
+    def __init__(self, folder, name, partial=None, digest=None):
+        # While a copy is in flight, the path is the source's (same content)
+        self.folder = folder
+        self.name = name
+        self.partial = partial
+        self.digest = digest
+        self.discarded = False
+        self.written = False
+
+
+class DestinationIndex:
+    """Size -> files index with lazily computed digests (thread-safe)"""
+
+    def __init__(self, cache=None, storage=None):
+        self.cache = cache
+        self.storage = storage if storage is not None else LocalStorage()
+        self.files = 0
+        self.folders = FolderTable()
+        # Files indexed before this run, or merged since: compact columns
+        self._table = FileTable(self.folders)
+        # Incremented by every merge (readers of the columns compare it)
+        self._version = 0
+        # Partial digests of the rows, DIGEST_SIZE bytes each (zeros until computed)
+        self._row_partials = bytearray()
+        # Full digests of the rows that had to be compared (row -> digest)
+        self._row_digests = {}
+        # Files reserved during this run: size -> [IndexEntry]
+        self._by_size = {}
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def build(self, files):
+        """Index existing destination files, os.DirEntry-like (only their sizes are read)"""
+        table = self._table
+        count = len(table)
+        for file in files:
+            try:
+                size = file.stat().st_size
+            except OSError:
+                continue
+            table.append(file.path, file.name, size)
+        table.sort()
+        self._row_partials += bytes(DIGEST_SIZE * len(table) - len(self._row_partials))
+        self.files += len(table) - count
+        return self
+
+    def nbytes(self):
+        """Approximate memory used by the index: its columns, and the entries not merged yet"""
+        with self._lock:
+            pending = sys.getsizeof(self._by_size)
+            for bucket in self._by_size.values():
+                pending += sys.getsizeof(bucket)
+                for entry in bucket:
+                    pending += sum(sys.getsizeof(value) if value is not None else 0
+                                   for value in (entry, entry.name, entry.partial, entry.digest))
+        return self._table.nbytes() + len(self._row_partials) + pending
+
+    def _path(self, entry):
+        return self.folders.path(entry.folder, entry.name)
+
+    def _entry_path(self, entry):
+        """Path of an entry, read under the lock: `commit` moves it from the source to the destination"""
+        with self._lock:
+            folder, name = entry.folder, entry.name
+        return self.folders.path(folder, name)
+
+    def _row_partial(self, row, size):
+        offset = row * DIGEST_SIZE
+        stored = self._row_partials[offset:offset + DIGEST_SIZE]
+        if stored != _NO_DIGEST:
+            return stored.hex()
+        try:
+            partial = self.storage.partial_digest(self._table.path(row), size, self.cache)
+        except OSError:
+            return None
+        self._row_partials[offset:offset + DIGEST_SIZE] = bytes.fromhex(partial)
+        return partial
+
+    def _row_digest(self, row):
+        digest = self._row_digests.get(row)
+        if digest is None:
+            if len(self._row_digests) >= ROW_DIGESTS:
+                self._row_digests.clear()
+            try:
+                digest = self._row_digests[row] = self.storage.full_digest(self._table.path(row), self.cache)
+            except OSError:
+                return None
+        return digest
+
+    def _entry_partial(self, entry, size):
+        if entry.discarded:
+            return None
+        if entry.partial is None:
+            try:
+                entry.partial = self.storage.partial_digest(self._entry_path(entry), size, self.cache)
+            except OSError:
+                return None
+        return entry.partial
+
+    def _entry_digest(self, entry):
+        if entry.discarded:
+            return None
+        if entry.digest is None:
+            try:
+                entry.digest = self.storage.full_digest(self._entry_path(entry), self.cache)
+            except OSError:
+                return None
+        return entry.digest
+
+    def reserve(self, path, size):
+        """
+        Register `path` as about to be written to the destination.
+
+        Returns None if a file with identical content is already indexed,
+        otherwise an entry to pass to `commit` (or `discard` on failure).
+        Concurrent callers with identical files cannot both get an entry.
+        """
+        partial = digest = None
+        version = self._version
+        rows = self._table.rows(size)
+        if rows:
+            # Same size as a file already there: compare contents
+            partial = partial_digest(path, size, self.cache)
+            for row in rows:
+                if self._row_partial(row, size) != partial:
+                    continue
+                if size <= PARTIAL_COVERS_ALL:
+                    return None
+                if digest is None:
+                    digest = full_digest(path, self.cache)
+                if self._row_digest(row) == digest:
+                    return None
+
+        checked = 0
+        while True:
+            with self._lock:
+                if self._version != version:
+                    # Merged meanwhile: the files just merged must be compared too
+                    return self.reserve(path, size)
+                bucket = self._by_size.setdefault(size, [])
+                if checked == len(bucket):
+                    entry = IndexEntry(*self.folders.split(path), partial, digest)
+                    bucket.append(entry)
+                    self.files += 1
+                    return entry
+                candidates = bucket[checked:]
+                checked = len(bucket)
+
+            if partial is None:
+                partial = partial_digest(path, size, self.cache)
+            for candidate in candidates:
+                if self._entry_partial(candidate, size) != partial:
+                    continue
+                if size <= PARTIAL_COVERS_ALL:
+                    return None
+                if digest is None:
+                    digest = full_digest(path, self.cache)
+                if self._entry_digest(candidate) == digest:
+                    return None
+
+    def _remember(self, path, digest):
+        """Keep the full digest of a local file in the metadata cache"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            # A moved source
+            return
+        self.cache.put_digest(st, digest)
+        if st.st_size <= PARTIAL_COVERS_ALL:
+            self.cache.put_partial_digest(st, digest)
+
+    def commit(self, entry, dest_path, digest=None):
+        """The file of `entry` has been written to `dest_path`, with its full `digest` if known"""
+        source = self._entry_path(entry)
+        folder, name = self.folders.split(dest_path)
+        if digest is not None:
+            # Computed while copying: later comparisons need not read the file
+            entry.digest = digest
+            if self.cache is not None:
+                # The source too: a rerun over the same sources compares them without reading them
+                self._remember(source, digest)
+                # Objects have no stat identity to remember digests by
+                if not self.storage.remote:
+                    self._remember(dest_path, digest)
+        with self._lock:
+            entry.folder, entry.name = folder, name
+            entry.written = True
+            self._written += 1
+            if self._written >= max(MERGE_AT_LEAST, len(self._table) // MERGE_RATIO):
+                self._merge()
+
+    def _merge(self):
+        """Move the written entries into the columns (called with the lock held)"""
+        table = self._table
+        remaining = {}
+        for size, bucket in self._by_size.items():
+            kept = []
+            for entry in bucket:
+                if entry.written:
+                    table.append(self._path(entry), entry.name, size)
+                    self._row_partials += (bytes.fromhex(entry.partial) if entry.partial is not None
+                                           else _NO_DIGEST)
+                elif not entry.discarded:
+                    kept.append(entry)
+            if kept:
+                remaining[size] = kept
+        table.sort()
+        self._by_size = remaining
+        self._version += 1
+        self._written = 0
+
+    def discard(self, entry):
+        """The file of `entry` could not be written"""
+        with self._lock:
+            entry.discarded = True
+            self.files -= 1
@@ -0,0 +1,79 @@
+"""
+Storage device detection for I/O scheduling
+
+Sources are grouped by the device they live on (`st_dev`), and each group
+gets its own pipeline: reads from independent devices (several SD cards,
+a USB disk and an SSD) overlap, while a spinning disk is read by a single
+worker so its head moves sequentially instead of seeking between files.
+All pipelines write to the same destination, so a destination on a
+spinning disk is shared by at most as many writers (see
+engine.destination_writers). On Linux, spinning disks are recognized through sysfs; elsewhere, and for
+network shares, the device is treated as solid state.
+"""
+
+import os
+import sys
+
+_IS_LINUX = sys.platform.startswith('linux')
+
+
+class DeviceGroup:
+    """Source folders sharing one storage device"""
+
+    def __init__(self, device, rotational, sources):
+        self.device = device
+        self.rotational = rotational
+        self.sources = sources
+
+    def describe(self):
+        return {
+            'device': f"{os.major(self.device)}:{os.minor(self.device)}"
+                      if hasattr(os, 'major') else self.device,
+            'rotational': self.rotational,
+            'sources': self.sources,
+        }
+
+
+def is_rotational(device):
+    """True for a spinning disk, False for SSD/NVMe/flash, None if unknown"""
+    if not _IS_LINUX:
+        return None
+    try:
+        path = os.path.realpath(f"/sys/dev/block/{os.major(device)}:{os.minor(device)}")
+    except (OSError, ValueError):
+        return None
+    # A partition has no queue of its own: use its parent disk's
+    for folder in (path, os.path.dirname(path)):
+        try:
+            with open(os.path.join(folder, 'queue', 'rotational'), 'r') as f:
+                return f.read().strip() == '1'
+        except OSError:
+            continue
+    return None
+
+
+def folder_rotational(folder):
+    """is_rotational of the device of `folder`, or of its closest existing parent"""
+    folder = os.path.abspath(folder)
+    while True:
+        try:
+            return is_rotational(os.stat(folder).st_dev)
+        except FileNotFoundError:
+            parent = os.path.dirname(folder)
+            if parent == folder:
+                return None
+            folder = parent
+        except OSError:
+            return None
+
+
+def group_by_device(folders):
+    """Group folders by storage device, in the order they are given"""
+    groups = {}
+    for folder in folders:
+        device = os.stat(folder).st_dev
+        group = groups.get(device)
+        if group is None:
+            group = groups[device] = DeviceGroup(device, is_rotational(device), [])
+        group.sources.append(folder)
+    return list(groups.values())
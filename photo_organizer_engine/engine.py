@@ -0,0 +1,588 @@
+"""
+Headless organize engine
+
+Everything needed to sort a folder of photos by date, without any
+dependency on Tkinter: scanning, date extraction, duplicate detection
+and copy/move. The GUI and the command line are both thin clients of
+the `organize` function defined here.
+"""
+
+import json
+import os
+import time
+import threading
+from contextlib import nullcontext
+from itertools import chain
+
+from .cache import open_cache
+from .checksums import ChecksumWriter
+from .dates import DEFAULT_DATE_SOURCES, DateResolver
+from .dedupe import DestinationIndex
+from .devices import folder_rotational, group_by_device
+from .folders import DestinationFolders
+from .hashing import thread_bytes_read
+from .journal import Journal, default_journal_path
+from .manifest import METHOD_PLANNED, ManifestWriter
+from .metrics import (
+    RunMetrics, ThreadProfiler, timed_iter,
+    STAGE_SCAN, STAGE_INDEX, STAGE_DATE, STAGE_DEDUPE, STAGE_MKDIR, STAGE_COPY,
+)
+from .similar import DEFAULT_THRESHOLD, METHOD_DHASH, find_near_duplicates
+from .pipeline import Pipeline, default_copy_workers
+from .scanner import ScanStats, iter_files
+from .storage import DEFAULT_UPLOAD_WORKERS, LocalStorage, is_remote, open_storage
+from .transfer import move_file
+from .translations import get_translations
+from .video import VIDEO_EXTENSIONS
+
+# Still images, the only files compared by near-duplicate detection
+IMAGE_EXTENSIONS = frozenset({
+    '.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp', '.gif',
+    '.raw', '.cr2', '.nef', '.arw', '.heic', '.webp',
+})
+
+# Supported file extensions: photos, and video clips dated from their box headers (see video.py)
+PHOTO_EXTENSIONS = IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+
+# Progress stages reported to the progress callback
+STAGE_SEARCHING = 'searching'
+STAGE_FOUND = 'found'
+STAGE_PROCESSING = 'processing'
+STAGE_SIMILAR = 'similar'
+# Watch mode: waiting for new files (see watch.py)
+STAGE_WATCHING = 'watching'
+STAGE_DONE = 'done'
+
+# What to do with near duplicates (see similar.py)
+NEAR_DUPLICATES_REPORT = 'report'
+NEAR_DUPLICATES_REVIEW = 'review'
+
+
+class OrganizerConfig:
+    """Options of an organize run (plain Python values, no Tk variables)"""
+
+    def __init__(self, source_folder, dest_folder, sort_by_date=True,
+                 copy_mode=True, language='en', progress_interval=10,
+                 metadata_workers=None, copy_workers=None, queue_size=256,
+                 cache_path=None, cache_max_entries=1_000_000,
+                 resume=True, journal_path=None, hardlink=False,
+                 exclude=(), skip_hidden=True, report_path=None, profile_path=None, plan_path=None,
+                 near_duplicates=None, similarity_threshold=DEFAULT_THRESHOLD,
+                 similarity_method=METHOD_DHASH, hdd_workers=1, checksums=False, verify=False,
+                 date_sources=DEFAULT_DATE_SOURCES, s3_endpoint=None, upload_workers=DEFAULT_UPLOAD_WORKERS):
+        # One folder, or a list of folders imported together (cards, drives...)
+        self.source_folder = source_folder
+        self.sources = [source_folder] if isinstance(source_folder, str) else list(source_folder)
+        # A folder, or 's3://bucket/prefix' for an S3-compatible object store (see storage.py)
+        self.dest_folder = dest_folder
+        # Object store only: server other than AWS (MinIO...), threads uploading parts of large files
+        self.s3_endpoint = s3_endpoint
+        self.upload_workers = upload_workers
+        self.sort_by_date = sort_by_date
+        self.copy_mode = copy_mode
+        # Where capture dates come from, tried in this order (see dates.py)
+        self.date_sources = tuple(date_sources)
+        self.language = language
+        # Number of files between two 'processing' progress events
+        self.progress_interval = progress_interval
+        # Pipeline sizing (None = automatic, see pipeline.py)
+        self.metadata_workers = metadata_workers
+        self.copy_workers = copy_workers
+        self.queue_size = queue_size
+        # Workers per spinning disk source, in both pools, so it is read sequentially
+        self.hdd_workers = hdd_workers
+        # Persistent date/digest cache (None = disabled, see cache.py)
+        self.cache_path = cache_path
+        self.cache_max_entries = cache_max_entries
+        # Write-ahead journal so an interrupted job can resume (see journal.py)
+        self.resume = resume
+        self.journal_path = journal_path
+        # Hard link instead of copying when on the same filesystem (copy mode only)
+        self.hardlink = hardlink
+        # Copy mode: hash every copy as it is written and append it to the folder's
+        # checksum file (see checksums.py); `verify` also reads each copy back
+        self.checksums = checksums
+        self.verify = verify
+        # Scanner filters: glob patterns, and hidden/system folders
+        self.exclude = list(exclude)
+        self.skip_hidden = skip_hidden
+        # JSON run report (stage timings, slowest files, errors, see metrics.py)
+        self.report_path = report_path
+        # Planning only: write every decision to this manifest, touch nothing (see manifest.py)
+        self.plan_path = plan_path
+        # cProfile statistics of every worker thread (debugging slow runs)
+        self.profile_path = profile_path
+        # Near duplicates in the destination: None, 'report' or 'review' (moved aside)
+        self.near_duplicates = near_duplicates
+        self.similarity_threshold = similarity_threshold
+        self.similarity_method = similarity_method
+
+
+class OrganizeResult:
+    """Counters of an organize run, updated concurrently by the pipeline"""
+
+    def __init__(self):
+        self.total_files = 0
+        self.scan_complete = False
+        self.scan = ScanStats()
+        self.processed = 0
+        self.skipped_duplicates = 0
+        self.errors = 0
+        # Files already handled by an interrupted previous attempt
+        self.resumed = 0
+        self.bytes_transferred = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.lock = threading.Lock()
+        # Stage timings, bytes read/written, slowest files and errors
+        self.metrics = RunMetrics()
+        # Groups of visually identical photos, if requested (see similar.py)
+        self.near_duplicates = []
+        # Watch mode only: 'inotify' or 'polling' (see watch.py)
+        self.watcher = None
+        # Number of files dated by each date source (see dates.py)
+        self.date_sources = {}
+
+    @property
+    def done(self):
+        """Number of files handled so far (organized, skipped, resumed or failed)"""
+        return self.processed + self.skipped_duplicates + self.errors + self.resumed
+
+    @property
+    def elapsed(self):
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return max(end - self.started_at, 1e-9)
+
+    @property
+    def files_per_second(self):
+        return self.done / self.elapsed
+
+    @property
+    def mb_per_second(self):
+        return self.bytes_transferred / (1024 * 1024) / self.elapsed
+
+    @property
+    def eta_seconds(self):
+        """Estimated remaining time, None until the scan is complete"""
+        if not self.scan_complete or not self.done:
+            return None
+        return max(self.total_files - self.done, 0) / self.files_per_second
+
+
+def format_duration(seconds):
+    """Short human readable duration: '12s', '3m 05s', '1h 02m'"""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+class OrganizeError(Exception):
+    """Raised when a run cannot start (missing folders, ...)"""
+
+    def __init__(self, key):
+        # Translation key describing the problem, so clients can localize it
+        super().__init__(key)
+        self.key = key
+
+
+def iter_photos(source, extensions=PHOTO_EXTENSIONS, **options):
+    """Yield an os.DirEntry for every photo below `source` (see scanner.iter_files)"""
+    return iter_files(source, extensions, **options)
+
+
+def scan_photos(source, extensions=PHOTO_EXTENSIONS, **options):
+    """Collect the path of every photo file below `source`"""
+    return [entry.path for entry in iter_photos(source, extensions, **options)]
+
+
+def get_photo_date(filepath, cache=None, st=None, sources=DEFAULT_DATE_SOURCES):
+    """Capture date of a photo from the first of `sources` that knows it (see dates.py), or None"""
+    if st is None:
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            st = None
+    return DateResolver(sources, cache).resolve(filepath, st)[0]
+
+
+def get_year_month_path(date, language='en'):
+    """Generate folder path in 'Year/Month' format ('Unknown' for a photo without date)"""
+    texts = get_translations(language)
+    if date is None:
+        return texts['unknown_folder']
+    month_name = texts['months'][date.month]
+    year = date.strftime("%Y")
+    return os.path.join(year, month_name)
+
+
+def get_destination_folder(photo, config, dates=None):
+    """
+    Folder a photo (os.DirEntry) goes to, based on the sorting option
+    (metadata stage). `dates` is the DateResolver of the run.
+    """
+    if config.sort_by_date:
+        dates = dates if dates is not None else DateResolver(config.date_sources)
+        photo_date, _ = dates.resolve(photo.path, photo.stat())
+        year_month_path = get_year_month_path(photo_date, config.language)
+        return os.path.join(config.dest_folder, year_month_path)
+    return config.dest_folder
+
+
+def transfer_file(photo, dest_folder_path, config, folders, index, journal=None, timings=None,
+                  checksums=None, storage=None):
+    """
+    Copy or move a photo (os.DirEntry) into its destination folder (copy stage).
+
+    Returns the copy method used (see transfer.py and storage.py), or None
+    when a file with the same content is already anywhere in the destination.
+    `timings`, if given, receives the seconds spent in each stage.
+    `checksums`, a ChecksumWriter, receives the digest of every hashed copy.
+    `storage` is the backend of the destination (local folder by default).
+    """
+    storage = storage if storage is not None else LocalStorage()
+    clock = time.perf_counter
+    timings = timings if timings is not None else {}
+    photo_path = photo.path
+    st = photo.stat()
+    started = clock()
+    entry = index.reserve(photo_path, st.st_size)
+    timings[STAGE_DEDUPE] = clock() - started
+    if entry is None:
+        if journal is not None:
+            journal.duplicate(photo_path, st)
+        return None
+
+    try:
+        # Folder created on first use; different file with the same name: add a number
+        started = clock()
+        dest_file_path = folders.claim(dest_folder_path, photo.name)
+        timings[STAGE_MKDIR] = clock() - started
+        try:
+            if journal is not None:
+                journal.plan(photo_path, dest_file_path)
+            started = clock()
+            if not config.copy_mode:
+                method, digest = storage.move(photo_path, dest_file_path)
+            else:
+                method, digest = storage.copy(photo_path, dest_file_path, config.hardlink,
+                                              config.checksums or config.verify, config.verify)
+            timings[STAGE_COPY] = clock() - started
+        except BaseException:
+            folders.release(dest_file_path)
+            raise
+        folders.done(dest_file_path)
+    except BaseException:
+        index.discard(entry)
+        raise
+
+    index.commit(entry, dest_file_path, digest)
+    if digest is not None and checksums is not None:
+        checksums.add(dest_file_path, digest)
+    if journal is not None:
+        journal.done(photo_path, st, dest_file_path)
+    return method
+
+
+def plan_file(photo, dest_folder_path, folders, index, manifest, timings=None):
+    """
+    Planning counterpart of transfer_file: take the same duplicate and naming
+    decisions, write them to the manifest and touch nothing.
+    """
+    clock = time.perf_counter
+    timings = timings if timings is not None else {}
+    st = photo.stat()
+    started = clock()
+    # Not committed: until applied, the planned file is best compared through its source
+    entry = index.reserve(photo.path, st.st_size)
+    timings[STAGE_DEDUPE] = clock() - started
+    if entry is None:
+        manifest.duplicate(photo.path, st)
+        return None
+    started = clock()
+    dest_file_path = folders.claim(dest_folder_path, photo.name)
+    timings[STAGE_MKDIR] = clock() - started
+    folders.done(dest_file_path)
+    manifest.transfer(photo.path, st, dest_file_path)
+    return METHOD_PLANNED
+
+
+def review_near_duplicates(config, cache=None, folders=None):
+    """
+    Find near duplicates in the destination. In review mode, all but the best
+    photo of each group are moved to the review folder, one subfolder per group.
+    """
+    destination = config.dest_folder
+    review = os.path.join(destination, get_translations(config.language)['review_folder'])
+    photos = iter_photos(destination, IMAGE_EXTENSIONS, skip_hidden=config.skip_hidden, skip_dirs=[review])
+    groups = find_near_duplicates(photos, config.similarity_threshold, config.similarity_method,
+                                  cache, config.metadata_workers)
+
+    if config.near_duplicates == NEAR_DUPLICATES_REVIEW:
+        folders = folders if folders is not None else DestinationFolders()
+        for group in groups:
+            # '2023 - August - IMG_0001': unique, and tells where the kept photo is
+            keep = os.path.splitext(os.path.relpath(group['keep'], destination))[0]
+            group_folder = os.path.join(review, keep.replace(os.sep, ' - '))
+            for photo in group['similar']:
+                target = folders.claim(group_folder, os.path.basename(photo['path']))
+                try:
+                    move_file(photo['path'], target)
+                    folders.done(target)
+                    photo['moved_to'] = target
+                except OSError as e:
+                    folders.release(target)
+                    photo['error'] = str(e)
+    return groups
+
+
+def open_destination(config, copy_workers):
+    """
+    Storage backend of the destination (see storage.py), with connections
+    for `copy_workers` threads. Raises OrganizeError if it cannot be used.
+    """
+    try:
+        return open_storage(config.dest_folder, config.s3_endpoint, config.upload_workers,
+                            connections=copy_workers + config.upload_workers)
+    except ImportError:
+        raise OrganizeError('error_s3_missing')
+    except (OSError, ValueError):
+        raise OrganizeError('error_destination_unreachable')
+
+
+def destination_writers(destination, hdd_workers):
+    """
+    Held by every write to `destination`, whatever its source device: a
+    destination on a spinning disk gets at most `hdd_workers` writers in all.
+    """
+    if is_remote(destination) or not folder_rotational(destination):
+        return nullcontext()
+    return threading.BoundedSemaphore(max(1, hdd_workers))
+
+
+def close_destination(storage, result):
+    """Finish the writes of the backend; a failure is an error of the run"""
+    try:
+        storage.close()
+    except OSError as e:
+        result.metrics.error(None, e)
+        with result.lock:
+            result.errors += 1
+
+
+def organize(config, progress=None):
+    """
+    Organize the photos of the source folders into `config.dest_folder`.
+
+    Sources are grouped by storage device, and each device gets its own
+    pipeline: devices are read in parallel, spinning disks by a single
+    worker each (see devices.py). A destination on a spinning disk is
+    written by as many workers, shared by all pipelines.
+
+    `progress`, if given, is called as `progress(stage, result)` where
+    `stage` is one of the STAGE_* constants. Errors on individual files are
+    counted in the returned OrganizeResult instead of being raised, and
+    detailed in `result.metrics` and in the run report if configured.
+    """
+    sources = config.sources
+    destination = config.dest_folder
+
+    if not sources or not all(sources) or not destination:
+        raise OrganizeError('error_folders')
+    if not all(os.path.exists(source) for source in sources):
+        raise OrganizeError('error_source_missing')
+    planning = bool(config.plan_path)
+    if is_remote(destination) and (planning or config.near_duplicates):
+        # Manifests and perceptual hashes are made of local files
+        raise OrganizeError('error_remote_local_only')
+    devices = group_by_device(sources)
+    storage = open_destination(config, (config.copy_workers or default_copy_workers()) * len(devices))
+    writers = nullcontext() if planning else destination_writers(destination, config.hdd_workers)
+
+    result = OrganizeResult()
+    metrics = result.metrics
+    folders = DestinationFolders(create=not planning, storage=storage)
+    cache = open_cache(config.cache_path, config.cache_max_entries)
+    dates = DateResolver(config.date_sources, cache)
+    result.date_sources = dates.counts
+    progress_lock = threading.Lock()
+
+    def notify(stage):
+        if progress is not None:
+            with progress_lock:
+                progress(stage, result)
+
+    def count(field, nbytes=0):
+        with result.lock:
+            setattr(result, field, getattr(result, field) + 1)
+            result.bytes_transferred += nbytes
+            due = result.done % config.progress_interval == 0
+        if due:
+            notify(STAGE_PROCESSING)
+
+    scanning = [len(devices)]
+    scan_stats = [ScanStats() for _ in devices]
+
+    def update_scan_stats():
+        for field in vars(result.scan):
+            setattr(result.scan, field, sum(getattr(stats, field) for stats in scan_stats))
+
+    def on_scanned(photo):
+        if photo is None:
+            with result.lock:
+                scanning[0] -= 1
+                complete = scanning[0] == 0
+                update_scan_stats()
+            if complete:
+                result.scan_complete = True
+                notify(STAGE_FOUND)
+            return
+        with result.lock:
+            result.total_files += 1
+
+    def on_scan_progress(stats):
+        # Live count while the scanner goes through folders without photos
+        with result.lock:
+            update_scan_stats()
+        if not result.done:
+            notify(STAGE_SEARCHING)
+
+    def metadata(photo):
+        # Handled by the interrupted previous attempt of this job: skip instantly
+        if journal is not None and journal.resuming and journal.is_completed(photo.path, photo.stat()):
+            count('resumed')
+            return None
+        started = time.perf_counter()
+        folder = get_destination_folder(photo, config, dates)
+        return photo, folder, time.perf_counter() - started
+
+    def transfer(job):
+        photo, dest_folder_path, date_seconds = job
+        timings = {STAGE_DATE: date_seconds}
+        hashed = thread_bytes_read()
+        if manifest is not None:
+            method = plan_file(photo, dest_folder_path, folders, index, manifest, timings)
+        else:
+            with writers:
+                method = transfer_file(photo, dest_folder_path, config, folders, index, journal, timings,
+                                       checksums, storage)
+        size = photo.stat().st_size
+        metrics.file_done(photo.path, size, timings, method, thread_bytes_read() - hashed)
+        if method is None:
+            count('skipped_duplicates')
+        else:
+            count('processed', size)
+
+    def on_error(photo, exc):
+        metrics.error(photo.path if photo is not None else None, exc)
+        count('errors')
+
+    profiler = ThreadProfiler(config.profile_path) if config.profile_path else None
+    pipelines = []
+    for group in devices:
+        if group.rotational:
+            workers = (config.hdd_workers, config.hdd_workers)
+        else:
+            workers = (config.metadata_workers, config.copy_workers)
+        pipelines.append(Pipeline(*workers, config.queue_size,
+                                  wrap_thread=profiler.wrap if profiler is not None else None))
+
+    def run_device(group, pipeline, stats):
+        # Several folders of one device are scanned one after the other
+        photos = chain.from_iterable(
+            iter_photos(
+                source,
+                exclude=config.exclude,
+                skip_hidden=config.skip_hidden,
+                skip_dirs=[destination],
+                stats=stats,
+                on_progress=on_scan_progress,
+            )
+            for source in group.sources)
+        pipeline.run(
+            timed_iter(photos, metrics, STAGE_SCAN),
+            metadata=metadata,
+            transfer=transfer,
+            on_error=on_error,
+            on_scanned=on_scanned,
+        )
+
+    journal = manifest = None
+    checksums = ChecksumWriter(storage) if config.checksums and not planning else None
+    if planning:
+        manifest = ManifestWriter(config.plan_path, config)
+    elif config.resume:
+        journal = Journal(config.journal_path or default_journal_path(config))
+
+    notify(STAGE_SEARCHING)
+    completed = False
+    try:
+        # Everything already organized, to skip identical files whatever their name
+        started = time.perf_counter()
+        index = DestinationIndex(cache, storage)
+        index.build(storage.iter_files(destination, PHOTO_EXTENSIONS, skip_hidden=config.skip_hidden))
+        metrics.record(STAGE_INDEX, time.perf_counter() - started)
+
+        # Scan, date and copy concurrently, one pipeline per source device;
+        # a destination inside a source is not rescanned
+        if len(devices) == 1:
+            run_device(devices[0], pipelines[0], scan_stats[0])
+        else:
+            threads = [threading.Thread(target=run_device, args=arguments, name=f'device-{i}', daemon=True)
+                       for i, arguments in enumerate(zip(devices, pipelines, scan_stats))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        if config.near_duplicates and not planning:
+            notify(STAGE_SIMILAR)
+            started = time.perf_counter()
+            result.near_duplicates = review_near_duplicates(config, cache, folders)
+            metrics.record(STAGE_SIMILAR, time.perf_counter() - started)
+        completed = True
+    finally:
+        close_destination(storage, result)
+        if cache is not None:
+            cache.close()
+        if journal is not None:
+            journal.close(finished=completed and result.errors == 0)
+        if manifest is not None:
+            manifest.close()
+
+    result.finished_at = time.monotonic()
+    if profiler is not None:
+        profiler.save()
+    if config.report_path:
+        report = metrics.report(result, config, pipelines)
+        report['devices'] = [dict(group.describe(), metadata_workers=pipeline.metadata_workers,
+                                  copy_workers=pipeline.copy_workers)
+                             for group, pipeline in zip(devices, pipelines)]
+        report['cache'] = {'hits': cache.hits, 'misses': cache.misses} if cache is not None else None
+        report['folders'] = {'created': folders.created, 'listed': folders.listed,
+                             'forgotten': folders.evicted}
+        report['index'] = {'files': index.files, 'bytes': index.nbytes()}
+        report['storage'] = storage.describe()
+        report['date_sources'] = {'chain': list(config.date_sources), 'files': dict(result.date_sources)}
+        if checksums is not None:
+            report['checksums'] = checksums.lines
+        if config.near_duplicates:
+            report['near_duplicates'] = result.near_duplicates
+        write_report(config.report_path, report)
+    notify(STAGE_DONE)
+    return result
+
+
+def write_report(path, report):
+    """Write a run report as JSON; a report that cannot be written is not an error of the run"""
+    try:
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    except OSError as e:
+        print(f"Cannot write run report {path}: {e}")
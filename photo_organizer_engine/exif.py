@@ -0,0 +1,320 @@
+"""
+Fast EXIF date reader
+
+Reads only the few hundred bytes needed to find the capture date of a
+photo: the container headers leading to the EXIF block (JPEG APP1
+segment, HEIC Exif item, WebP EXIF chunk, PNG eXIf chunk), then the TIFF IFD chain
+straight to the date tags. TIFF-based RAW files (CR2, NEF, ARW, ORF,
+DNG...) are TIFF structures themselves. No image object is built and no
+pixel data is read, which makes it many times cheaper than
+`Image.open().getexif()` and works on formats Pillow cannot open.
+"""
+
+import struct
+from datetime import datetime, timezone
+
+from .containers import find_heic_exif, find_png_exif, find_webp_exif
+
+# Date tags, in order of preference
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+TAG_DATETIME = 0x0132
+DATE_TAGS = (TAG_DATETIME_ORIGINAL, TAG_DATETIME_DIGITIZED, TAG_DATETIME)
+
+# Pointer from IFD0 to the Exif sub-IFD
+TAG_EXIF_IFD = 0x8769
+
+# Exif sub-IFD: size of the main image
+TAG_PIXEL_X_DIMENSION = 0xA002
+TAG_PIXEL_Y_DIMENSION = 0xA003
+
+# IFD1: JPEG thumbnail embedded by cameras (usually 160x120)
+TAG_THUMBNAIL_OFFSET = 0x0201
+TAG_THUMBNAIL_LENGTH = 0x0202
+
+# TIFF field types
+TYPE_ASCII = 2
+TYPE_SHORT = 3
+TYPE_LONG = 4
+
+# TIFF headers: standard little/big endian, Olympus ORF variants
+TIFF_MAGICS = (b'II*\x00', b'MM\x00*', b'IIRO', b'IIRS', b'MMOR')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Sanity limits against corrupt or hostile files
+MAX_IFD_ENTRIES = 1024
+MAX_JPEG_SEGMENTS = 64
+MAX_THUMBNAIL_SIZE = 512 * 1024
+
+
+def parse_exif_datetime(value):
+    """Parse an EXIF 'YYYY:MM:DD HH:MM:SS' value, None if empty or invalid"""
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'replace')
+    if not isinstance(value, str):
+        return None
+    value = value.strip('\x00 ')
+    if len(value) < 19:
+        return None
+    try:
+        # Slicing is much cheaper than strptime and accepts '-' separators too
+        return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                        int(value[11:13]), int(value[14:16]), int(value[17:19]))
+    except ValueError:
+        return None
+
+
+def parse_iso_datetime(value):
+    """
+    Capture time of an ISO 8601 date (XMP, QuickTime), None if invalid: the
+    wall-clock part when the time zone is an offset ('2023-08-14T10:22:31+02:00'),
+    local time for UTC ('2023-08-14T08:22:31Z'), midnight for a day alone.
+    """
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'replace')
+    if not isinstance(value, str):
+        return None
+    value = value.strip('\x00 ')
+    if len(value) == 10:
+        try:
+            return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+        except ValueError:
+            return None
+    date = parse_exif_datetime(value)
+    if date is not None and value.endswith('Z'):
+        date = date.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    return date
+
+
+class TiffReader:
+    """
+    Reads tags from a TIFF structure inside an open binary file.
+
+    `base` is the file offset of the TIFF header ('II*\\0' or 'MM\\0*'); IFD
+    offsets are relative to it. Every read is a small seek + read, so only
+    the IFD tables and the requested values are ever loaded.
+    """
+
+    def __init__(self, f, base=0):
+        self.f = f
+        self.base = base
+        f.seek(base)
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("truncated TIFF header")
+        if header[:2] == b'II':
+            self.endian = '<'
+        elif header[:2] == b'MM':
+            self.endian = '>'
+        else:
+            raise ValueError("not a TIFF header")
+        magic, self.first_ifd = struct.unpack(self.endian + 'HI', header[2:8])
+        # 42 for TIFF, 0x4F52 / 0x5352 for Olympus ORF variants
+        if magic not in (42, 0x4F52, 0x5352):
+            raise ValueError("bad TIFF magic")
+
+    def read_at(self, offset, size):
+        self.f.seek(self.base + offset)
+        data = self.f.read(size)
+        if len(data) < size:
+            raise ValueError("truncated TIFF data")
+        return data
+
+    def read_ifd(self, offset, wanted):
+        """
+        Return ({tag: (type, count, raw value/offset field)}, next IFD offset)
+        for the tags of `wanted` found in the IFD at `offset`.
+        """
+        count, = struct.unpack(self.endian + 'H', self.read_at(offset, 2))
+        if count > MAX_IFD_ENTRIES:
+            raise ValueError("implausible IFD size")
+        table = self.read_at(offset + 2, count * 12 + 4)
+        entries = {}
+        unpack_entry = struct.Struct(self.endian + 'HHI4s').unpack_from
+        for i in range(count):
+            tag, field_type, value_count, value = unpack_entry(table, i * 12)
+            if tag in wanted:
+                entries[tag] = (field_type, value_count, value)
+        next_ifd, = struct.unpack_from(self.endian + 'I', table, count * 12)
+        return entries, next_ifd
+
+    def long_value(self, entry):
+        field_type, value_count, value = entry
+        if field_type != TYPE_LONG and field_type != 13:  # 13 = IFD
+            return None
+        return struct.unpack(self.endian + 'I', value)[0]
+
+    def int_value(self, entry):
+        field_type, value_count, value = entry
+        if field_type == TYPE_SHORT:
+            return struct.unpack(self.endian + 'H', value[:2])[0]
+        return self.long_value(entry)
+
+    def ascii_value(self, entry):
+        field_type, value_count, value = entry
+        if field_type != TYPE_ASCII or value_count == 0 or value_count > 64:
+            return None
+        if value_count <= 4:
+            return value[:value_count]
+        offset, = struct.unpack(self.endian + 'I', value)
+        return self.read_at(offset, value_count)
+
+    def find_date(self):
+        """Preferred capture date of the main image, or None"""
+        ifd0, _ = self.read_ifd(self.first_ifd, (TAG_DATETIME, TAG_EXIF_IFD))
+        dates = {}
+        if TAG_DATETIME in ifd0:
+            dates[TAG_DATETIME] = ifd0[TAG_DATETIME]
+
+        exif_offset = self.long_value(ifd0[TAG_EXIF_IFD]) if TAG_EXIF_IFD in ifd0 else None
+        if exif_offset:
+            exif_ifd, _ = self.read_ifd(exif_offset, (TAG_DATETIME_ORIGINAL, TAG_DATETIME_DIGITIZED))
+            dates.update(exif_ifd)
+
+        for tag in DATE_TAGS:
+            if tag in dates:
+                date = parse_exif_datetime(self.ascii_value(dates[tag]))
+                if date is not None:
+                    return date
+        return None
+
+    def find_image_size(self):
+        """(width, height) of the main image recorded in the Exif sub-IFD, or None"""
+        ifd0, _ = self.read_ifd(self.first_ifd, (TAG_EXIF_IFD,))
+        exif_offset = self.long_value(ifd0[TAG_EXIF_IFD]) if TAG_EXIF_IFD in ifd0 else None
+        if not exif_offset:
+            return None
+        exif_ifd, _ = self.read_ifd(exif_offset, (TAG_PIXEL_X_DIMENSION, TAG_PIXEL_Y_DIMENSION))
+        if TAG_PIXEL_X_DIMENSION not in exif_ifd or TAG_PIXEL_Y_DIMENSION not in exif_ifd:
+            return None
+        size = self.int_value(exif_ifd[TAG_PIXEL_X_DIMENSION]), self.int_value(exif_ifd[TAG_PIXEL_Y_DIMENSION])
+        return size if all(size) else None
+
+    def find_thumbnail(self):
+        """JPEG bytes of the IFD1 thumbnail, or None"""
+        _, ifd1_offset = self.read_ifd(self.first_ifd, ())
+        if not ifd1_offset:
+            return None
+        ifd1, _ = self.read_ifd(ifd1_offset, (TAG_THUMBNAIL_OFFSET, TAG_THUMBNAIL_LENGTH))
+        if TAG_THUMBNAIL_OFFSET not in ifd1 or TAG_THUMBNAIL_LENGTH not in ifd1:
+            return None
+        offset = self.long_value(ifd1[TAG_THUMBNAIL_OFFSET])
+        length = self.long_value(ifd1[TAG_THUMBNAIL_LENGTH])
+        if not offset or not length or length > MAX_THUMBNAIL_SIZE:
+            return None
+        data = self.read_at(offset, length)
+        return data if data[:2] == b'\xff\xd8' else None
+
+
+def find_jpeg_exif(f):
+    """File offset of the TIFF header inside the JPEG APP1 'Exif' segment, or None"""
+    f.seek(0)
+    if f.read(2) != b'\xff\xd8':
+        return None
+    position = 2
+    for _ in range(MAX_JPEG_SEGMENTS):
+        f.seek(position)
+        header = f.read(4)
+        if len(header) < 4 or header[0] != 0xFF:
+            return None
+        marker = header[1]
+        # Fill bytes before a marker
+        if marker == 0xFF:
+            position += 1
+            continue
+        # Start of scan / end of image: no metadata after this point
+        if marker in (0xDA, 0xD9):
+            return None
+        length, = struct.unpack('>H', header[2:4])
+        if marker == 0xE1 and length >= 8:
+            if f.read(6) == b'Exif\x00\x00':
+                return position + 10
+        position += 2 + length
+    return None
+
+
+def find_tiff_base(f):
+    """File offset of the TIFF header holding the EXIF data, or None"""
+    f.seek(0)
+    magic = f.read(12)
+    if magic[:2] == b'\xff\xd8':
+        return find_jpeg_exif(f)
+    if magic[:4] in TIFF_MAGICS:
+        return 0
+    if magic[:4] == b'RIFF' and magic[8:12] == b'WEBP':
+        return find_webp_exif(f)
+    if magic[4:8] == b'ftyp':
+        return find_heic_exif(f)
+    if magic[:8] == PNG_SIGNATURE:
+        return find_png_exif(f)
+    return None
+
+
+def read_exif_date(filepath):
+    """
+    Capture date from the EXIF header of a JPEG, TIFF/RAW, HEIC, WebP or PNG file.
+
+    Prefers DateTimeOriginal, then DateTimeDigitized, then DateTime.
+    Returns None when the file has no usable date or an unsupported format;
+    never raises for malformed files.
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            base = find_tiff_base(f)
+            if base is None:
+                return None
+            return TiffReader(f, base).find_date()
+    except (OSError, ValueError, IndexError, struct.error):
+        return None
+
+
+def read_exif_thumbnail(filepath):
+    """Embedded EXIF thumbnail (JPEG bytes) of a photo, or None; never raises for malformed files"""
+    try:
+        with open(filepath, 'rb') as f:
+            base = find_tiff_base(f)
+            if base is None:
+                return None
+            return TiffReader(f, base).find_thumbnail()
+    except (OSError, ValueError, IndexError, struct.error):
+        return None
+
+
+def read_exif_preview(filepath):
+    """
+    (thumbnail JPEG bytes, (width, height) of the main image) from the EXIF
+    header of a photo, either None when missing; never raises for malformed files
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            base = find_tiff_base(f)
+            if base is None:
+                return None, None
+            reader = TiffReader(f, base)
+            thumbnail = reader.find_thumbnail()
+            if thumbnail is None:
+                return None, None
+            try:
+                return thumbnail, reader.find_image_size()
+            except (ValueError, IndexError, struct.error):
+                # Damaged Exif IFD: the thumbnail is still usable
+                return thumbnail, None
+    except (OSError, ValueError, IndexError, struct.error):
+        return None, None
+
+
+def read_pillow_date(filepath):
+    """Capture date through Pillow, for formats the fast reader does not handle"""
+    try:
+        from PIL import Image
+        with Image.open(filepath) as image:
+            exif = image.getexif()
+            values = dict(exif.get_ifd(TAG_EXIF_IFD))
+            values[TAG_DATETIME] = exif.get(TAG_DATETIME)
+    except Exception:
+        return None
+    for tag in DATE_TAGS:
+        date = parse_exif_datetime(values.get(tag))
+        if date is not None:
+            return date
+    return None
@@ -0,0 +1,144 @@
+"""
+In-memory index of the destination folders
+
+Each destination folder is created and listed once per run, on first use.
+From then on, picking a free name is a set lookup instead of one `exists`
+syscall per candidate: the next free `_N` suffix is remembered per base
+name, so a folder with thousands of clashing `IMG_0001.jpg` costs no
+extra syscalls. This matters most on network destinations, where every
+stat is a round trip, and on object stores, where a folder is a prefix
+listed in pages of 1000 names (see storage.py).
+
+Only the most recently used folders stay listed: beyond `max_names` names
+in memory, folders without a copy in flight are forgotten (oldest first)
+and listed again if they are used again, so memory stays bounded however
+many folders a run fills.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from .storage import LocalStorage
+
+# Names kept in memory before the least recently used folders are forgotten
+MAX_CACHED_NAMES = 200_000
+
+
+class FolderIndex:
+    """Names present (or being written) in one destination folder"""
+
+    __slots__ = ('lock', 'names', 'next_suffix', 'pending', 'evicted')
+
+    def __init__(self, names):
+        self.lock = threading.Lock()
+        self.names = names
+        # Clashing file name -> first `_N` suffix worth trying
+        self.next_suffix = {}
+        # Names claimed but not written yet: the folder cannot be forgotten
+        self.pending = 0
+        self.evicted = False
+
+
+class DestinationFolders:
+    """Picks free destination names for concurrent copy workers"""
+
+    def __init__(self, create=True, max_names=MAX_CACHED_NAMES, storage=None):
+        # False when planning: missing folders are treated as empty, never created
+        # (and never forgotten: planned names exist nowhere else)
+        self.create = create
+        self.max_names = max_names
+        self.storage = storage if storage is not None else LocalStorage()
+        self._lock = threading.Lock()
+        # Least recently used first
+        self._folders = OrderedDict()
+        self.created = 0
+        self.listed = 0
+        self.evicted = 0
+
+    def _folder(self, folder):
+        # 'dest/' when claiming and 'dest' from the dirname of the claimed path are one folder
+        key = os.path.normcase(os.path.normpath(folder))
+        with self._lock:
+            index = self._folders.get(key)
+            if index is None:
+                if self.create:
+                    self._evict()
+                index = self._folders[key] = FolderIndex(None)
+            else:
+                self._folders.move_to_end(key)
+        # Create and list the folder once, outside the global lock
+        with index.lock:
+            if index.names is None:
+                if not self.storage.isdir(folder):
+                    if not self.create:
+                        index.names = set()
+                        return index
+                    self.storage.makedirs(folder)
+                    self.created += 1
+                index.names = {os.path.normcase(name) for name in self.storage.listdir(folder)}
+                self.listed += 1
+        return index
+
+    def _evict(self):
+        """Forget the least recently used folders if too many names are kept (global lock held)"""
+        total = sum(len(index.names) for index in self._folders.values() if index.names is not None)
+        if total <= self.max_names:
+            return
+        for key, index in list(self._folders.items()):
+            if total <= self.max_names // 2:
+                break
+            # Busy folders are skipped rather than waited for
+            if not index.lock.acquire(blocking=False):
+                continue
+            try:
+                if index.pending or index.names is None:
+                    continue
+                index.evicted = True
+                total -= len(index.names)
+                del self._folders[key]
+                self.evicted += 1
+            finally:
+                index.lock.release()
+
+    def claim(self, folder, filename):
+        """
+        Reserve a free name for `filename` in `folder` (created if needed) and
+        return the full path: `filename`, or `name_1.ext`, `name_2.ext`...
+        Call `done` once the file is written, or `release` if it is not.
+        """
+        while True:
+            index = self._folder(folder)
+            with index.lock:
+                if not index.evicted:
+                    return os.path.join(folder, self._claim(index, filename))
+
+    def _claim(self, index, filename):
+        """Free name for `filename` in a listed folder (its lock held)"""
+        candidate = filename
+        if os.path.normcase(candidate) in index.names:
+            name, ext = os.path.splitext(filename)
+            key = os.path.normcase(filename)
+            counter = index.next_suffix.get(key, 1)
+            candidate = f"{name}_{counter}{ext}"
+            while os.path.normcase(candidate) in index.names:
+                counter += 1
+                candidate = f"{name}_{counter}{ext}"
+            index.next_suffix[key] = counter + 1
+        index.names.add(os.path.normcase(candidate))
+        index.pending += 1
+        return candidate
+
+    def done(self, path):
+        """A claimed name has been written"""
+        index = self._folder(os.path.dirname(path))
+        with index.lock:
+            index.pending -= 1
+
+    def release(self, path):
+        """A claimed name was not written after all"""
+        folder, filename = os.path.split(path)
+        index = self._folder(folder)
+        with index.lock:
+            index.names.discard(os.path.normcase(filename))
+            index.pending -= 1
@@ -0,0 +1,121 @@
+"""
+Tiered content digests for duplicate detection
+
+Comparing two files goes through increasingly expensive steps, and most
+mismatches stop early:
+
+1. size (free, from stat)
+2. partial digest: BLAKE2b of the first and last 64 KB
+3. full digest: BLAKE2b of the whole file, read with `readinto` into a
+   reused multi-MB buffer
+
+Files up to 128 KB are entirely covered by the partial digest, so it is
+also their full digest. Digests are remembered across runs by the metadata
+cache when one is given.
+"""
+
+import hashlib
+import os
+import threading
+
+PARTIAL_BLOCK = 64 * 1024
+# Files this small are fully read by the partial digest
+PARTIAL_COVERS_ALL = 2 * PARTIAL_BLOCK
+FULL_BUFFER_SIZE = 4 * 1024 * 1024
+DIGEST_SIZE = 20
+
+# One read buffer per worker thread, reused for every file
+_buffers = threading.local()
+
+
+def thread_buffer():
+    """The FULL_BUFFER_SIZE read buffer of the calling thread"""
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _buffers.buffer = bytearray(FULL_BUFFER_SIZE)
+    return buffer
+
+
+def _count_read(n):
+    _buffers.bytes_read = getattr(_buffers, 'bytes_read', 0) + n
+
+
+def thread_bytes_read():
+    """Bytes hashed so far by the calling thread (to attribute reads to a file)"""
+    return getattr(_buffers, 'bytes_read', 0)
+
+
+def _stat_for_cache(path, cache):
+    return os.stat(path) if cache is not None else None
+
+
+def partial_digest(path, size=None, cache=None):
+    """BLAKE2b of the first and last PARTIAL_BLOCK bytes (whole file if small)"""
+    st = _stat_for_cache(path, cache)
+    if st is not None:
+        digest = cache.get_partial_digest(st)
+        if digest is not None:
+            return digest
+
+    if size is None:
+        size = st.st_size if st is not None else os.path.getsize(path)
+    hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(path, 'rb') as f:
+        if size <= PARTIAL_COVERS_ALL:
+            data = f.read()
+            hasher.update(data)
+            _count_read(len(data))
+        else:
+            hasher.update(f.read(PARTIAL_BLOCK))
+            f.seek(-PARTIAL_BLOCK, os.SEEK_END)
+            hasher.update(f.read(PARTIAL_BLOCK))
+            _count_read(2 * PARTIAL_BLOCK)
+    digest = hasher.hexdigest()
+
+    if st is not None:
+        cache.put_partial_digest(st, digest)
+    return digest
+
+
+def full_digest(path, cache=None):
+    """BLAKE2b of the whole file"""
+    st = _stat_for_cache(path, cache)
+    if st is not None:
+        digest = cache.get_digest(st)
+        if digest is not None:
+            return digest
+
+    hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    buffer = thread_buffer()
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+            _count_read(n)
+    digest = hasher.hexdigest()
+
+    if st is not None:
+        cache.put_digest(st, digest)
+    return digest
+
+
+def files_are_identical(file1_path, file2_path, cache=None):
+    """Check if two files are identical (same size and content)"""
+    try:
+        # Quick size check
+        size = os.path.getsize(file1_path)
+        if size != os.path.getsize(file2_path):
+            return False
+
+        # Cheap head/tail comparison rejects most different files
+        if partial_digest(file1_path, size, cache) != partial_digest(file2_path, size, cache):
+            return False
+        if size <= PARTIAL_COVERS_ALL:
+            return True
+
+        return full_digest(file1_path, cache) == full_digest(file2_path, cache)
+    except OSError:
+        return False
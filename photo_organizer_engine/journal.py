@@ -0,0 +1,153 @@
+"""
+Write-ahead journal for resumable runs
+
+Every organize job (same source, destination and options) appends what it
+plans and what it completes to a journal file. Each record is handed to
+the OS immediately, so it survives a crash of the application, and fsync'ed
+in batches against power loss, so journaling costs almost nothing per
+file. When a
+job is interrupted (crash, closed window, power loss), the next run of the
+same job reads the journal, skips the files already handled without even
+opening them, and cleans up the temporary file of any copy that was in
+flight. The journal is deleted once the job completes without errors.
+
+Files are always written under a temporary name and renamed into place,
+so a final destination name never holds a partial file even when the last
+records of the journal were lost.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+JOURNAL_FOLDER = ".photo_organizer"
+
+# Suffix of files being written; renamed to their final name when complete
+PARTIAL_SUFFIX = ".partial"
+
+# Group commit: fsync after this many records or this many seconds
+SYNC_EVERY_RECORDS = 256
+SYNC_EVERY_SECONDS = 2.0
+
+OP_PLAN = 'plan'
+OP_DONE = 'done'
+OP_DUPLICATE = 'dup'
+
+
+def job_id(config):
+    """Stable identifier of a job: same folders and options give the same id"""
+    # Imported here: storage.py imports transfer.py, which imports this module
+    from .storage import is_remote
+
+    destination = config.dest_folder
+    key = json.dumps([
+        *(os.path.abspath(source) for source in config.sources),
+        destination if is_remote(destination) else os.path.abspath(destination),
+        config.sort_by_date,
+        list(config.date_sources),
+        config.copy_mode,
+        config.language,
+    ])
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def default_journal_path(config):
+    """In the destination, or in the current folder for an object store (nothing can be appended there)"""
+    from .storage import is_remote
+
+    folder = '' if is_remote(config.dest_folder) else config.dest_folder
+    return os.path.join(folder, JOURNAL_FOLDER, f"journal-{job_id(config)}.jsonl")
+
+
+class Journal:
+    """Append-only job journal with batched fsync (thread-safe)"""
+
+    def __init__(self, path):
+        self.path = path
+        # Source path -> (size, mtime_ns) of files handled by a previous attempt
+        self.completed = {}
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._recover()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Line buffered: one write() per record, fsync only in batches
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+
+    def _recover(self):
+        """Load a previous attempt and remove the leftovers of interrupted copies"""
+        planned = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn last line of a crashed run
+                        continue
+                    op = record.get('op')
+                    src = record.get('src')
+                    if op == OP_PLAN:
+                        planned[src] = record.get('dst')
+                    elif op in (OP_DONE, OP_DUPLICATE):
+                        planned.pop(src, None)
+                        self.completed[src] = (record.get('size'), record.get('mtime_ns'))
+        except FileNotFoundError:
+            return
+
+        for dst in planned.values():
+            if dst:
+                try:
+                    os.remove(dst + PARTIAL_SUFFIX)
+                except OSError:
+                    pass
+
+    @property
+    def resuming(self):
+        return bool(self.completed)
+
+    def is_completed(self, src, st):
+        """True if a previous attempt already handled this unchanged source file"""
+        return self.completed.get(src) == (st.st_size, st.st_mtime_ns)
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._unsynced += 1
+            now = time.monotonic()
+            if (self._unsynced >= SYNC_EVERY_RECORDS
+                    or now - self._last_sync >= SYNC_EVERY_SECONDS):
+                self._sync(now)
+
+    def _sync(self, now):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = now
+
+    def plan(self, src, dst):
+        self._write({'op': OP_PLAN, 'src': src, 'dst': dst})
+
+    def done(self, src, st, dst):
+        self._write({'op': OP_DONE, 'src': src, 'size': st.st_size,
+                     'mtime_ns': st.st_mtime_ns, 'dst': dst})
+
+    def duplicate(self, src, st):
+        self._write({'op': OP_DUPLICATE, 'src': src, 'size': st.st_size,
+                     'mtime_ns': st.st_mtime_ns})
+
+    def close(self, finished=False):
+        """Sync and close; a finished job's journal is deleted"""
+        with self._lock:
+            self._sync(time.monotonic())
+            self._file.close()
+        if finished:
+            try:
+                os.remove(self.path)
+                # Remove the journal folder too when no other job uses it
+                os.rmdir(os.path.dirname(os.path.abspath(self.path)))
+            except OSError:
+                pass
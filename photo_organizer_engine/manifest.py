@@ -0,0 +1,305 @@
+"""
+Operation manifests: plan a run without touching anything, apply it later
+
+Planning (`organize` with `OrganizerConfig.plan_path`) goes through the
+same scan, date and duplicate decisions as a real run, including the
+renames of clashing names, but only writes one JSON line per decision:
+
+    {"version": 1, "sources": ["/photos/inbox"], "destination": "/photos/sorted", "mode": "copy", ...}
+    {"op": "transfer", "src": "DCIM/IMG_0001.jpg", "dst": "2023/August/IMG_0001.jpg", "size": ..., ...}
+    {"op": "dup", "src": "DCIM/IMG_0001 (1).jpg", "size": ...}
+
+Paths are relative to the roots of the header (`root` is the index of the
+source when there are several), so a manifest can be reviewed, diffed,
+edited, split into shards and applied on another machine where the same
+folders are mounted elsewhere. `execute_manifest` applies the transfers
+with workers per source device (see devices.py), in source inode order so
+that reads follow the on-disk layout. Files that changed since planning
+are refused, and destinations that already exist are never overwritten:
+applying a manifest twice only completes what is missing. An existing
+destination counts as applied when its size is the source's (and, with
+checksums, its content too); records naming no source of the header are
+errors. Copies planned or applied with checksums are hashed while
+written, and read back with `verify`, exactly like in a run (see
+checksums.py).
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from .checksums import ChecksumWriter
+from .devices import group_by_device
+from .hashing import files_are_identical
+from .pipeline import default_copy_workers
+from .transfer import copy_atomic, copy_checked, move_file
+
+MANIFEST_VERSION = 1
+
+OP_TRANSFER = 'transfer'
+OP_DUPLICATE = 'dup'
+
+MODE_COPY = 'copy'
+MODE_MOVE = 'move'
+MODE_HARDLINK = 'hardlink'
+
+# Planning writes this instead of a copy method (see transfer.py)
+METHOD_PLANNED = 'planned'
+
+
+class StaleEntryError(Exception):
+    """The source file changed (or vanished) since the manifest was planned"""
+
+
+def manifest_mode(config):
+    if not config.copy_mode:
+        return MODE_MOVE
+    return MODE_HARDLINK if config.hardlink else MODE_COPY
+
+
+class ManifestWriter:
+    """Thread-safe writer of a manifest, used by organize in planning mode"""
+
+    def __init__(self, path, config):
+        self.path = path
+        self.sources = [os.path.abspath(source) for source in config.sources]
+        self.destination = os.path.abspath(config.dest_folder)
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(path, 'w', encoding='utf-8')
+        self._write({
+            'version': MANIFEST_VERSION,
+            'sources': self.sources,
+            'destination': self.destination,
+            'mode': manifest_mode(config),
+            'sort_by_date': config.sort_by_date,
+            'language': config.language,
+            'checksums': config.checksums,
+            'verify': config.verify,
+            'created': datetime.now().isoformat(timespec='seconds'),
+        })
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def _source(self, record, src):
+        """Set the path of `src` relative to its source folder in `record`"""
+        root = 0
+        if len(self.sources) > 1:
+            # Longest match: a source may be nested in another
+            root = max((i for i, source in enumerate(self.sources)
+                        if src.startswith(source.rstrip(os.sep) + os.sep)),
+                       key=lambda i: len(self.sources[i]), default=0)
+            record['root'] = root
+        record['src'] = os.path.relpath(src, self.sources[root])
+        return record
+
+    def transfer(self, src, st, dst):
+        record = self._source({'op': OP_TRANSFER}, src)
+        record.update({
+            'dst': os.path.relpath(dst, self.destination),
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'ino': st.st_ino,
+        })
+        self._write(record)
+
+    def duplicate(self, src, st):
+        record = self._source({'op': OP_DUPLICATE}, src)
+        record['size'] = st.st_size
+        self._write(record)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_manifest(path):
+    """(header, transfer records, number of duplicates) of a manifest file"""
+    transfers = []
+    duplicates = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline() or '{}')
+        if header.get('version') != MANIFEST_VERSION:
+            raise ValueError(f"{path}: not a version {MANIFEST_VERSION} manifest")
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('op') == OP_TRANSFER:
+                transfers.append(record)
+            elif record.get('op') == OP_DUPLICATE:
+                duplicates += 1
+    return header, transfers, duplicates
+
+
+def in_shard(record, shard):
+    """`shard` is (index, count): each transfer belongs to exactly one shard"""
+    index, count = shard
+    return zlib.crc32(str(record.get('src')).encode('utf-8')) % count == index
+
+
+def _root(record, sources):
+    """Index of the source folder of a record, None if the manifest has no such source"""
+    root = record.get('root', 0)
+    if type(root) is int and 0 <= root < len(sources):
+        return root
+    return None
+
+
+def execute_manifest(path, source=None, destination=None, workers=None, shard=None,
+                     progress=None, progress_interval=10, hdd_workers=1, checksums=False, verify=False):
+    """
+    Apply the transfers of a manifest, return an OrganizeResult.
+
+    `source` and `destination` override the roots recorded in the manifest
+    (same folders mounted elsewhere; `source` only for single-source
+    manifests). `shard=(i, n)` applies only the i-th of n disjoint parts,
+    e.g. one per machine. Each source device gets `workers` threads, or
+    `hdd_workers` if it is a spinning disk; a destination on a spinning disk
+    is written by `hdd_workers` of them at a time. `checksums` and `verify`, or the
+    same options of the planned run, hash every copy into the B2SUMS file
+    of its folder and read it back (copy mode only, see transfer.copy_checked).
+    """
+    # Imported here: the engine itself imports this module
+    from .engine import OrganizeResult, destination_writers, STAGE_FOUND, STAGE_PROCESSING, STAGE_DONE
+    from .metrics import STAGE_COPY
+
+    header, transfers, duplicates = read_manifest(path)
+    sources = header['sources']
+    if source is not None:
+        if len(sources) != 1:
+            raise ValueError(f"{path} has {len(sources)} sources, they cannot be replaced by one")
+        sources = [source]
+    sources = [os.path.abspath(folder) for folder in sources]
+    destination = os.path.abspath(destination or header['destination'])
+    mode = header.get('mode', MODE_COPY)
+    verify = verify or header.get('verify', False)
+    checksums = checksums or header.get('checksums', False)
+    checksum_writer = ChecksumWriter() if checksums else None
+    if shard is not None:
+        transfers = [record for record in transfers if in_shard(record, shard)]
+
+    # One queue per source device, read in inode order: close to the on-disk
+    # order on most filesystems
+    devices = group_by_device([folder for folder in sources if os.path.isdir(folder)])
+    device_of = {folder: i for i, group in enumerate(devices) for folder in group.sources}
+    queues = [[] for _ in devices]
+    unreachable = []
+    for record in transfers:
+        root = _root(record, sources)
+        device = device_of.get(sources[root]) if root is not None else None
+        (queues[device] if device is not None else unreachable).append(record)
+    for records in queues:
+        records.sort(key=lambda record: (record.get('ino') or 0, str(record.get('src'))))
+
+    result = OrganizeResult()
+    metrics = result.metrics
+    result.total_files = len(transfers)
+    result.skipped_duplicates = duplicates if shard is None else 0
+    result.scan_complete = True
+    progress_lock = threading.Lock()
+    created = set()
+    created_lock = threading.Lock()
+    writers = destination_writers(destination, hdd_workers)
+
+    def notify(stage):
+        if progress is not None:
+            with progress_lock:
+                progress(stage, result)
+
+    def count(field, nbytes=0):
+        with result.lock:
+            setattr(result, field, getattr(result, field) + 1)
+            result.bytes_transferred += nbytes
+            due = result.done % progress_interval == 0
+        if due:
+            notify(STAGE_PROCESSING)
+
+    def apply(record):
+        src = record.get('src')
+        try:
+            # Hand-edited manifests and shards are checked record by record
+            root = _root(record, sources)
+            if root is None:
+                raise ValueError(f"{src}: the manifest has no source {record.get('root')!r}")
+            src = os.path.join(sources[root], record['src'])
+            dst = os.path.join(destination, record['dst'])
+            try:
+                st = os.stat(src)
+            except FileNotFoundError:
+                st = None
+            if os.path.lexists(dst):
+                if already_applied(src, st, dst, record['size']):
+                    count('resumed')
+                    return
+                raise FileExistsError(f"{dst} already exists")
+            if st is None or (st.st_size, st.st_mtime_ns) != (record['size'], record['mtime_ns']):
+                raise StaleEntryError(f"{src} changed since the manifest was planned")
+
+            folder = os.path.dirname(dst)
+            if folder not in created:
+                os.makedirs(folder, exist_ok=True)
+                with created_lock:
+                    created.add(folder)
+            started = time.perf_counter()
+            digest = None
+            with writers:
+                if mode == MODE_MOVE:
+                    method = move_file(src, dst)
+                elif checksums or verify:
+                    method, digest = copy_checked(src, dst, mode == MODE_HARDLINK, verify)
+                else:
+                    method = copy_atomic(src, dst, hardlink=mode == MODE_HARDLINK)
+            if digest is not None and checksum_writer is not None:
+                checksum_writer.add(dst, digest)
+            metrics.file_done(src, st.st_size, {STAGE_COPY: time.perf_counter() - started}, method)
+            count('processed', st.st_size)
+        except Exception as e:
+            metrics.error(src, e)
+            count('errors')
+
+    def already_applied(src, st, dst, size):
+        """True if `dst` is the copy of `src` written by a previous attempt"""
+        if st is None:
+            # Moved by then, or removed since it was copied
+            return os.path.getsize(dst) == size
+        if mode == MODE_MOVE or not os.path.getsize(dst) == st.st_size == size:
+            return False
+        if checksums or verify:
+            return files_are_identical(src, dst)
+        return True
+
+    def worker(pending, pending_lock):
+        while True:
+            with pending_lock:
+                record = next(pending, None)
+            if record is None:
+                return
+            apply(record)
+
+    notify(STAGE_FOUND)
+    # Missing source folder: every transfer fails as stale
+    for record in unreachable:
+        apply(record)
+    threads = []
+    for group, records in zip(devices, queues):
+        pending = iter(records)
+        pending_lock = threading.Lock()
+        count_workers = hdd_workers if group.rotational else (workers or default_copy_workers())
+        threads += [threading.Thread(target=worker, args=(pending, pending_lock),
+                                     name=f'copy-{len(threads) + i}', daemon=True)
+                    for i in range(max(1, count_workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.finished_at = time.monotonic()
+    notify(STAGE_DONE)
+    return result
@@ -0,0 +1,278 @@
+"""
+Run instrumentation: stage timings, latency histograms and the run report
+
+Every file goes through timed stages (scan, date, dedupe, mkdir, copy).
+Each stage keeps a count, a total and a log-scale latency histogram, so
+percentiles cost constant memory whatever the size of the run. Bytes read
+and written are counted per copy method, the slowest files are kept with
+their per-stage breakdown, and errors are grouped by category with a few
+examples. `RunMetrics.report` turns all of it into a JSON-ready dict.
+
+Busy time per worker pool divided by wall time shows which pool is the
+bottleneck: a copy pool busy 100% of the time needs more workers (or a
+faster disk), a mostly idle one is waiting for the metadata stage.
+"""
+
+import errno
+import heapq
+import math
+import threading
+import time
+
+from .storage import METHOD_MULTIPART, METHOD_UPLOAD
+from .transfer import (
+    METHOD_COPY_FILE_RANGE, METHOD_SENDFILE, METHOD_USERSPACE, METHOD_VERIFIED, METHOD_HASHED,
+)
+
+STAGE_SCAN = 'scan'
+STAGE_INDEX = 'index'
+STAGE_DATE = 'date'
+STAGE_DEDUPE = 'dedupe'
+STAGE_MKDIR = 'mkdir'
+STAGE_COPY = 'copy'
+STAGE_SIMILAR = 'similar'
+
+# Buckets per power of two: about 4% precision on percentiles
+BUCKETS_PER_OCTAVE = 16
+SLOWEST_FILES = 20
+ERROR_EXAMPLES = 10
+PERCENTILES = (50, 90, 99)
+
+
+class Histogram:
+    """Latency histogram with log-scale buckets (not thread-safe, see RunMetrics)"""
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        microseconds = seconds * 1e6
+        bucket = int(math.log2(microseconds) * BUCKETS_PER_OCTAVE) if microseconds > 1 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile, in seconds"""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        summary = {
+            'count': self.count,
+            'total_seconds': round(self.total, 4),
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 3),
+        }
+        for p in PERCENTILES:
+            summary[f'p{p}_ms'] = round(self.percentile(p) * 1000, 3)
+        return summary
+
+
+def error_category(exc):
+    """'PermissionError:EACCES', 'OSError:ENOSPC', 'ValueError'..."""
+    name = type(exc).__name__
+    code = getattr(exc, 'errno', None) if isinstance(exc, OSError) else None
+    if code:
+        return f"{name}:{errno.errorcode.get(code, code)}"
+    return name
+
+
+def timed_iter(iterable, metrics, stage):
+    """Yield the items of `iterable`, recording the time spent producing each one"""
+    iterator = iter(iterable)
+    clock = time.perf_counter
+    while True:
+        started = clock()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        metrics.record(stage, clock() - started)
+        yield item
+
+
+class RunMetrics:
+    """Thread-safe counters of one organize run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.files = Histogram()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.bytes_hashed = 0
+        # Copy method (see transfer.py) -> [files, bytes]
+        self.methods = {}
+        # Min-heap of (seconds, path, size, stage breakdown)
+        self._slowest = []
+        # Category -> [count, examples]
+        self.errors = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.record(seconds)
+
+    def file_done(self, path, size, timings, method=None, hashed=0):
+        """A file went through every stage; `timings` maps stage -> seconds"""
+        seconds = sum(timings.values())
+        with self._lock:
+            for stage, elapsed in timings.items():
+                histogram = self.stages.get(stage)
+                if histogram is None:
+                    histogram = self.stages[stage] = Histogram()
+                histogram.record(elapsed)
+            self.files.record(seconds)
+            self.bytes_read += hashed
+            self.bytes_hashed += hashed
+            if method is not None:
+                counts = self.methods.setdefault(method, [0, 0])
+                counts[0] += 1
+                counts[1] += size
+                # Reflinks, hard links and renames move no data
+                if method in (METHOD_COPY_FILE_RANGE, METHOD_SENDFILE, METHOD_USERSPACE,
+                              METHOD_VERIFIED, METHOD_HASHED, METHOD_UPLOAD, METHOD_MULTIPART):
+                    self.bytes_read += size
+                    self.bytes_written += size
+            item = (seconds, path, size, timings)
+            if len(self._slowest) < SLOWEST_FILES:
+                heapq.heappush(self._slowest, item)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+    def error(self, path, exc):
+        category = error_category(exc)
+        with self._lock:
+            entry = self.errors.setdefault(category, [0, []])
+            entry[0] += 1
+            if len(entry[1]) < ERROR_EXAMPLES:
+                entry[1].append({'path': path, 'message': str(exc)})
+
+    def slowest(self):
+        with self._lock:
+            items = sorted(self._slowest, key=lambda item: item[0], reverse=True)
+        return [{
+            'path': path,
+            'size': size,
+            'seconds': round(seconds, 4),
+            'stages_ms': {stage: round(elapsed * 1000, 3) for stage, elapsed in timings.items()},
+        } for seconds, path, size, timings in items]
+
+    def pool_busy(self, stages):
+        """Total seconds spent by workers in `stages`"""
+        with self._lock:
+            return sum(self.stages[stage].total for stage in stages if stage in self.stages)
+
+    def report(self, result, config, pipelines=()):
+        """JSON-ready summary of the run"""
+        elapsed = result.elapsed
+        report = {
+            'sources': config.sources,
+            'destination': config.dest_folder,
+            'options': {
+                'sort_by_date': config.sort_by_date,
+                'copy_mode': config.copy_mode,
+                'hardlink': config.hardlink,
+                'cache': bool(config.cache_path),
+            },
+            'elapsed_seconds': round(elapsed, 3),
+            'counts': {
+                'found': result.total_files,
+                'organized': result.processed,
+                'duplicates': result.skipped_duplicates,
+                'resumed': result.resumed,
+                'errors': result.errors,
+            },
+            'scan': vars(result.scan),
+            'files_per_second': round(result.files_per_second, 1),
+            'mb_per_second': round(result.mb_per_second, 2),
+            'bytes': {
+                'transferred': result.bytes_transferred,
+                'read': self.bytes_read,
+                'written': self.bytes_written,
+                'hashed': self.bytes_hashed,
+            },
+            'copy_methods': {method: {'files': files, 'bytes': nbytes}
+                             for method, (files, nbytes) in self.methods.items()},
+            'stages': {stage: histogram.to_dict() for stage, histogram in self.stages.items()},
+            'file_latency': self.files.to_dict(),
+            'slowest_files': self.slowest(),
+            'errors': {category: {'count': count, 'examples': examples}
+                       for category, (count, examples) in self.errors.items()},
+        }
+        if pipelines:
+            # Share of the wall time each pool spent working (all devices together)
+            pools = {
+                'metadata': (sum(p.metadata_workers for p in pipelines), (STAGE_DATE,)),
+                'copy': (sum(p.copy_workers for p in pipelines), (STAGE_DEDUPE, STAGE_MKDIR, STAGE_COPY)),
+            }
+            report['pools'] = {
+                name: {
+                    'workers': workers,
+                    'busy_seconds': round(self.pool_busy(stages), 3),
+                    'utilization': round(self.pool_busy(stages) / (elapsed * workers), 3),
+                }
+                for name, (workers, stages) in pools.items()
+            }
+        return report
+
+
+class ThreadProfiler:
+    """cProfile every pipeline thread and merge the results into one pstats file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.threads = 0
+        self._stats = None
+        self._lock = threading.Lock()
+
+    def wrap(self, target):
+        """Thread target running `target` under its own profiler"""
+        import cProfile
+
+        def run(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+: only one profiler can be active at a time
+                return target(*args, **kwargs)
+            try:
+                return target(*args, **kwargs)
+            finally:
+                profile.disable()
+                self._add(profile)
+
+        return run
+
+    def _add(self, profile):
+        import pstats
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.threads += 1
+
+    def save(self):
+        """Write the merged statistics (read them with `python -m pstats FILE`)"""
+        with self._lock:
+            if self._stats is not None:
+                self._stats.dump_stats(self.path)
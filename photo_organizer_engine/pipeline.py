@@ -0,0 +1,111 @@
+"""
+Staged parallel pipeline
+
+    scanner thread -> [scan queue] -> metadata workers -> [copy queue] -> copy workers
+
+The queues are bounded, so a fast scanner cannot run arbitrarily far ahead
+of the workers (backpressure) and memory stays proportional to the queue
+sizes, not to the size of the library. Copying starts as soon as the first
+file has been dated, while the scan is still running.
+"""
+
+import os
+import queue
+import threading
+
+# Marks the end of a queue; one is sent per consumer thread
+_DONE = object()
+
+
+def default_metadata_workers():
+    """Date extraction is mostly small header reads, so use a few more threads than cores"""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def default_copy_workers():
+    """A handful of concurrent copies keeps SSDs and network shares busy"""
+    return 4
+
+
+class Pipeline:
+    """Run `metadata` then `transfer` on every scanned item with worker pools"""
+
+    def __init__(self, metadata_workers=None, copy_workers=None, queue_size=256, wrap_thread=None):
+        self.metadata_workers = max(1, metadata_workers or default_metadata_workers())
+        self.copy_workers = max(1, copy_workers or default_copy_workers())
+        self.queue_size = max(1, queue_size)
+        # Optional `wrap_thread(target) -> target`, e.g. to profile every thread
+        self.wrap_thread = wrap_thread
+
+    def run(self, items, metadata, transfer, on_error, on_scanned=None):
+        """
+        Process every element of the `items` iterable.
+
+        `metadata(item)` runs on the metadata pool and returns a job for the
+        copy pool (or None to drop the item); `transfer(job)` runs on the copy
+        pool. Exceptions raised by either are passed to `on_error(item, exc)`.
+        `on_scanned(item)` is called by the scanner for every item it queues,
+        and `on_scanned(None)` once the scan is complete.
+        """
+        scan_queue = queue.Queue(self.queue_size)
+        copy_queue = queue.Queue(self.queue_size)
+        remaining_metadata = [self.metadata_workers]
+        remaining_lock = threading.Lock()
+
+        def scanner():
+            try:
+                for item in items:
+                    if on_scanned is not None:
+                        on_scanned(item)
+                    scan_queue.put(item)
+            except Exception as e:
+                on_error(None, e)
+            finally:
+                if on_scanned is not None:
+                    on_scanned(None)
+                for _ in range(self.metadata_workers):
+                    scan_queue.put(_DONE)
+
+        def metadata_worker():
+            try:
+                while True:
+                    item = scan_queue.get()
+                    if item is _DONE:
+                        break
+                    try:
+                        job = metadata(item)
+                    except Exception as e:
+                        on_error(item, e)
+                        continue
+                    if job is not None:
+                        copy_queue.put((item, job))
+            finally:
+                # The last metadata worker to finish closes the copy queue
+                with remaining_lock:
+                    remaining_metadata[0] -= 1
+                    last = remaining_metadata[0] == 0
+                if last:
+                    for _ in range(self.copy_workers):
+                        copy_queue.put(_DONE)
+
+        def copy_worker():
+            while True:
+                entry = copy_queue.get()
+                if entry is _DONE:
+                    break
+                item, job = entry
+                try:
+                    transfer(job)
+                except Exception as e:
+                    on_error(item, e)
+
+        wrap = self.wrap_thread or (lambda target: target)
+        threads = [threading.Thread(target=wrap(scanner), name='scanner', daemon=True)]
+        threads += [threading.Thread(target=wrap(metadata_worker), name=f'metadata-{i}', daemon=True)
+                    for i in range(self.metadata_workers)]
+        threads += [threading.Thread(target=wrap(copy_worker), name=f'copy-{i}', daemon=True)
+                    for i in range(self.copy_workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
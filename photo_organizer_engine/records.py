@@ -0,0 +1,116 @@
+"""
+Compact file records for multi-million-file libraries
+
+A Python string per path and an object per file cost 300+ bytes per file,
+more than a gigabyte for a library of five million photos. Records that
+must be kept for the whole run use these structures instead:
+
+- FolderTable: each folder path is stored once, files refer to it by number
+- FileTable: array-backed columns (folder number, size, UTF-8 name bytes),
+  about 30 bytes per file plus its name, with a size-sorted order for lookups
+
+Everything else is streamed (see scanner.py and pipeline.py), so memory
+only grows with what must be remembered: the destination index.
+"""
+
+import heapq
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Names are stored as bytes; surrogatepass round-trips any str (undecodable
+# POSIX names arrive as lone surrogates)
+_ENCODING = 'utf-8'
+_ERRORS = 'surrogatepass'
+# Rows sorted at once by FileTable.sort (bounds the temporary Python objects)
+SORT_CHUNK = 256 * 1024
+
+
+class FolderTable:
+    """Folder paths stored once, referred to by number (thread-safe)"""
+
+    def __init__(self):
+        self.folders = []
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def id(self, folder):
+        folder_id = self._ids.get(folder)
+        if folder_id is None:
+            with self._lock:
+                folder_id = self._ids.get(folder)
+                if folder_id is None:
+                    folder_id = self._ids[folder] = len(self.folders)
+                    self.folders.append(folder)
+        return folder_id
+
+    def split(self, path):
+        """(folder number, name) of a path"""
+        folder, name = os.path.split(path)
+        return self.id(folder), name
+
+    def path(self, folder_id, name):
+        return os.path.join(self.folders[folder_id], name)
+
+
+class FileTable:
+    """
+    Columns of files: folder number, size and name. Rows are added with
+    `append`, and found by size with `rows(size)`, a binary search over
+    the rows present at the last `sort`. Reading while another thread
+    appends or sorts is safe.
+    """
+
+    def __init__(self, folders=None):
+        self.folders = folders if folders is not None else FolderTable()
+        self.folder_ids = array('I')
+        self.sizes = array('q')
+        # End offset of each name in `names`
+        self.name_ends = array('Q')
+        self.names = bytearray()
+        # (rows in size order, their sizes) at the last sort(), replaced at once
+        self._sorted = (array('I'), array('q'))
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def append(self, path, name, size):
+        """Add a file; `name` is the last component of `path`"""
+        folder = path[:len(path) - len(name) - 1] if path.endswith(name) else os.path.dirname(path)
+        self.folder_ids.append(self.folders.id(folder))
+        self.sizes.append(size)
+        self.names += name.encode(_ENCODING, _ERRORS)
+        self.name_ends.append(len(self.names))
+
+    def name(self, row):
+        start = self.name_ends[row - 1] if row else 0
+        return self.names[start:self.name_ends[row]].decode(_ENCODING, _ERRORS)
+
+    def path(self, row):
+        return self.folders.path(self.folder_ids[row], self.name(row))
+
+    def sort(self):
+        """Make every row findable by `rows`"""
+        sizes = self.sizes
+        count = len(sizes)
+        # Sorted in chunks then merged: a few bytes per row, not a Python int or two
+        chunks = [array('I', sorted(range(start, min(start + SORT_CHUNK, count)), key=sizes.__getitem__))
+                  for start in range(0, count, SORT_CHUNK)]
+        order = array('I', heapq.merge(*chunks, key=sizes.__getitem__)) if len(chunks) > 1 else (
+            chunks[0] if chunks else array('I'))
+        del chunks
+        self._sorted = (order, array('q', (sizes[row] for row in order)))
+        return self
+
+    def rows(self, size):
+        """Rows of the files of this size (as of the last sort)"""
+        order, sorted_sizes = self._sorted
+        start = bisect_left(sorted_sizes, size)
+        end = bisect_right(sorted_sizes, size, start)
+        return order[start:end]
+
+    def nbytes(self):
+        """Approximate memory used by the columns"""
+        columns = (self.folder_ids, self.sizes, self.name_ends) + self._sorted
+        return len(self.names) + sum(c.itemsize * len(c) for c in columns)
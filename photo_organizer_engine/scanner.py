@@ -0,0 +1,129 @@
+"""
+Streaming directory scanner
+
+An iterative `os.scandir` walk that yields matching files as soon as they
+are found, so downstream stages start working immediately. It never builds
+a Path object per file: extensions are matched with `str.endswith` on a
+precomputed lowercase tuple, and the yielded `os.DirEntry` objects keep
+the stat result of the scan for later stages (free on Windows, one cached
+call on POSIX). Hidden/system folders and exclude globs are pruned before
+descending into them.
+"""
+
+import fnmatch
+import os
+import re
+import stat
+
+# Folders created by operating systems and NAS devices, never photos
+SYSTEM_FOLDERS = frozenset({
+    '$recycle.bin', 'system volume information', '.trashes', '.trash',
+    '.spotlight-v100', '.fseventsd', '.temporaryitems', '@eadir', '#recycle',
+})
+
+_HIDDEN_ATTRIBUTES = (getattr(stat, 'FILE_ATTRIBUTE_HIDDEN', 2)
+                      | getattr(stat, 'FILE_ATTRIBUTE_SYSTEM', 4))
+# Only Windows has hidden/system attributes, and there the stat is free
+_CHECK_ATTRIBUTES = os.name == 'nt'
+
+
+class ScanStats:
+    """Live counters of a scan, safe to read from another thread"""
+
+    def __init__(self):
+        self.directories = 0
+        self.entries = 0
+        self.matched = 0
+        self.errors = 0
+
+
+class FileRef:
+    """Same interface as os.DirEntry (path, name, stat()) for a path found another way"""
+
+    __slots__ = ('path', 'name', '_stat')
+
+    def __init__(self, path, st=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._stat = st
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+def compile_excludes(patterns):
+    """One regex for all exclude globs, matched against names and relative paths"""
+    patterns = [p.replace('\\', '/').rstrip('/') for p in patterns or () if p]
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(p) for p in patterns), re.IGNORECASE)
+
+
+def is_hidden(entry):
+    """Dot-files, Windows hidden/system items and well-known system folders"""
+    name = entry.name
+    if name.startswith('.') or name.lower() in SYSTEM_FOLDERS:
+        return True
+    if not _CHECK_ATTRIBUTES:
+        return False
+    attributes = getattr(entry.stat(follow_symlinks=False), 'st_file_attributes', 0)
+    return bool(attributes & _HIDDEN_ATTRIBUTES)
+
+
+def iter_files(source, extensions, exclude=(), skip_hidden=True, skip_dirs=(),
+               stats=None, on_progress=None, progress_every=1000):
+    """
+    Yield an os.DirEntry for every file below `source` whose name ends with
+    one of `extensions`.
+
+    `exclude` are glob patterns (e.g. '*/Thumbnails', '*.tmp') matched against
+    names and paths relative to `source`. `skip_dirs` are absolute folders
+    never entered (e.g. a destination nested in the source). `on_progress(stats)`
+    is called every `progress_every` directory entries.
+    """
+    suffixes = tuple(ext.lower() for ext in extensions)
+    excluded = compile_excludes(exclude)
+    skipped = {os.path.normcase(os.path.abspath(d)) for d in skip_dirs}
+    stats = stats if stats is not None else ScanStats()
+    root = os.path.abspath(source)
+    # A drive or filesystem root ('E:\\', '/') already ends with a separator
+    prefix = len(os.path.join(root, ''))
+    next_report = progress_every
+
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            iterator = os.scandir(folder)
+        except OSError:
+            stats.errors += 1
+            continue
+        stats.directories += 1
+        subfolders = []
+        with iterator:
+            for entry in iterator:
+                stats.entries += 1
+                if on_progress is not None and stats.entries >= next_report:
+                    next_report += progress_every
+                    on_progress(stats)
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if skip_hidden and is_hidden(entry):
+                        continue
+                except OSError:
+                    stats.errors += 1
+                    continue
+                if excluded is not None and (
+                        excluded.match(entry.name)
+                        or excluded.match(entry.path[prefix:].replace('\\', '/'))):
+                    continue
+                if is_dir:
+                    if os.path.normcase(entry.path) not in skipped:
+                        subfolders.append(entry.path)
+                elif entry.name.lower().endswith(suffixes):
+                    stats.matched += 1
+                    yield entry
+        # Depth first, in listing order
+        stack.extend(reversed(subfolders))
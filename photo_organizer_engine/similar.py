@@ -0,0 +1,276 @@
+"""
+Near-duplicate detection with perceptual hashes
+
+Exact duplicates are caught by content digests (see dedupe.py); this finds
+the same picture stored differently: re-encoded, resized by a messaging
+app, or saved in another format. Each photo gets a 64-bit perceptual hash:
+
+- dHash (default): brightness gradients of a 9x8 grayscale version
+- pHash: signs of the low frequencies of a 32x32 DCT (needs NumPy)
+
+Hashes are computed from a small image only: the EXIF thumbnail when its
+shape matches the photo (read before the photo is opened at all, so RAW
+and HEIC files Pillow cannot open are compared too), otherwise a JPEG
+`draft()` decode that lets the decoder scale down by up to 8 in the DCT
+domain. Full resolution is never decoded. Hashes are remembered by the metadata cache.
+
+Pairs of photos whose hashes differ by at most `threshold` bits are found
+with multi-index hashing: the hash is cut into threshold + 1 chunks, and
+two hashes that close must share at least one chunk exactly, so only files
+sharing a chunk value are compared (with NumPy when available). This
+scales to hundreds of thousands of photos instead of comparing all pairs.
+"""
+
+import io
+
+from .cache import identity_stat
+from .exif import read_exif_preview
+
+METHOD_DHASH = 'dhash'
+METHOD_PHASH = 'phash'
+METHODS = (METHOD_DHASH, METHOD_PHASH)
+
+HASH_BITS = 64
+# Bits that may differ between two near duplicates (out of 64)
+DEFAULT_THRESHOLD = 6
+MAX_THRESHOLD = 16
+
+# Decode size requested from the JPEG decoder (draft mode)
+DRAFT_SIZE = (128, 128)
+# Thumbnail used only if its aspect ratio matches the photo (no black bars)
+MAX_ASPECT_DIFFERENCE = 0.03
+# Rows compared at once inside a bucket (bounds NumPy temporaries)
+COMPARE_BLOCK = 1024
+
+_numpy = None
+
+
+def _load_numpy():
+    """NumPy, or None if it is not installed (imported on first use: it is slow to import)"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def _open_small(path):
+    """(small image, full size) of a photo, without decoding full resolution"""
+    from PIL import Image
+
+    # The thumbnail first: RAW and HEIC files Pillow cannot open are hashed from it
+    thumbnail, size = read_exif_preview(path)
+    image = None
+    if thumbnail is not None:
+        if size is None:
+            # Size not recorded in the EXIF data: read from the image header only
+            image = Image.open(path)
+            size = image.size
+        try:
+            small = Image.open(io.BytesIO(thumbnail))
+            width, height = small.size
+            if abs(width / height - size[0] / size[1]) <= MAX_ASPECT_DIFFERENCE * size[0] / size[1]:
+                small.load()
+                if image is not None:
+                    image.close()
+                return small, size
+            small.close()
+        except Exception:
+            pass
+    if image is None:
+        image = Image.open(path)
+        size = image.size
+    # JPEG only: decode directly at 1/2, 1/4 or 1/8 of the size
+    image.draft('L', DRAFT_SIZE)
+    return image, size
+
+
+def dhash(image):
+    """Difference hash: is each pixel brighter than its right neighbour"""
+    from PIL import Image
+
+    pixels = image.convert('L').resize((9, 8), Image.BILINEAR).tobytes()
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            offset = row * 9 + column
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value
+
+
+_dct_matrix = None
+
+
+def phash(image):
+    """DCT hash: is each of the 8x8 lowest frequencies above their median"""
+    from PIL import Image
+    global _dct_matrix
+
+    numpy = _load_numpy()
+    if numpy is None:
+        raise RuntimeError("pHash requires NumPy")
+    if _dct_matrix is None:
+        n = numpy.arange(32)
+        _dct_matrix = numpy.cos(numpy.pi * (2 * n[None, :] + 1) * n[:, None] / 64)
+    pixels = numpy.asarray(image.convert('L').resize((32, 32), Image.BILINEAR), dtype=numpy.float64)
+    low = (_dct_matrix @ pixels @ _dct_matrix.T)[:8, :8].flatten()
+    # The DC coefficient is the mean brightness, not structure
+    bits = low > numpy.median(low[1:])
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bool(bit)
+    return value
+
+
+def image_hash(path, method=METHOD_DHASH):
+    """(64-bit perceptual hash, pixel count) of a photo"""
+    image, size = _open_small(path)
+    with image:
+        value = phash(image) if method == METHOD_PHASH else dhash(image)
+    return value, size[0] * size[1]
+
+
+def cached_image_hash(photo, method, cache=None):
+    """image_hash of a photo (os.DirEntry-like) through the metadata cache, None if not an image"""
+    st = identity_stat(photo.path, photo.stat()) if cache is not None else None
+    if st is not None:
+        record = cache.get_similarity(st)
+        if record is not None:
+            stored_method, value, pixels = record.split(':')
+            if stored_method == method:
+                return (int(value, 16), int(pixels)) if value else None
+    try:
+        result = image_hash(photo.path, method)
+    except Exception:
+        # Not decodable by Pillow (unsupported RAW, HEIC without plugin, corrupt file)
+        result = None
+    if st is not None:
+        value, pixels = result if result is not None else (None, 0)
+        cache.put_similarity(st, f"{method}:{'' if value is None else format(value, '016x')}:{pixels}")
+    return result
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _chunks(threshold):
+    """(shift, mask) of threshold + 1 chunks covering the 64 bits"""
+    count = threshold + 1
+    chunks = []
+    start = 0
+    for i in range(count):
+        width = HASH_BITS // count + (1 if i < HASH_BITS % count else 0)
+        chunks.append((start, (1 << width) - 1))
+        start += width
+    return chunks
+
+
+_popcount_table = None
+
+
+def _popcount(values):
+    global _popcount_table
+    numpy = _load_numpy()
+    bitwise_count = getattr(numpy, 'bitwise_count', None)
+    if bitwise_count is not None:
+        return bitwise_count(values)
+    # NumPy < 2.0: count the bits of each byte
+    if _popcount_table is None:
+        _popcount_table = numpy.array([bin(i).count('1') for i in range(256)], dtype=numpy.uint8)
+    return _popcount_table[values.view(numpy.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+
+def _bucket_pairs_numpy(hashes, members, threshold, found):
+    numpy = _load_numpy()
+    group = hashes[members]
+    for start in range(0, len(members), COMPARE_BLOCK):
+        block = group[start:start + COMPARE_BLOCK]
+        distances = _popcount(block[:, None] ^ group[None, :])
+        rows, columns = numpy.nonzero(distances <= threshold)
+        # Each unordered pair once
+        keep = columns > rows + start
+        for row, column in zip(rows[keep], columns[keep]):
+            found.add((int(members[start + row]), int(members[column])))
+
+
+def similar_pairs(hashes, threshold=DEFAULT_THRESHOLD):
+    """Index pairs (i, j), i < j, of `hashes` differing by at most `threshold` bits"""
+    threshold = max(0, min(threshold, MAX_THRESHOLD))
+    found = set()
+    numpy = _load_numpy()
+    if numpy is not None:
+        values = numpy.array(hashes, dtype=numpy.uint64)
+        for shift, mask in _chunks(threshold):
+            keys = (values >> numpy.uint64(shift)) & numpy.uint64(mask)
+            order = numpy.argsort(keys, kind='stable')
+            boundaries = numpy.flatnonzero(numpy.diff(keys[order])) + 1
+            for members in numpy.split(order, boundaries):
+                if len(members) > 1:
+                    _bucket_pairs_numpy(values, members, threshold, found)
+    else:
+        for shift, mask in _chunks(threshold):
+            buckets = {}
+            for i, value in enumerate(hashes):
+                buckets.setdefault((value >> shift) & mask, []).append(i)
+            for members in buckets.values():
+                for a in range(len(members)):
+                    first = hashes[members[a]]
+                    for b in range(a + 1, len(members)):
+                        if hamming(first, hashes[members[b]]) <= threshold:
+                            found.add((members[a], members[b]))
+    return sorted(found)
+
+
+def _clusters(count, pairs):
+    """Connected components (union-find) of the similarity graph, singletons excluded"""
+    parent = list(range(count))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        a, b = root(i), root(j)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    groups = {}
+    for i, j in pairs:
+        groups.setdefault(root(i), set()).update((i, j))
+    return [sorted(members) for members in groups.values()]
+
+
+def find_near_duplicates(photos, threshold=DEFAULT_THRESHOLD, method=METHOD_DHASH,
+                         cache=None, workers=None):
+    """
+    Group visually identical photos (os.DirEntry-like objects).
+
+    Returns a list of {'keep': path, 'similar': [{'path', 'distance'}]}:
+    in each group the photo with the most pixels (then the largest file)
+    is kept, the others are its near duplicates.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    photos = list(photos)
+    with ThreadPoolExecutor(workers) as executor:
+        results = list(executor.map(lambda photo: cached_image_hash(photo, method, cache), photos))
+    hashed = [(photo, result) for photo, result in zip(photos, results) if result is not None]
+    hashes = [result[0] for _, result in hashed]
+
+    groups = []
+    for members in _clusters(len(hashed), similar_pairs(hashes, threshold)):
+        def quality(i):
+            photo, (_, pixels) = hashed[i]
+            return pixels, photo.stat().st_size
+        keep = max(members, key=quality)
+        groups.append({
+            'keep': hashed[keep][0].path,
+            'similar': [{'path': hashed[i][0].path, 'distance': hamming(hashes[keep], hashes[i])}
+                        for i in members if i != keep],
+        })
+    return groups
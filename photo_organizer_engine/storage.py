@@ -0,0 +1,548 @@
+"""
+Destination storage backends
+
+Everything a run does to its destination goes through a backend: listing
+what is already there, checking and picking names, writing, renaming and
+digesting files. The backend is chosen from the destination by
+`open_storage`:
+
+- LocalStorage: a local folder or a mounted network share, through the
+  copy and move backends of transfer.py
+- S3Storage: `s3://bucket/prefix`, a bucket of an S3-compatible object
+  store (AWS S3, MinIO, Ceph, moto...), written to directly so photos are
+  not organized to a local disk first and uploaded a second time
+
+Paths stay plain strings with both backends ('s3://bucket/photos/2023/August/IMG_0001.jpg'),
+so the folder and duplicate indexes and the journal work unchanged; the S3
+backend maps them to object keys.
+
+The S3 backend needs boto3 (`pip install photo-organizer[s3]`), imported
+when an S3 destination is opened. One client is shared by all workers,
+with a connection pool sized for them:
+
+- listing: the whole destination is listed flat, 1000 objects per request
+  whatever the number of folders. The names seen are kept (up to
+  MAX_LISTED_NAMES) so each folder's first listing costs no request;
+  beyond that, or for a folder listed again, it is one delimited listing
+- files below MULTIPART_THRESHOLD are hashed, then streamed from the file
+  in a single PUT carrying their digests (full and partial, see
+  hashing.py) and modification time as metadata. The second read usually
+  comes from the page cache, and no file is ever held whole in memory
+- larger files are read once too, part after part: each part is hashed
+  in order and uploaded by a shared pool of threads while the next one is
+  read, so several parts of a clip are in flight at once. Their metadata
+  is sent before the first part, so it only has the partial digest (two
+  64 KB reads of the source)
+- every PUT and part carries its MD5 (Content-MD5), checked by the server:
+  a corrupted transfer is refused, and moves only delete the source once
+  the object is complete
+- objects appear whole or not at all, so no temporary name is needed; a
+  failed multipart upload is aborted (a lifecycle rule aborting incomplete
+  uploads also cleans up after a crash)
+
+Objects have no stat identity, so the metadata cache does not apply to
+them: comparing an object written by this program costs one HEAD, which
+gives both its digests. Objects written otherwise are compared with a
+HEAD and two ranged GETs (partial digest), then read back (full digest),
+as are the full digests of multipart objects. Botocore errors are raised as OSError
+like local ones.
+"""
+
+import base64
+import errno
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+from .hashing import (
+    DIGEST_SIZE, FULL_BUFFER_SIZE, PARTIAL_BLOCK, PARTIAL_COVERS_ALL, full_digest, partial_digest,
+    thread_buffer,
+)
+from .scanner import FileRef, iter_files
+from .transfer import copy_atomic, copy_checked, move_file
+
+S3_SCHEME = 's3://'
+
+METHOD_UPLOAD = 'upload'
+METHOD_MULTIPART = 'multipart'
+
+# Files from this size are uploaded in parts, PART_SIZE bytes each
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+PART_SIZE = 16 * 1024 * 1024
+# S3 limit on the number of parts of an object
+MAX_PARTS = 10000
+# Threads uploading parts, shared by all copy workers (also the parts in flight per file)
+DEFAULT_UPLOAD_WORKERS = 8
+# Object metadata (x-amz-meta-*) written with every file
+DIGEST_METADATA = 'blake2b'
+PARTIAL_DIGEST_METADATA = 'blake2b-partial'
+MTIME_METADATA = 'mtime'
+# Names of the flat listing kept for the first listing of each folder
+MAX_LISTED_NAMES = 200_000
+# Full digests read along with partial ones, kept until asked for
+MAX_PENDING_DIGESTS = 65536
+
+
+def is_remote(path):
+    """True for a destination of an object store rather than a folder"""
+    return path.lower().startswith(S3_SCHEME)
+
+
+def parse_s3_url(url):
+    """'s3://bucket/photos/' -> ('bucket', 'photos'); ValueError without a bucket"""
+    bucket, _, prefix = url[len(S3_SCHEME):].replace('\\', '/').partition('/')
+    if not bucket:
+        raise ValueError(f"no bucket in {url!r}")
+    return bucket, prefix.strip('/')
+
+
+def _content_md5(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+
+def _file_digests(path):
+    """(BLAKE2b digest, Content-MD5) of a local file, read through the thread's buffer"""
+    hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    md5 = hashlib.md5()
+    buffer = thread_buffer()
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+            md5.update(view[:n])
+    return hasher.hexdigest(), base64.b64encode(md5.digest()).decode('ascii')
+
+
+class ObjectStat:
+    """Stat-like size and modification time of a listed object (no identity: never cached)"""
+
+    __slots__ = ('st_size', 'st_mtime', 'st_mtime_ns')
+    st_dev = 0
+    st_ino = 0
+
+    def __init__(self, size, mtime):
+        self.st_size = size
+        self.st_mtime = mtime
+        self.st_mtime_ns = int(mtime * 1e9)
+
+
+class LocalStorage:
+    """A folder of the local filesystem (or of a mounted share)"""
+
+    remote = False
+
+    def isdir(self, folder):
+        return os.path.isdir(folder)
+
+    def makedirs(self, folder):
+        os.makedirs(folder, exist_ok=True)
+
+    def listdir(self, folder):
+        return os.listdir(folder)
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def iter_files(self, folder, extensions, **options):
+        """os.DirEntry of every file below `folder` (see scanner.iter_files)"""
+        return iter_files(folder, extensions, **options)
+
+    def copy(self, src, dst, hardlink=False, checked=False, read_back=False):
+        """Copy a local file in, return (method, digest); the digest is only computed if `checked`"""
+        if checked:
+            return copy_checked(src, dst, hardlink, read_back)
+        return copy_atomic(src, dst, hardlink), None
+
+    def move(self, src, dst):
+        """Move a local file in, return (method, digest)"""
+        return move_file(src, dst), None
+
+    def rename(self, src, dst):
+        """Give a file of the destination another name"""
+        return move_file(src, dst)
+
+    partial_digest = staticmethod(partial_digest)
+    full_digest = staticmethod(full_digest)
+
+    def append_text(self, path, text):
+        # Small appends, flushed at once: a crash loses at most this text
+        with open(path, 'a', encoding='utf-8', newline='\n') as f:
+            f.write(text)
+
+    def describe(self):
+        return {'backend': 'local'}
+
+    def close(self):
+        pass
+
+
+class S3Storage:
+    """
+    Prefix of a bucket of an S3-compatible object store (thread-safe).
+
+    `endpoint_url` selects another server than AWS (MinIO, a moto server...);
+    credentials and region come from the usual boto3 configuration
+    (environment variables, ~/.aws). `connections` is the size of the
+    connection pool, at least the number of threads using the storage.
+    """
+
+    remote = True
+
+    def __init__(self, url, endpoint_url=None, workers=DEFAULT_UPLOAD_WORKERS, connections=None,
+                 part_size=PART_SIZE, multipart_threshold=MULTIPART_THRESHOLD):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+        from botocore.exceptions import BotoCoreError, ClientError
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.bucket, self.prefix = parse_s3_url(url)
+        self.root = S3_SCHEME + self.bucket + ('/' + self.prefix if self.prefix else '')
+        self.endpoint_url = endpoint_url
+        self.workers = max(workers, 1)
+        self.part_size = part_size
+        self.multipart_threshold = multipart_threshold
+        self._errors = (BotoCoreError, ClientError)
+        options = {'max_pool_connections': max(connections or 0, self.workers),
+                   'retries': {'max_attempts': 5, 'mode': 'standard'},
+                   'tcp_keepalive': True}
+        if endpoint_url:
+            # Most self-hosted servers only know path-style bucket addressing
+            options['s3'] = {'addressing_style': 'path'}
+        self.client = boto3.session.Session().client('s3', endpoint_url=endpoint_url,
+                                                     config=Config(**options))
+        # Server-side copies (renames), in parts for large objects
+        self._transfer = TransferConfig(multipart_threshold=multipart_threshold,
+                                        multipart_chunksize=part_size, max_concurrency=self.workers)
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='upload')
+        self._lock = threading.Lock()
+        # Operation -> number of requests sent
+        self.requests = {}
+        # Text appended to objects, written on close: path -> [text]
+        self._appended = {}
+        # Names of each folder from the flat listing (folder key -> set), and the
+        # key of the listed folder: folders below it without an entry are empty
+        self._listed = {}
+        self._listed_root = None
+        # Folders listed since: their names are in DestinationFolders, or stale
+        self._handed_out = set()
+        # Key -> full digest found by partial_digest in the object's metadata
+        self._digests = {}
+        self._call('head_bucket', self.root)
+
+    # Paths and errors
+
+    def _key(self, path):
+        path = path.replace('\\', '/')
+        if path != self.root and not path.startswith(self.root + '/'):
+            raise ValueError(f"{path!r} is not below {self.root!r}")
+        relative = path[len(self.root):].strip('/')
+        return f"{self.prefix}/{relative}" if self.prefix and relative else (self.prefix or relative)
+
+    def _path(self, key):
+        relative = key[len(self.prefix):].lstrip('/') if self.prefix else key
+        return f"{self.root}/{relative}"
+
+    def owns(self, path):
+        """True for a path of this storage, False for a local one"""
+        path = path.replace('\\', '/')
+        return path == self.root or path.startswith(self.root + '/')
+
+    def _count(self, operation):
+        with self._lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+
+    @contextmanager
+    def _translated(self, path):
+        """Raise botocore errors as the OSError a local file would give"""
+        try:
+            yield
+        except self._errors as e:
+            error = getattr(e, 'response', {}).get('Error', {})
+            status = getattr(e, 'response', {}).get('ResponseMetadata', {}).get('HTTPStatusCode')
+            if status == 404 or error.get('Code') in ('404', 'NoSuchKey', 'NoSuchBucket'):
+                raise FileNotFoundError(errno.ENOENT, str(e), path) from e
+            if status == 403 or error.get('Code') == 'AccessDenied':
+                raise PermissionError(errno.EACCES, str(e), path) from e
+            raise OSError(errno.EIO, str(e), path) from e
+
+    def _call(self, operation, path, **parameters):
+        self._count(operation)
+        with self._translated(path):
+            return getattr(self.client, operation)(Bucket=self.bucket, **parameters)
+
+    def _list(self, path, **parameters):
+        """Pages of list_objects_v2 (up to 1000 objects each)"""
+        paginator = self.client.get_paginator('list_objects_v2')
+        with self._translated(path):
+            for page in paginator.paginate(Bucket=self.bucket, **parameters):
+                self._count('list_objects_v2')
+                yield page
+
+    # Folders and listing
+
+    def isdir(self, folder):
+        # Prefixes exist as soon as an object is below them
+        return True
+
+    def makedirs(self, folder):
+        pass
+
+    def _from_listing(self, key):
+        """Names of a folder from the flat listing, only the first time it is asked for"""
+        with self._lock:
+            root = self._listed_root
+            if root is None or key in self._handed_out:
+                return None
+            if root and key != root and not key.startswith(root + '/'):
+                return None
+            self._handed_out.add(key)
+            return list(self._listed.pop(key, ()))
+
+    def listdir(self, folder):
+        """Names of the objects and sub-prefixes directly below `folder`"""
+        key = self._key(folder)
+        names = self._from_listing(key)
+        if names is not None:
+            return names
+        prefix = key + '/' if key else ''
+        names = []
+        for page in self._list(folder, Prefix=prefix, Delimiter='/'):
+            names.extend(item['Key'][len(prefix):] for item in page.get('Contents', ()))
+            names.extend(item['Prefix'][len(prefix):].rstrip('/') for item in page.get('CommonPrefixes', ()))
+        return names
+
+    def exists(self, path):
+        try:
+            self._call('head_object', path, Key=self._key(path))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def iter_files(self, folder, extensions, skip_hidden=True, skip_dirs=(), **options):
+        """
+        FileRef of every object below `folder` with one of `extensions`, listed
+        flat. Once the listing is complete, `listdir` answers from it.
+        """
+        key = self._key(folder)
+        prefix = key + '/' if key else ''
+        suffixes = tuple(extension.lower() for extension in extensions)
+        skipped = tuple(self._key(path) + '/' for path in skip_dirs if self.owns(path))
+        # Folder key -> names of its objects and sub-prefixes (None once too many)
+        listed = {}
+        count = 0
+        for page in self._list(folder, Prefix=prefix):
+            for item in page.get('Contents', ()):
+                name = item['Key']
+                if listed is not None:
+                    count += 1
+                    if count > MAX_LISTED_NAMES:
+                        listed = None
+                    else:
+                        # The object in its folder, and each folder in its parent
+                        child = name
+                        while len(child) > len(key):
+                            parent, _, base = child.rpartition('/')
+                            names = listed.setdefault(parent, set())
+                            if base in names:
+                                break
+                            names.add(base)
+                            child = parent
+                if not name.lower().endswith(suffixes) or name.startswith(skipped):
+                    continue
+                if skip_hidden and any(part.startswith('.') for part in name[len(prefix):].split('/')):
+                    continue
+                yield FileRef(self._path(name), ObjectStat(item['Size'], item['LastModified'].timestamp()))
+        if listed is not None:
+            with self._lock:
+                self._listed = listed
+                self._handed_out = set()
+                self._listed_root = key
+
+    # Writes
+
+    def _upload(self, src, dst):
+        """Read `src` once, hash it and upload it, return (method, digest)"""
+        key = self._key(dst)
+        st = os.stat(src)
+        metadata = {MTIME_METADATA: repr(st.st_mtime)}
+        if st.st_size < self.multipart_threshold:
+            # Hashed first, then streamed from the file: a worker never holds it whole
+            digest, md5 = _file_digests(src)
+            metadata[DIGEST_METADATA] = digest
+            if st.st_size > PARTIAL_COVERS_ALL:
+                metadata[PARTIAL_DIGEST_METADATA] = partial_digest(src, st.st_size)
+            with open(src, 'rb') as f:
+                self._call('put_object', dst, Key=key, Body=f, ContentMD5=md5, Metadata=metadata)
+            return METHOD_UPLOAD, digest
+        metadata[PARTIAL_DIGEST_METADATA] = partial_digest(src, st.st_size)
+        return METHOD_MULTIPART, self._upload_parts(src, dst, key, st.st_size, metadata)
+
+    def _upload_parts(self, src, dst, key, size, metadata):
+        """Multipart upload of a large file; the digest is only known at the end, so not in its metadata"""
+        part_size = max(self.part_size, -(-size // MAX_PARTS))
+        upload_id = self._call('create_multipart_upload', dst, Key=key, Metadata=metadata)['UploadId']
+        hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        # Parts in flight for this file: bounds the memory to `workers` parts
+        slots = threading.BoundedSemaphore(self.workers)
+        failures = []
+        futures = []
+
+        def upload_part(number, data):
+            try:
+                response = self._call('upload_part', dst, Key=key, UploadId=upload_id, PartNumber=number,
+                                      Body=data, ContentMD5=_content_md5(data))
+                return {'ETag': response['ETag'], 'PartNumber': number}
+            except BaseException as e:
+                failures.append(e)
+                raise
+            finally:
+                slots.release()
+
+        try:
+            with open(src, 'rb') as f:
+                number = 0
+                while not failures:
+                    data = f.read(part_size)
+                    if not data:
+                        break
+                    hasher.update(data)
+                    number += 1
+                    slots.acquire()
+                    futures.append(self._pool.submit(upload_part, number, data))
+            parts = [future.result() for future in futures]
+            self._call('complete_multipart_upload', dst, Key=key, UploadId=upload_id,
+                       MultipartUpload={'Parts': parts})
+        except BaseException:
+            for future in futures:
+                if not future.cancel():
+                    # Being sent: it could land after the abort and be kept (and billed)
+                    future.exception()
+            try:
+                self._call('abort_multipart_upload', dst, Key=key, UploadId=upload_id)
+            except OSError:
+                pass
+            raise
+        return hasher.hexdigest()
+
+    def copy(self, src, dst, hardlink=False, checked=False, read_back=False):
+        """
+        Upload a local file, return (method, digest). Every upload is hashed
+        and checked by the server (Content-MD5), whatever `checked` and
+        `read_back`; hard links do not exist here.
+        """
+        return self._upload(src, dst)
+
+    def move(self, src, dst):
+        """Upload a local file, then delete it once the object is complete"""
+        method, digest = self._upload(src, dst)
+        os.remove(src)
+        return method, digest
+
+    def rename(self, src, dst):
+        """Server-side copy (in parts for large objects), then delete the original"""
+        source = {'Bucket': self.bucket, 'Key': self._key(src)}
+        self._count('copy')
+        with self._translated(src):
+            self.client.copy(source, self.bucket, self._key(dst), Config=self._transfer)
+        self._call('delete_object', src, Key=source['Key'])
+
+    # Digests
+
+    def partial_digest(self, path, size=None, cache=None):
+        """Same as hashing.partial_digest: from the metadata of an object if it has it, else ranged GETs"""
+        if not self.owns(path):
+            return partial_digest(path, size, cache)
+        key = self._key(path)
+        head = self._call('head_object', path, Key=key)
+        metadata = head.get('Metadata', {})
+        size = head['ContentLength']
+        digest = metadata.get(DIGEST_METADATA)
+        if digest:
+            # Asked for next when the partial digests match: no second HEAD
+            with self._lock:
+                if len(self._digests) >= MAX_PENDING_DIGESTS:
+                    self._digests.clear()
+                self._digests[key] = digest
+        partial = metadata.get(PARTIAL_DIGEST_METADATA)
+        if partial is None and digest and size <= PARTIAL_COVERS_ALL:
+            partial = digest
+        if partial:
+            return partial
+        hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        if not size:
+            # A range of an empty object is an error
+            ranges = []
+        elif size <= PARTIAL_COVERS_ALL:
+            ranges = ['bytes=0-']
+        else:
+            ranges = [f'bytes=0-{PARTIAL_BLOCK - 1}', f'bytes=-{PARTIAL_BLOCK}']
+        for byte_range in ranges:
+            response = self._call('get_object', path, Key=key, Range=byte_range)
+            with self._translated(path):
+                hasher.update(response['Body'].read())
+        return hasher.hexdigest()
+
+    def full_digest(self, path, cache=None):
+        """Same as hashing.full_digest: from the metadata of an object if it has it, else read back"""
+        if not self.owns(path):
+            return full_digest(path, cache)
+        key = self._key(path)
+        with self._lock:
+            digest = self._digests.pop(key, None)
+        if digest is None:
+            digest = self._call('head_object', path, Key=key).get('Metadata', {}).get(DIGEST_METADATA)
+        if digest:
+            return digest
+        hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        response = self._call('get_object', path, Key=key)
+        with self._translated(path):
+            for chunk in response['Body'].iter_chunks(FULL_BUFFER_SIZE):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def append_text(self, path, text):
+        # Objects cannot be appended to: kept until close, then written at once
+        with self._lock:
+            self._appended.setdefault(path, []).append(text)
+
+    def _write_appended(self):
+        with self._lock:
+            appended, self._appended = self._appended, {}
+        for path, texts in appended.items():
+            key = self._key(path)
+            try:
+                response = self._call('get_object', path, Key=key)
+                with self._translated(path):
+                    existing = response['Body'].read()
+            except FileNotFoundError:
+                existing = b''
+            data = existing + ''.join(texts).encode('utf-8')
+            self._call('put_object', path, Key=key, Body=data, ContentMD5=_content_md5(data))
+
+    def describe(self):
+        with self._lock:
+            requests = dict(self.requests)
+        return {'backend': 's3', 'bucket': self.bucket, 'prefix': self.prefix,
+                'endpoint': self.endpoint_url, 'requests': requests}
+
+    def close(self):
+        """Write the appended texts and stop the upload threads"""
+        try:
+            self._write_appended()
+        finally:
+            self._pool.shutdown()
+
+
+def open_storage(destination, endpoint_url=None, workers=DEFAULT_UPLOAD_WORKERS, connections=None):
+    """
+    Backend of a destination: S3Storage for 's3://bucket/prefix', LocalStorage otherwise.
+    Raises ImportError if boto3 is missing, OSError if the bucket cannot be reached.
+    """
+    if is_remote(destination):
+        return S3Storage(destination, endpoint_url, workers, connections)
+    return LocalStorage()
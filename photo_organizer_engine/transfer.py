@@ -0,0 +1,295 @@
+"""
+Copy and move backends
+
+Copies let the kernel move the data whenever it can, fastest first:
+
+1. reflink (FICLONE ioctl): btrfs/XFS share the blocks, nothing is copied
+2. os.copy_file_range: in-kernel copy, server-side on NFS 4.2 / SMB3
+3. os.sendfile: in-kernel copy between two files on older kernels
+4. shutil.copyfileobj: portable user-space fallback (Windows, macOS...)
+
+Each fast path that the platform or the filesystem rejects is remembered
+and not retried. Metadata is preserved like `shutil.copy2` does. A hard
+link mode makes "keep originals" free when source and destination are on
+the same filesystem.
+
+With checksums, copies go through user space instead, hashing the data
+as it streams through one buffer, optionally read back from the disk
+(`copy_checked`): the digest then feeds the checksum files (see
+checksums.py) and the duplicate index.
+
+Moves are a plain rename when the source and destination folders are on
+the same filesystem (checked once per folder), so no data moves at all.
+Across filesystems, the file is copied in user space while it is hashed,
+flushed to disk, read back and compared, renamed into place, and only
+then is the source deleted: a crash at any point leaves at least one
+complete copy.
+
+Files are always written under a temporary name and renamed into place
+(see journal.py), so a final name never holds a partial file.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import sys
+import threading
+
+from .hashing import DIGEST_SIZE, full_digest, thread_buffer
+from .journal import PARTIAL_SUFFIX
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+# Bytes per copy_file_range/sendfile call
+CHUNK_SIZE = 64 * 1024 * 1024
+
+METHOD_REFLINK = 'reflink'
+METHOD_COPY_FILE_RANGE = 'copy_file_range'
+METHOD_SENDFILE = 'sendfile'
+METHOD_USERSPACE = 'userspace'
+METHOD_HARDLINK = 'hardlink'
+METHOD_RENAME = 'rename'
+# Copy hashed on the way, then read back and compared
+METHOD_VERIFIED = 'verified'
+# Copy hashed on the way only
+METHOD_HASHED = 'hashed'
+
+# Errors meaning "this fast path is not available here", not a real failure
+_UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP,
+                errno.ENOTTY, errno.EBADF, errno.EPERM, errno.ETXTBSY}
+
+_IS_LINUX = sys.platform.startswith('linux')
+_state_lock = threading.Lock()
+# (source device, destination device) pairs where a method already failed
+_unsupported = set()
+# Folder -> device, to decide once per folder whether a rename is possible
+_folder_devices = {}
+
+
+class VerificationError(OSError):
+    """A copy does not read back with the content of its source"""
+
+
+def _supported(method, devices):
+    return (method, devices) not in _unsupported
+
+
+def _mark_unsupported(method, devices):
+    with _state_lock:
+        _unsupported.add((method, devices))
+
+
+def _kernel_loop(function, src_fd, dst_fd, size):
+    """Run copy_file_range/sendfile until `size` bytes are copied"""
+    offset = 0
+    while offset < size:
+        count = min(CHUNK_SIZE, size - offset)
+        if function is os.sendfile:
+            sent = os.sendfile(dst_fd, src_fd, offset, count)
+        else:
+            sent = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+        if sent == 0:
+            break
+        offset += sent
+    return offset
+
+
+def copy_data(fsrc, fdst):
+    """Copy the content of open file `fsrc` into empty file `fdst`, return the method used"""
+    src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+    src_st = os.fstat(src_fd)
+    devices = (src_st.st_dev, os.fstat(dst_fd).st_dev)
+
+    if _IS_LINUX:
+        if fcntl is not None and _supported(METHOD_REFLINK, devices):
+            try:
+                fcntl.ioctl(dst_fd, FICLONE, src_fd)
+                return METHOD_REFLINK
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                _mark_unsupported(METHOD_REFLINK, devices)
+
+        for method, function in ((METHOD_COPY_FILE_RANGE, getattr(os, 'copy_file_range', None)),
+                                 (METHOD_SENDFILE, getattr(os, 'sendfile', None))):
+            if function is None or not _supported(method, devices):
+                continue
+            try:
+                copied = _kernel_loop(function, src_fd, dst_fd, src_st.st_size)
+            except OSError as e:
+                # Only fall back if nothing was written yet
+                if e.errno not in _UNSUPPORTED or os.fstat(dst_fd).st_size:
+                    raise
+                _mark_unsupported(method, devices)
+                continue
+            if copied == src_st.st_size:
+                return method
+            # Short copy (file changed, special filesystem): redo in user space
+            os.ftruncate(dst_fd, 0)
+            os.lseek(dst_fd, 0, os.SEEK_SET)
+            os.lseek(src_fd, 0, os.SEEK_SET)
+            break
+
+    shutil.copyfileobj(fsrc, fdst, 4 * 1024 * 1024)
+    return METHOD_USERSPACE
+
+
+def copy_file(src, dst):
+    """Copy data and metadata like shutil.copy2, through the fastest backend"""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        method = copy_data(fsrc, fdst)
+    shutil.copystat(src, dst)
+    return method
+
+
+def copy_atomic(src, dst, hardlink=False):
+    """
+    Copy `src` to `dst` via a temporary name, return the method used.
+
+    With `hardlink`, `dst` becomes a hard link to `src` when both are on the
+    same filesystem (no data is written at all); otherwise it is copied.
+    """
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return METHOD_HARDLINK
+        except OSError:
+            pass
+
+    partial = dst + PARTIAL_SUFFIX
+    try:
+        method = copy_file(src, partial)
+        os.replace(partial, dst)
+    except BaseException:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        raise
+    return method
+
+
+def folder_device(folder):
+    device = _folder_devices.get(folder)
+    if device is None:
+        device = os.stat(folder).st_dev
+        with _state_lock:
+            _folder_devices[folder] = device
+    return device
+
+
+def same_filesystem(src, dst):
+    """True if `src` and `dst` are in folders of the same filesystem (`dst` need not exist)"""
+    return folder_device(os.path.dirname(src)) == folder_device(os.path.dirname(dst))
+
+
+def copy_hashed(src, dst, sync=True):
+    """
+    Copy `src` to `dst` through the thread's read buffer, digesting the data
+    on the way, and flush it to disk if `sync`. Returns the digest (see hashing.py).
+    """
+    hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    buffer = thread_buffer()
+    view = memoryview(buffer)
+    with open(src, 'rb', buffering=0) as fsrc, open(dst, 'wb') as fdst:
+        while True:
+            n = fsrc.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+            fdst.write(view[:n])
+        if sync:
+            fdst.flush()
+            os.fsync(fdst.fileno())
+    shutil.copystat(src, dst)
+    return hasher.hexdigest()
+
+
+def read_back_digest(path):
+    """Digest of `path` read from the disk rather than from the page cache where possible"""
+    if hasattr(os, 'posix_fadvise'):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            # Flushed pages are dropped, so they are read again from the device
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return full_digest(path)
+
+
+def sync_folder(folder):
+    """Make the renames in `folder` durable (POSIX only)"""
+    if os.name != 'posix':
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def copy_checked(src, dst, hardlink=False, read_back=False):
+    """
+    copy_atomic in a single hashed pass, return (method, digest).
+
+    With `read_back`, the copy is flushed, read again from the disk and
+    compared before it gets its final name. A hard link has no digest.
+    """
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return METHOD_HARDLINK, None
+        except OSError:
+            pass
+
+    partial = dst + PARTIAL_SUFFIX
+    try:
+        digest = copy_hashed(src, partial, sync=read_back)
+        if read_back and read_back_digest(partial) != digest:
+            raise VerificationError(errno.EIO, "the copy does not match its source", dst)
+        os.replace(partial, dst)
+    except BaseException:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        raise
+    return (METHOD_VERIFIED if read_back else METHOD_HASHED), digest
+
+
+def move_verified(src, dst):
+    """Move across filesystems: hashed copy, read back, rename, then delete the source"""
+    partial = dst + PARTIAL_SUFFIX
+    try:
+        digest = copy_hashed(src, partial)
+        if read_back_digest(partial) != digest:
+            raise VerificationError(errno.EIO, "the copy does not match its source", dst)
+        os.replace(partial, dst)
+    except BaseException:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        raise
+    sync_folder(os.path.dirname(dst))
+    os.remove(src)
+    return METHOD_VERIFIED
+
+
+def move_file(src, dst):
+    """Rename on the same filesystem, otherwise a verified copy then delete the source"""
+    if same_filesystem(src, dst):
+        try:
+            os.rename(src, dst)
+            return METHOD_RENAME
+        except OSError as e:
+            # Same device number but still separate (bind mounts, btrfs subvolumes)
+            if e.errno != errno.EXDEV:
+                raise
+    return move_verified(src, dst)
@@ -0,0 +1,139 @@
+"""
+Translations shared by the graphical interface and the command line
+"""
+
+# Translation dictionaries
+TRANSLATIONS = {
+    'en': {
+        # Months
+        'months': {
+            1: "January", 2: "February", 3: "March", 4: "April",
+            5: "May", 6: "June", 7: "July", 8: "August", 
+            9: "September", 10: "October", 11: "November", 12: "December"
+        },
+        # Interface
+        'app_title': "📸 Photo Organizer - Simple and Efficient",
+        'app_subtitle': "Sort your photos automatically by date in just a few clicks",
+        'folders_section': " 📁 Folder Selection ",
+        'source_label': "🔍 Folder containing your photos:",
+        'source_help': "(All photos will be found automatically, even in subfolders)",
+        'dest_label': "💾 Folder to save sorted photos:",
+        'dest_help': "(Photos will be organized by year then by month)",
+        'choose_button': "📂 Choose",
+        'options_section': " ⚙️ Processing Options ",
+        'sort_option': "📅 Sort photos by date",
+        'sort_help_on': "✓ Will create folders by year (e.g.: 2023, 2024) then by month (e.g.: January, February)",
+        'sort_help_off': "○ All photos will be placed directly in the destination folder",
+        'copy_option': "📋 Keep original photos",
+        'copy_help_on': "✓ Original photos remain in their current folder (recommended for safety)",
+        'copy_help_off': "○ Photos will be moved (deleted from their current location)",
+        'organize_button': "🚀 ORGANIZE MY PHOTOS",
+        'organize_processing': "⏳ Processing...",
+        'language_label': "🌍 Language:",
+        # Status
+        'status_ready': "✨ Ready to organize your photos!",
+        'status_source_selected': "📁 Source folder selected",
+        'status_dest_selected': "💾 Destination folder selected",
+        'status_searching': "🔍 Searching for photos...",
+        'status_scanning': "🔍 Searching for photos... {} found in {} folders",
+        'status_found': "📊 {} photos found - Processing...",
+        'status_processing': "📸 Processing... {}/{} photos",
+        'status_speed': "⚡ {:.0f} photos/s - {:.1f} MB/s",
+        'status_speed_eta': "⚡ {:.0f} photos/s - {:.1f} MB/s - about {} remaining",
+        'status_done_success': "🎉 Done! {} photos organized successfully",
+        'status_done_duplicates': "✅ Done! {} new photos, {} duplicates ignored",
+        'status_done_errors': "✅ Done! {} photos processed, {} duplicates ignored, {} errors",
+        # Messages
+        'error_folders': "Please select source and destination folders",
+        'error_source_missing': "Source folder does not exist",
+        'error_s3_missing': "S3 destinations need boto3: pip install photo-organizer[s3]",
+        'error_destination_unreachable': "The destination bucket cannot be reached",
+        'error_remote_local_only': "Planning and near-duplicate detection need a local destination folder",
+        'info_no_photos': "No photos found in source folder",
+        'error_unexpected': "An unexpected error stopped the organization",
+        'success_title': "🎉 Success",
+        'success_message': "Organization completed!\n\n{}\n\n📁 Your photos are in: {}",
+        'warning_title': "⚠️ Completed with warnings", 
+        'warning_message': "Organization completed!\n\n{}",
+        'photos_organized': "✅ {} photos organized",
+        'duplicates_ignored': "🔄 {} duplicates ignored",
+        'errors_found': "⚠️ {} errors",
+        'errors_report': "Details in {}",
+        # Dialogs
+        'choose_source_title': "Choose folder containing your photos",
+        'choose_dest_title': "Choose destination folder",
+        'unknown_folder': "Unknown",
+        'review_folder': "Near duplicates to review"
+    },
+    'fr': {
+        # Months
+        'months': {
+            1: "Janvier", 2: "Février", 3: "Mars", 4: "Avril",
+            5: "Mai", 6: "Juin", 7: "Juillet", 8: "Août",
+            9: "Septembre", 10: "Octobre", 11: "Novembre", 12: "Décembre"
+        },
+        # Interface
+        'app_title': "📸 Organisateur de Photos - Simple et Efficace",
+        'app_subtitle': "Triez automatiquement vos photos par date en quelques clics",
+        'folders_section': " 📁 Sélection des dossiers ",
+        'source_label': "🔍 Dossier contenant vos photos:",
+        'source_help': "(Toutes les photos seront trouvées automatiquement, même dans les sous-dossiers)",
+        'dest_label': "💾 Dossier où sauvegarder les photos triées:",
+        'dest_help': "(Les photos seront organisées par année puis par mois)",
+        'choose_button': "📂 Choisir",
+        'options_section': " ⚙️ Options de traitement ",
+        'sort_option': "📅 Trier les photos par date",
+        'sort_help_on': "✓ Créera des dossiers par année (ex: 2023, 2024) puis par mois (ex: Janvier, Février)",
+        'sort_help_off': "○ Toutes les photos seront placées directement dans le dossier de destination",
+        'copy_option': "📋 Conserver les photos originales",
+        'copy_help_on': "✓ Les photos originales restent dans leur dossier actuel (recommandé pour la sécurité)",
+        'copy_help_off': "○ Les photos seront déplacées (supprimées de leur emplacement actuel)",
+        'organize_button': "🚀 ORGANISER MES PHOTOS",
+        'organize_processing': "⏳ Traitement en cours...",
+        'language_label': "🌍 Langue:",
+        # Status
+        'status_ready': "✨ Prêt à organiser vos photos !",
+        'status_source_selected': "📁 Dossier source sélectionné",
+        'status_dest_selected': "💾 Dossier de destination sélectionné",
+        'status_searching': "🔍 Recherche des photos...",
+        'status_scanning': "🔍 Recherche des photos... {} trouvées dans {} dossiers",
+        'status_found': "📊 {} photos trouvées - Traitement en cours...",
+        'status_processing': "📸 Traitement... {}/{} photos",
+        'status_speed': "⚡ {:.0f} photos/s - {:.1f} Mo/s",
+        'status_speed_eta': "⚡ {:.0f} photos/s - {:.1f} Mo/s - environ {} restant",
+        'status_done_success': "🎉 Terminé ! {} photos organisées avec succès",
+        'status_done_duplicates': "✅ Terminé ! {} nouvelles photos, {} doublons ignorés",
+        'status_done_errors': "✅ Terminé ! {} photos traitées, {} doublons ignorés, {} erreurs",
+        # Messages
+        'error_folders': "Veuillez sélectionner les dossiers source et destination",
+        'error_source_missing': "Le dossier source n'existe pas",
+        'error_s3_missing': "Les destinations S3 nécessitent boto3 : pip install photo-organizer[s3]",
+        'error_destination_unreachable': "Le bucket de destination est inaccessible",
+        'error_remote_local_only': "La planification et la détection des quasi-doublons nécessitent un dossier de destination local",
+        'info_no_photos': "Aucune photo trouvée dans le dossier source",
+        'error_unexpected': "Une erreur inattendue a interrompu l'organisation",
+        'success_title': "🎉 Succès",
+        'success_message': "Organisation terminée !\n\n{}\n\n📁 Vos photos sont dans: {}",
+        'warning_title': "⚠️ Terminé avec avertissements",
+        'warning_message': "Organisation terminée !\n\n{}",
+        'photos_organized': "✅ {} photos organisées",
+        'duplicates_ignored': "🔄 {} doublons ignorés", 
+        'errors_found': "⚠️ {} erreurs",
+        'errors_report': "Détails dans {}",
+        # Dialogs
+        'choose_source_title': "Choisir le dossier contenant vos photos",
+        'choose_dest_title': "Choisir le dossier de destination",
+        'unknown_folder': "Inconnu",
+        'review_folder': "Quasi-doublons à vérifier"
+    }
+}
+
+
+def get_translations(lang):
+    """Return the translation table for a language (English by default)"""
+    return TRANSLATIONS.get(lang, TRANSLATIONS['en'])
+
+
+def get_month_names(lang):
+    """Return the month number -> month name mapping for a language"""
+    return get_translations(lang)['months']
@@ -0,0 +1,186 @@
+"""
+Creation date of MP4/MOV clips, from their box headers
+
+MP4, MOV, M4V and 3GP files are ISO-BMFF: a tree of size/type boxes (see
+containers.py). The media data ('mdat', gigabytes for a long clip) is a
+single box that is skipped with one seek, so a clip is dated with a dozen
+small reads whether 'moov' comes before or after it. Only the headers of
+the 'moov' children are read (the sample tables of the 'trak' boxes are
+skipped too), then a few bytes of the date itself, in order of preference:
+
+- moov/meta: `com.apple.quicktime.creationdate` (iPhone), local time of capture
+- moov/udta: QuickTime `©day` text, or its iTunes-style moov/udta/meta/ilst form
+- moov/mvhd: creation_time, seconds since 1904 in UTC, converted to local time
+
+The first two are the wall-clock time of the camera, like EXIF dates.
+`mvhd` is written by every encoder but is often zero or the time of a
+re-encode, so it only comes last.
+"""
+
+import struct
+from datetime import datetime
+
+from .containers import iter_boxes
+from .exif import parse_iso_datetime
+
+# Files dated by this module
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.mov', '.m4v', '.3gp'})
+
+# Seconds between 1904-01-01 (QuickTime epoch) and 1970-01-01
+QUICKTIME_EPOCH_OFFSET = 2082844800
+# Anything older is an unset clock, not a capture date
+MIN_YEAR = 1970
+
+# Sanity limits against corrupt or hostile files
+MAX_TEXT_SIZE = 256
+MAX_KEYS_SIZE = 64 * 1024
+
+KEY_CREATION_DATE = b'com.apple.quicktime.creationdate'
+# Type of the 'data' box holding UTF-8 text
+DATA_TYPE_UTF8 = 1
+# Types of the first box of a clip (old QuickTime files may not start with 'ftyp')
+FIRST_BOXES = (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot')
+
+
+def _find(f, start, end, box_type):
+    """(payload offset, payload size) of the first child box of this type, or None"""
+    for child_type, payload, size in iter_boxes(f, start, end):
+        if child_type == box_type:
+            return payload, size
+    return None
+
+
+def _read(f, offset, size, limit):
+    if size > limit:
+        return None
+    f.seek(offset)
+    return f.read(size)
+
+
+def parse_video_datetime(value):
+    """ISO 8601 date of a metadata item (see exif.parse_iso_datetime), None if invalid or unset"""
+    date = parse_iso_datetime(value)
+    return date if date is not None and date.year >= MIN_YEAR else None
+
+
+def _data_text(f, payload, size):
+    """Text of an iTunes-style 'data' box (type, locale, then the value)"""
+    data = _read(f, payload, size, MAX_TEXT_SIZE)
+    if data is None or len(data) < 8:
+        return None
+    data_type, = struct.unpack_from('>I', data)
+    if data_type & 0xFFFFFF != DATA_TYPE_UTF8:
+        return None
+    return data[8:].decode('utf-8', 'replace')
+
+
+def _mdta_date(f, payload, size):
+    """com.apple.quicktime.creationdate of a moov/meta box (keys + ilst)"""
+    end = payload + size
+    # QuickTime 'meta' is a plain box, the ISO one is a full box (version + flags)
+    f.seek(payload + 4)
+    start = payload if f.read(4) == b'hdlr' else payload + 4
+    keys = _find(f, start, end, b'keys')
+    items = _find(f, start, end, b'ilst')
+    if keys is None or items is None:
+        return None
+    data = _read(f, keys[0], keys[1], MAX_KEYS_SIZE)
+    if data is None or len(data) < 8:
+        return None
+    count, = struct.unpack_from('>I', data, 4)
+    index = None
+    position = 8
+    for number in range(1, count + 1):
+        if position + 8 > len(data):
+            return None
+        key_size, = struct.unpack_from('>I', data, position)
+        if key_size < 8:
+            return None
+        if data[position + 8:position + key_size] == KEY_CREATION_DATE:
+            index = number
+            break
+        position += key_size
+    if index is None:
+        return None
+    # Items are boxes whose type is the 1-based key index
+    item = _find(f, items[0], items[0] + items[1], struct.pack('>I', index))
+    if item is None:
+        return None
+    value = _find(f, item[0], item[0] + item[1], b'data')
+    return parse_video_datetime(_data_text(f, *value)) if value is not None else None
+
+
+def _udta_date(f, payload, size):
+    """©day of a moov/udta box, QuickTime text or iTunes-style metadata"""
+    end = payload + size
+    for child_type, child, child_size in iter_boxes(f, payload, end):
+        if child_type == b'\xa9day':
+            data = _read(f, child, child_size, MAX_TEXT_SIZE)
+            if data is None or len(data) < 4:
+                return None
+            # 16-bit length, 16-bit language, then the text
+            length, = struct.unpack_from('>H', data)
+            return parse_video_datetime(data[4:4 + length].decode('utf-8', 'replace'))
+        if child_type == b'meta':
+            # Full box holding hdlr and ilst: ilst/©day/data
+            found = (child + 4, child_size - 4)
+            for box_type in (b'ilst', b'\xa9day', b'data'):
+                found = _find(f, found[0], found[0] + found[1], box_type)
+                if found is None:
+                    break
+            else:
+                return parse_video_datetime(_data_text(f, *found))
+    return None
+
+
+def _mvhd_date(f, payload, size):
+    """creation_time of the movie header, in local time"""
+    data = _read(f, payload, min(size, 12), 12)
+    if data is None or len(data) < 8:
+        return None
+    if data[0] == 1:
+        if len(data) < 12:
+            return None
+        seconds, = struct.unpack_from('>Q', data, 4)
+    else:
+        seconds, = struct.unpack_from('>I', data, 4)
+    if not seconds:
+        return None
+    try:
+        date = datetime.fromtimestamp(seconds - QUICKTIME_EPOCH_OFFSET)
+    except (OverflowError, OSError, ValueError):
+        return None
+    return date if date.year >= MIN_YEAR else None
+
+
+def find_video_date(f):
+    """Creation date of the clip in an open ISO-BMFF file, or None"""
+    f.seek(4)
+    if f.read(4) not in FIRST_BOXES:
+        return None
+    moov = _find(f, 0, None, b'moov')
+    if moov is None:
+        return None
+    payload, size = moov
+    headers = {}
+    for box_type, child, child_size in iter_boxes(f, payload, payload + size):
+        if box_type in (b'mvhd', b'udta', b'meta') and box_type not in headers:
+            headers[box_type] = (child, child_size)
+    for box_type, read in ((b'meta', _mdta_date), (b'udta', _udta_date), (b'mvhd', _mvhd_date)):
+        if box_type in headers:
+            date = read(f, *headers[box_type])
+            if date is not None:
+                return date
+    return None
+
+
+def read_video_date(filepath):
+    """
+    Creation date of an MP4/MOV clip, from its box headers only.
+    Returns None when the file has no usable date; never raises for malformed files.
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            return find_video_date(f)
+    except (OSError, ValueError, IndexError, struct.error, UnicodeError):
+        return None
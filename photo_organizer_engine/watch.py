@@ -0,0 +1,518 @@
+"""
+Watch mode: organize photos as soon as they land in the source folders
+
+Instead of walking the whole source again for every new batch of photos,
+the source folders are scanned once at startup and then watched:
+
+- Linux: inotify reports files closed after writing (IN_CLOSE_WRITE) and
+  files renamed into place (IN_MOVED_TO), and new folders are watched as
+  soon as they appear. Nothing is listed again, whatever the size of the
+  source, unless the kernel event queue overflows.
+- Elsewhere (or with `poll_interval`): the folders are stat'ed at every
+  interval and only those whose modification time changed are listed.
+
+A file is only organized once complete: closed (inotify only) and with
+the same size and modification time for `settle` seconds. Files never
+seen closed (hard links, files found by polling or in a folder created
+before it was watched) must also be left alone for `IDLE_SECONDS`. Complete files go through the same
+date, duplicate and copy steps as a normal run, in small batches, so a
+photo is organized about a second after it was dropped.
+"""
+
+import ctypes
+import errno
+import os
+import select
+import stat
+import struct
+import sys
+import threading
+import time
+from itertools import chain
+
+from .cache import open_cache
+from .checksums import ChecksumWriter
+from .dates import DateResolver
+from .dedupe import DestinationIndex
+from .engine import (
+    PHOTO_EXTENSIONS, OrganizeError, OrganizeResult, close_destination, destination_writers,
+    get_destination_folder, iter_photos, open_destination, transfer_file, write_report,
+    STAGE_SEARCHING, STAGE_PROCESSING, STAGE_WATCHING, STAGE_DONE,
+)
+from .folders import DestinationFolders
+from .hashing import thread_bytes_read
+from .metrics import STAGE_DATE, STAGE_INDEX
+from .pipeline import Pipeline, default_copy_workers, default_metadata_workers
+from .scanner import SYSTEM_FOLDERS, FileRef, compile_excludes
+
+# Seconds a closed file must stay unchanged before it is organized
+DEFAULT_SETTLE = 0.5
+# Also required of files whose end of writing was not seen
+IDLE_SECONDS = 2.0
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_POLL_INTERVAL = 1.0
+# Longest wait for events, so that `stop` is noticed quickly
+WAKE_INTERVAL = 0.5
+# A folder modified this recently is listed again at the next poll: its
+# modification time may not change for files added within the same tick
+MTIME_GRANULARITY = 2.0
+
+WATCHER_INOTIFY = 'inotify'
+WATCHER_POLLING = 'polling'
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR | IN_EXCL_UNLINK
+_EVENT = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+
+class PathFilter:
+    """Which folders are watched and which files are photos, with the scanner rules"""
+
+    def __init__(self, config):
+        self.suffixes = tuple(ext.lower() for ext in PHOTO_EXTENSIONS)
+        self.excluded = compile_excludes(config.exclude)
+        self.skip_hidden = config.skip_hidden
+        # A destination inside a source is never watched
+        self.skipped = {os.path.normcase(os.path.abspath(config.dest_folder))}
+
+    def _excluded(self, root, path, name):
+        if self.skip_hidden and (name.startswith('.') or name.lower() in SYSTEM_FOLDERS):
+            return True
+        return self.excluded is not None and bool(
+            self.excluded.match(name)
+            or self.excluded.match(path[len(os.path.join(root, '')):].replace('\\', '/')))
+
+    def folder(self, root, path, name):
+        return not self._excluded(root, path, name) and os.path.normcase(path) not in self.skipped
+
+    def photo(self, root, path, name):
+        return name.lower().endswith(self.suffixes) and not self._excluded(root, path, name)
+
+
+class Watcher:
+    """Base of the watchers: `poll(timeout)` returns the photos that changed"""
+
+    name = None
+
+    def __init__(self, path_filter):
+        self.filter = path_filter
+        # (path, closed) found since the last poll
+        self.changes = []
+        # (folder, exception) that could not be watched
+        self.failures = []
+
+    def _watch(self, root, folder):
+        """Start watching `folder`, return its entries (None if it cannot be watched)"""
+        raise NotImplementedError
+
+    def _walk(self, root, folder, announce=False, closed=False):
+        """Watch `folder` and its subfolders; if `announce`, report the photos already there"""
+        stack = [folder]
+        while stack:
+            folder = stack.pop()
+            entries = self._watch(root, folder)
+            if entries is None:
+                continue
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    if self.filter.folder(root, entry.path, entry.name):
+                        stack.append(entry.path)
+                elif announce and self.filter.photo(root, entry.path, entry.name):
+                    self.changes.append((entry.path, closed))
+
+    def _take(self):
+        changes, self.changes = self.changes, []
+        return changes
+
+    def poll(self, timeout):
+        """Wait up to `timeout` seconds, return [(path, closed)] of the photos that changed"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+_libc = None
+
+
+def _inotify_libc():
+    global _libc
+    if _libc is None:
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        # Imported here: it loads subprocess, not needed unless watching
+        import ctypes.util
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(_libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+    return _libc
+
+
+class InotifyWatcher(Watcher):
+    """Linux inotify, one watch per folder"""
+
+    name = WATCHER_INOTIFY
+
+    def __init__(self, roots, path_filter):
+        super().__init__(path_filter)
+        self._libc = _inotify_libc()
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        # Watch descriptor -> (source root, folder)
+        self.folders = {}
+        self.roots = roots
+        try:
+            for root in roots:
+                self._walk(root, root)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch(self, root, folder):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            if code == errno.ENOSPC:
+                raise OSError(code, "too many folders for inotify (see fs.inotify.max_user_watches)",
+                              folder)
+            # Vanished, or not readable
+            return None
+        self.folders[wd] = (root, folder)
+        # Listed after the watch is in place, so no new file falls in between
+        try:
+            with os.scandir(folder) as iterator:
+                return list(iterator)
+        except OSError:
+            return None
+
+    def _walk_new(self, root, folder, closed):
+        try:
+            self._walk(root, folder, announce=True, closed=closed)
+        except OSError as e:
+            self.failures.append((folder, e))
+
+    def poll(self, timeout):
+        if select.select([self.fd], [], [], timeout)[0]:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                data = b''
+            self._parse(data)
+        return self._take()
+
+    def _parse(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: list everything once to catch up
+                for root in self.roots:
+                    self._walk_new(root, root, closed=False)
+                continue
+            watched = self.folders.get(wd)
+            if watched is None:
+                continue
+            if mask & IN_IGNORED:
+                # Folder deleted or unmounted
+                del self.folders[wd]
+                continue
+            root, folder = watched
+            if not name:
+                continue
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if self.filter.folder(root, path, name):
+                    # A folder moved in holds complete files; a new one is being filled
+                    self._walk_new(root, path, closed=bool(mask & IN_MOVED_TO))
+            elif self.filter.photo(root, path, name):
+                self.changes.append((path, bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))))
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher(Watcher):
+    """Portable fallback: list again only the folders whose modification time changed"""
+
+    name = WATCHER_POLLING
+
+    def __init__(self, roots, path_filter, interval=DEFAULT_POLL_INTERVAL):
+        super().__init__(path_filter)
+        self.interval = interval
+        # Folder -> (source root, modification time or None to list again, names)
+        self.folders = {}
+        for root in roots:
+            self._walk(root, root)
+        self._next_poll = time.monotonic() + interval
+
+    def _watch(self, root, folder):
+        try:
+            st = os.stat(folder)
+            with os.scandir(folder) as iterator:
+                entries = list(iterator)
+        except OSError:
+            return None
+        mtime = st.st_mtime_ns if time.time() - st.st_mtime > MTIME_GRANULARITY else None
+        self.folders[folder] = (root, mtime, {entry.name for entry in entries})
+        return entries
+
+    def poll(self, timeout):
+        wait = self._next_poll - time.monotonic()
+        if timeout is not None and wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self._next_poll = time.monotonic() + self.interval
+        for folder, (root, mtime, names) in list(self.folders.items()):
+            try:
+                if os.stat(folder).st_mtime_ns == mtime:
+                    continue
+            except OSError:
+                del self.folders[folder]
+                continue
+            entries = self._watch(root, folder)
+            if entries is None:
+                continue
+            for entry in entries:
+                if entry.name in names:
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    if entry.path not in self.folders and self.filter.folder(root, entry.path, entry.name):
+                        self._walk(root, entry.path, announce=True)
+                elif self.filter.photo(root, entry.path, entry.name):
+                    self.changes.append((entry.path, False))
+        return self._take()
+
+
+def open_watcher(roots, path_filter, poll_interval=None):
+    """inotify when available, unless `poll_interval` asks for polling"""
+    if poll_interval is None:
+        try:
+            return InotifyWatcher(roots, path_filter)
+        except OSError:
+            poll_interval = DEFAULT_POLL_INTERVAL
+    return PollingWatcher(roots, path_filter, poll_interval)
+
+
+class Debouncer:
+    """
+    Files being written, released once unchanged for `settle` seconds.
+
+    A file whose end of writing was not seen must also have been left
+    alone for `idle` seconds: unchanged since we first saw it, or not
+    modified for that long (e.g. copied with its original date).
+    """
+
+    def __init__(self, settle=DEFAULT_SETTLE, idle=IDLE_SECONDS):
+        self.settle = settle
+        self.idle = idle
+        # Path -> [next check, closed, (size, mtime_ns), since when unchanged]
+        self.pending = {}
+
+    def touch(self, path, closed, now):
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.pending.pop(path, None)
+            return
+        key = (st.st_size, st.st_mtime_ns)
+        entry = self.pending.get(path)
+        if entry is not None:
+            closed = closed or entry[1]
+            since = entry[3] if entry[2] == key else now
+        else:
+            since = now
+        self.pending[path] = [now + self.settle, closed, key, since]
+
+    def next_due(self):
+        return min((entry[0] for entry in self.pending.values()), default=None)
+
+    def ready(self, now):
+        """FileRef of every complete file"""
+        ready = []
+        for path, entry in list(self.pending.items()):
+            due, closed, key, since = entry
+            if due > now:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                del self.pending[path]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != key:
+                # Still being written
+                entry[:] = [now + self.settle, closed, current, now]
+            elif not closed and now - since < self.idle and time.time() - st.st_mtime < self.idle:
+                entry[0] = now + self.settle
+            else:
+                del self.pending[path]
+                ready.append(FileRef(path, st))
+        return ready
+
+
+def watch(config, progress=None, stop=None, settle=DEFAULT_SETTLE, batch_size=DEFAULT_BATCH_SIZE,
+          poll_interval=None, catch_up=True):
+    """
+    Organize new photos of the source folders until `stop` (a threading.Event)
+    is set or the process is interrupted (Ctrl+C), and return the OrganizeResult
+    of everything organized.
+
+    With `catch_up`, photos already in the sources are organized first.
+    `progress(stage, result)` receives STAGE_PROCESSING after each batch and
+    STAGE_WATCHING when waiting for new files; `result.watcher` tells which
+    watcher is used. The run report, if configured, is written when stopping.
+    """
+    sources = [os.path.abspath(source) for source in config.sources]
+    destination = config.dest_folder
+    if not sources or not all(config.sources) or not destination:
+        raise OrganizeError('error_folders')
+    if not all(os.path.isdir(source) for source in sources):
+        raise OrganizeError('error_source_missing')
+
+    storage = open_destination(config, config.copy_workers or default_copy_workers())
+    writers = destination_writers(destination, config.hdd_workers)
+
+    stop = stop if stop is not None else threading.Event()
+    result = OrganizeResult()
+    metrics = result.metrics
+    folders = DestinationFolders(storage=storage)
+    cache = open_cache(config.cache_path, config.cache_max_entries)
+    dates = DateResolver(config.date_sources, cache)
+    result.date_sources = dates.counts
+    path_filter = PathFilter(config)
+    checksums = ChecksumWriter(storage) if config.checksums else None
+
+    def notify(stage):
+        if progress is not None:
+            progress(stage, result)
+
+    def count(field, nbytes=0):
+        with result.lock:
+            setattr(result, field, getattr(result, field) + 1)
+            result.bytes_transferred += nbytes
+
+    def metadata(photo):
+        started = time.perf_counter()
+        folder = get_destination_folder(photo, config, dates)
+        return photo, folder, time.perf_counter() - started
+
+    def transfer(job):
+        photo, dest_folder_path, date_seconds = job
+        timings = {STAGE_DATE: date_seconds}
+        hashed = thread_bytes_read()
+        with writers:
+            method = transfer_file(photo, dest_folder_path, config, folders, index, timings=timings,
+                                   checksums=checksums, storage=storage)
+        size = photo.stat().st_size
+        metrics.file_done(photo.path, size, timings, method, thread_bytes_read() - hashed)
+        count('skipped_duplicates' if method is None else 'processed', 0 if method is None else size)
+
+    def on_error(photo, exc):
+        metrics.error(photo.path if photo is not None else None, exc)
+        count('errors')
+
+    def on_scanned(photo):
+        if photo is not None:
+            with result.lock:
+                result.total_files += 1
+
+    def process(photos, size=None):
+        # Small batches get as many threads as files, not a full pool
+        pipeline = Pipeline(
+            min(config.metadata_workers or default_metadata_workers(), size or sys.maxsize),
+            min(config.copy_workers or default_copy_workers(), size or sys.maxsize),
+            config.queue_size)
+        pipeline.run(photos, metadata=metadata, transfer=transfer, on_error=on_error,
+                     on_scanned=on_scanned)
+
+    watcher = None
+    try:
+        notify(STAGE_SEARCHING)
+        started = time.perf_counter()
+        index = DestinationIndex(cache, storage)
+        index.build(storage.iter_files(destination, PHOTO_EXTENSIONS, skip_hidden=config.skip_hidden))
+        metrics.record(STAGE_INDEX, time.perf_counter() - started)
+
+        # Watching starts before the catch-up scan, so no photo falls in between
+        watcher = open_watcher(sources, path_filter, poll_interval)
+        result.watcher = watcher.name
+        if catch_up:
+            process(chain.from_iterable(
+                iter_photos(source, exclude=config.exclude, skip_hidden=config.skip_hidden,
+                            skip_dirs=[destination], stats=result.scan)
+                for source in sources))
+            notify(STAGE_PROCESSING)
+        result.scan_complete = True
+
+        debouncer = Debouncer(settle, IDLE_SECONDS)
+        notify(STAGE_WATCHING)
+        while not stop.is_set():
+            due = debouncer.next_due()
+            timeout = WAKE_INTERVAL if due is None else min(max(due - time.monotonic(), 0), WAKE_INTERVAL)
+            changes = watcher.poll(timeout)
+            # After the wait: a change seen now must stay quiet a full `settle` from now
+            now = time.monotonic()
+            for path, closed in changes:
+                debouncer.touch(path, closed, now)
+            for folder, exc in watcher.failures:
+                on_error(FileRef(folder), exc)
+            watcher.failures.clear()
+
+            ready = debouncer.ready(time.monotonic())
+            for start in range(0, len(ready), batch_size):
+                batch = ready[start:start + batch_size]
+                process(batch, len(batch))
+                notify(STAGE_PROCESSING)
+            if ready:
+                notify(STAGE_WATCHING)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.close()
+        close_destination(storage, result)
+        if cache is not None:
+            cache.close()
+
+    result.finished_at = time.monotonic()
+    if config.report_path:
+        report = metrics.report(result, config)
+        report['watcher'] = result.watcher
+        report['date_sources'] = {'chain': list(config.date_sources), 'files': dict(result.date_sources)}
+        report['folders'] = {'created': folders.created, 'listed': folders.listed}
+        report['storage'] = storage.describe()
+        write_report(config.report_path, report)
+    notify(STAGE_DONE)
+    return result
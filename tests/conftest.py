@@ -0,0 +1,22 @@
+import pytest
+
+from tests.samples import LARGE, SMALL, content, write
+
+
+@pytest.fixture
+def sample(tmp_path):
+    """write(name, data) -> path of a file of the test's temporary folder"""
+    def write(name, data):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def destination(tmp_path):
+    """Destination already holding a small photo (SMALL bytes, seed 1) and a large one (LARGE, seed 2)"""
+    folder = tmp_path / 'dest'
+    write(folder / '2023' / 'August' / 'IMG_0001.jpg', content(SMALL, 1))
+    write(folder / '2023' / 'July' / 'IMG_0002.jpg', content(LARGE, 2))
+    return str(folder)
@@ -0,0 +1,272 @@
+"""
+Builders of small sample files for the parser tests
+
+Each builder returns the bytes of a minimal but well-formed file: only the
+structures the readers walk through are written, with no pixel data.
+"""
+
+import os
+import struct
+
+from photo_organizer_engine.hashing import PARTIAL_BLOCK
+
+ASCII = 2
+SHORT = 3
+LONG = 4
+
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+TAG_PIXEL_X_DIMENSION = 0xA002
+TAG_PIXEL_Y_DIMENSION = 0xA003
+TAG_THUMBNAIL_OFFSET = 0x0201
+TAG_THUMBNAIL_LENGTH = 0x0202
+
+# Sizes of photos covered whole by the partial digest, and not
+SMALL = 1000
+LARGE = 4 * PARTIAL_BLOCK
+
+# Smallest byte string the thumbnail reader accepts as a JPEG
+THUMBNAIL = b'\xff\xd8\xff\xd9'
+
+
+def _ascii(tag, text):
+    value = text.encode('ascii') + b'\x00'
+    return [tag, ASCII, len(value), value]
+
+
+def _ifd_size(entries):
+    return 2 + 12 * len(entries) + 4 + sum(len(value) for _, _, _, value in entries
+                                           if isinstance(value, bytes) and len(value) > 4)
+
+
+def _ifd(endian, entries, offset, next_ifd):
+    """IFD at `offset`, followed by the values that do not fit in their entry"""
+    table = struct.pack(endian + 'H', len(entries))
+    extra = b''
+    data_offset = offset + 2 + 12 * len(entries) + 4
+    for tag, field_type, count, value in sorted(entries):
+        if isinstance(value, int):
+            field = struct.pack(endian + 'I', value)
+        elif len(value) <= 4:
+            field = value.ljust(4, b'\x00')
+        else:
+            field = struct.pack(endian + 'I', data_offset + len(extra))
+            extra += value
+        table += struct.pack(endian + 'HHI', tag, field_type, count) + field
+    return table + struct.pack(endian + 'I', next_ifd) + extra
+
+
+def tiff(date_time=None, date_original=None, date_digitized=None, thumbnail=None, endian='<', size=None):
+    """
+    TIFF structure: IFD0 (DateTime), its Exif IFD (original, digitized, and
+    the image `size` as a SHORT width and a LONG height) and an IFD1 thumbnail
+    """
+    ifd0 = [_ascii(TAG_DATETIME, date_time)] if date_time else []
+    exif_ifd = []
+    if date_original:
+        exif_ifd.append(_ascii(TAG_DATETIME_ORIGINAL, date_original))
+    if date_digitized:
+        exif_ifd.append(_ascii(TAG_DATETIME_DIGITIZED, date_digitized))
+    if size:
+        exif_ifd.append([TAG_PIXEL_X_DIMENSION, SHORT, 1, struct.pack(endian + 'H', size[0])])
+        exif_ifd.append([TAG_PIXEL_Y_DIMENSION, LONG, 1, size[1]])
+    if exif_ifd:
+        ifd0.append([TAG_EXIF_IFD, LONG, 1, 0])
+    ifd1 = [[TAG_THUMBNAIL_OFFSET, LONG, 1, 0], [TAG_THUMBNAIL_LENGTH, LONG, 1, len(thumbnail)]] if thumbnail else []
+
+    ifd0_offset = 8
+    exif_offset = ifd0_offset + _ifd_size(ifd0)
+    ifd1_offset = exif_offset + (_ifd_size(exif_ifd) if exif_ifd else 0)
+    thumbnail_offset = ifd1_offset + (_ifd_size(ifd1) if ifd1 else 0)
+    if exif_ifd:
+        ifd0[-1][3] = exif_offset
+    if ifd1:
+        ifd1[0][3] = thumbnail_offset
+
+    mark = b'II' if endian == '<' else b'MM'
+    data = mark + struct.pack(endian + 'HI', 42, ifd0_offset)
+    data += _ifd(endian, ifd0, ifd0_offset, ifd1_offset if ifd1 else 0)
+    if exif_ifd:
+        data += _ifd(endian, exif_ifd, exif_offset, 0)
+    if ifd1:
+        data += _ifd(endian, ifd1, ifd1_offset, 0) + thumbnail
+    return data
+
+
+def _segment(marker, payload):
+    return bytes((0xFF, marker)) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def jpeg(exif=None, before=()):
+    """JPEG with an APP0 JFIF segment, the segments of `before`, then an APP1 Exif segment"""
+    data = b'\xff\xd8' + _segment(0xE0, b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00')
+    for marker, payload in before:
+        data += _segment(marker, payload)
+    if exif is not None:
+        data += _segment(0xE1, b'Exif\x00\x00' + exif)
+    # Quantization table, start of scan, a few bytes of scan data, end of image
+    return data + _segment(0xDB, bytes(65)) + _segment(0xDA, bytes(10)) + b'\x12\x34\xff\xd9'
+
+
+def box(box_type, payload=b'', large=False):
+    """ISO-BMFF box, with a 64-bit size if `large`"""
+    if large:
+        return struct.pack('>I4sQ', 1, box_type, len(payload) + 16) + payload
+    return struct.pack('>I4s', len(payload) + 8, box_type) + payload
+
+
+def full_box(box_type, version, payload, flags=0):
+    return box(box_type, struct.pack('>I', (version << 24) | flags) + payload)
+
+
+def _infe(item_id, item_type):
+    # Version 2: 16-bit item ID, protection index, type, empty name
+    return full_box(b'infe', 2, struct.pack('>HH4s', item_id, 0, item_type) + b'\x00')
+
+
+def _iloc(version, items, base_offset_size=0, index_size=0):
+    """'iloc' box; `items` are (item ID, construction method, base offset, [(offset, length)])"""
+    sizes = bytes(((4 << 4) | 4, (base_offset_size << 4) | (index_size if version else 0)))
+    id_format = '>H' if version < 2 else '>I'
+    payload = sizes + struct.pack(id_format, len(items))
+    uint = {0: '', 4: 'I', 8: 'Q'}
+    for item_id, construction_method, base_offset, extents in items:
+        payload += struct.pack(id_format, item_id)
+        if version:
+            payload += struct.pack('>H', construction_method)
+        payload += struct.pack('>H', 0)
+        if base_offset_size:
+            payload += struct.pack('>' + uint[base_offset_size], base_offset)
+        payload += struct.pack('>H', len(extents))
+        for offset, length in extents:
+            if version and index_size:
+                payload += struct.pack('>' + uint[index_size], 0)
+            payload += struct.pack('>II', offset, length)
+    return full_box(b'iloc', version, payload)
+
+
+def heic(exif, iloc_version=1, base_offset=False, construction_method=0, exif_prefix=b'Exif\x00\x00',
+         before_meta=b''):
+    """
+    HEIC with an image item (1) and an Exif item (2) stored in 'mdat'. The
+    Exif item is its 4-byte TIFF header offset, `exif_prefix`, then `exif`.
+    With `base_offset`, extents are relative to a base offset at the start of
+    'mdat'. `before_meta` is written between 'ftyp' and 'meta'.
+    """
+    image = b'\x00' * 32
+    item = struct.pack('>I', len(exif_prefix)) + exif_prefix + exif
+    ftyp = box(b'ftyp', b'heic' + struct.pack('>I', 0) + b'mif1heic')
+
+    def build(mdat_payload_offset):
+        base = mdat_payload_offset if base_offset else 0
+        start = 0 if base_offset else mdat_payload_offset
+        items = [(1, 0, base, [(start, len(image))]),
+                 (2, construction_method, base, [(start + len(image), len(item))])]
+        iinf = full_box(b'iinf', 0, struct.pack('>H', 2) + _infe(1, b'hvc1') + _infe(2, b'Exif'))
+        hdlr = full_box(b'hdlr', 0, b'\x00' * 4 + b'pict' + b'\x00' * 13)
+        iloc = _iloc(iloc_version, items, base_offset_size=4 if base_offset else 0,
+                     index_size=4 if iloc_version else 0)
+        return full_box(b'meta', 0, hdlr + iinf + iloc)
+
+    meta = build(0)
+    meta = build(len(ftyp) + len(before_meta) + len(meta) + 8)
+    return ftyp + before_meta + meta + box(b'mdat', image + item)
+
+
+def _riff_chunk(fourcc, payload):
+    return struct.pack('<4sI', fourcc, len(payload)) + payload + (b'\x00' if len(payload) & 1 else b'')
+
+
+def webp(exif, exif_prefix=b''):
+    """Extended WebP: VP8X, an odd-sized ICC chunk (padded), then the EXIF chunk"""
+    body = b'WEBP' + _riff_chunk(b'VP8X', b'\x08' + bytes(9)) + _riff_chunk(b'ICCP', b'abc')
+    body += _riff_chunk(b'EXIF', exif_prefix + exif) + _riff_chunk(b'VP8L', bytes(6))
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def _png_chunk(chunk_type, payload):
+    # The readers do not check CRCs
+    return struct.pack('>I4s', len(payload), chunk_type) + payload + b'\x00' * 4
+
+
+def png(exif, after_image=False):
+    """PNG with an eXIf chunk before the image data, or after it"""
+    header = _png_chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+    exif_chunk = _png_chunk(b'eXIf', exif)
+    image = _png_chunk(b'IDAT', bytes(12))
+    chunks = header + (image + exif_chunk if after_image else exif_chunk + image)
+    return b'\x89PNG\r\n\x1a\n' + chunks + _png_chunk(b'IEND', b'')
+
+
+def _mvhd(creation_time, version=0):
+    if version == 1:
+        return full_box(b'mvhd', 1, struct.pack('>QQIQ', creation_time, creation_time, 1000, 0) + bytes(80))
+    return full_box(b'mvhd', 0, struct.pack('>IIII', creation_time, creation_time, 1000, 0) + bytes(80))
+
+
+def _data(text):
+    # Type 1 (UTF-8), locale 0
+    return box(b'data', struct.pack('>II', 1, 0) + text.encode('utf-8'))
+
+
+def _udta_day(text, itunes=False):
+    if itunes:
+        ilst = box(b'ilst', box(b'\xa9day', _data(text)))
+        return box(b'udta', full_box(b'meta', 0, full_box(b'hdlr', 0, bytes(4) + b'mdir' + bytes(13)) + ilst))
+    encoded = text.encode('utf-8')
+    return box(b'udta', box(b'\xa9day', struct.pack('>HH', len(encoded), 0x55C4) + encoded))
+
+
+def _mdta_meta(creation_date, quicktime=True):
+    """moov/meta with a 'keys' table (an unrelated key first) and its 'ilst'"""
+    keys = [b'com.apple.quicktime.make', b'com.apple.quicktime.creationdate']
+    table = b''.join(struct.pack('>I4s', len(key) + 8, b'mdta') + key for key in keys)
+    keys_box = full_box(b'keys', 0, struct.pack('>I', len(keys)) + table)
+    ilst = box(b'ilst', box(struct.pack('>I', 1), _data('Apple')) + box(struct.pack('>I', 2), _data(creation_date)))
+    hdlr = full_box(b'hdlr', 0, bytes(4) + b'mdta' + bytes(13))
+    if quicktime:
+        # QuickTime 'meta' is a plain box
+        return box(b'meta', hdlr + keys_box + ilst)
+    return full_box(b'meta', 0, hdlr + keys_box + ilst)
+
+
+def mp4(mvhd_time=None, mvhd_version=0, day=None, itunes_day=False, creation_date=None,
+        quicktime_meta=True, moov_first=False, large_mdat=False):
+    """MP4 clip with the requested date headers in 'moov', before or after a small 'mdat'"""
+    children = b''
+    if mvhd_time is not None:
+        children += _mvhd(mvhd_time, mvhd_version)
+    # A track, whose sample tables must be skipped
+    children += box(b'trak', box(b'tkhd', bytes(84)) + box(b'mdia', bytes(64)))
+    if day is not None:
+        children += _udta_day(day, itunes_day)
+    if creation_date is not None:
+        children += _mdta_meta(creation_date, quicktime_meta)
+    moov = box(b'moov', children)
+    mdat = box(b'mdat', bytes(256), large=large_mdat)
+    ftyp = box(b'ftyp', b'isom' + struct.pack('>I', 512) + b'isomiso2mp41')
+    return ftyp + (moov + mdat if moov_first else mdat + moov)
+
+
+def write(path, data):
+    """Write a file, creating its folder; returns its path as a string"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def content(size, seed):
+    """`size` bytes of photo-like content, different for every seed"""
+    return bytes((seed + i * 7) % 251 for i in range(size))
+
+
+def damaged(data):
+    """Every truncation of `data`, then `data` with each byte in turn set to 0x00 and to 0xFF"""
+    for length in range(len(data)):
+        yield data[:length]
+    for position in range(len(data)):
+        for value in (b'\x00', b'\xff'):
+            yield data[:position] + value + data[position + 1:]
@@ -0,0 +1,65 @@
+"""EXIF blocks inside HEIC (ISO-BMFF), WebP (RIFF) and PNG containers"""
+
+from datetime import datetime
+
+import pytest
+
+from photo_organizer_engine.exif import read_exif_date
+from tests.samples import box, damaged, heic, png, tiff, webp
+
+ORIGINAL = datetime(2023, 8, 14, 10, 22, 31)
+EXIF = tiff(date_time='2024:01:01 00:00:00', date_original='2023:08:14 10:22:31', endian='>')
+
+
+@pytest.mark.parametrize('iloc_version', [0, 1, 2])
+@pytest.mark.parametrize('base_offset', [False, True])
+def test_heic_iloc_extents(sample, iloc_version, base_offset):
+    path = sample('IMG_0001.heic', heic(EXIF, iloc_version=iloc_version, base_offset=base_offset))
+    assert read_exif_date(path) == ORIGINAL
+
+
+def test_heic_exif_without_prefix(sample):
+    assert read_exif_date(sample('IMG_0001.heic', heic(EXIF, exif_prefix=b''))) == ORIGINAL
+
+
+def test_heic_item_stored_in_idat_is_not_read(sample):
+    assert read_exif_date(sample('IMG_0001.heic', heic(EXIF, construction_method=1))) is None
+
+
+def test_heic_after_a_large_box(sample):
+    # 64-bit box size, then an empty box ending the file: the walk stops there
+    padding = box(b'free', bytes(100), large=True)
+    path = sample('IMG_0001.heic', heic(EXIF, base_offset=True, before_meta=padding))
+    assert read_exif_date(path) == ORIGINAL
+    assert read_exif_date(sample('no_meta.heic', heic(EXIF)[:24] + padding + bytes(8))) is None
+
+
+@pytest.mark.parametrize('exif_prefix', [b'', b'Exif\x00\x00'])
+def test_webp(sample, exif_prefix):
+    assert read_exif_date(sample('IMG_0001.webp', webp(EXIF, exif_prefix))) == ORIGINAL
+
+
+def test_webp_without_exif_chunk(sample):
+    data = webp(EXIF).replace(b'EXIF', b'XMP ')
+    assert read_exif_date(sample('IMG_0001.webp', data)) is None
+
+
+def test_png(sample):
+    assert read_exif_date(sample('IMG_0001.png', png(EXIF))) == ORIGINAL
+    # Chunks after the image data are not walked
+    assert read_exif_date(sample('late.png', png(EXIF, after_image=True))) is None
+
+
+@pytest.mark.parametrize('name, data', [
+    ('heic', heic(EXIF, iloc_version=1, base_offset=True)),
+    ('heic2', heic(EXIF, iloc_version=2)),
+    ('webp', webp(EXIF, b'Exif\x00\x00')),
+    ('png', png(EXIF)),
+])
+def test_damaged_files_never_raise(sample, name, data):
+    path = sample(name, b'')
+    for variant in damaged(data):
+        with open(path, 'wb') as f:
+            f.write(variant)
+        date = read_exif_date(path)
+        assert date is None or isinstance(date, datetime)
@@ -0,0 +1,116 @@
+"""Destination index: duplicates by content, reserve/commit/discard"""
+
+import os
+import shutil
+import threading
+
+from photo_organizer_engine import dedupe
+from photo_organizer_engine.cache import MetadataCache
+from photo_organizer_engine.dedupe import DestinationIndex
+from photo_organizer_engine.hashing import full_digest
+from photo_organizer_engine.scanner import iter_files
+from tests.samples import LARGE, SMALL, content, write
+
+def build(destination, **options):
+    return DestinationIndex(**options).build(iter_files(destination, ('.jpg',)))
+
+
+def test_duplicates_found_whatever_the_name(destination, tmp_path):
+    index = build(destination)
+    assert index.files == 2
+    assert index.reserve(write(tmp_path / 'card' / 'renamed.jpg', content(SMALL, 1)), SMALL) is None
+    assert index.reserve(write(tmp_path / 'card' / 'other.jpg', content(LARGE, 2)), LARGE) is None
+
+
+def test_same_size_different_content(destination, tmp_path):
+    index = build(destination)
+    src = write(tmp_path / 'card' / 'IMG_0003.jpg', content(SMALL, 3))
+    entry = index.reserve(src, SMALL)
+    assert entry is not None
+    assert index.files == 3
+
+
+def test_reserved_file_blocks_its_duplicates(destination, tmp_path):
+    index = build(destination)
+    first = write(tmp_path / 'card1' / 'IMG_0003.jpg', content(LARGE, 3))
+    second = write(tmp_path / 'card2' / 'IMG_0003.jpg', content(LARGE, 3))
+    entry = index.reserve(first, LARGE)
+    assert entry is not None
+    # Still being copied: compared through its source
+    assert index.reserve(second, LARGE) is None
+
+    dest_path = os.path.join(destination, '2023', 'August', 'IMG_0003.jpg')
+    shutil.copyfile(first, dest_path)
+    index.commit(entry, dest_path)
+    assert index.reserve(second, LARGE) is None
+
+
+def test_discarded_file_is_not_a_duplicate(destination, tmp_path):
+    index = build(destination)
+    first = write(tmp_path / 'card1' / 'IMG_0003.jpg', content(SMALL, 3))
+    second = write(tmp_path / 'card2' / 'IMG_0003.jpg', content(SMALL, 3))
+    entry = index.reserve(first, SMALL)
+    index.discard(entry)
+    assert index.files == 2
+    assert index.reserve(second, SMALL) is not None
+
+
+def test_concurrent_identical_files_get_one_entry(destination, tmp_path):
+    index = build(destination)
+    paths = [write(tmp_path / f'card{number}' / 'IMG_0003.jpg', content(LARGE, 3)) for number in range(8)]
+    entries = []
+    barrier = threading.Barrier(len(paths))
+
+    def reserve(path):
+        barrier.wait()
+        entries.append(index.reserve(path, LARGE))
+
+    threads = [threading.Thread(target=reserve, args=(path,)) for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(entry is not None for entry in entries) == 1
+
+
+def test_written_files_merged_into_the_columns(destination, tmp_path, monkeypatch):
+    monkeypatch.setattr(dedupe, 'MERGE_AT_LEAST', 2)
+    index = build(destination)
+    for number in range(3, 6):
+        src = write(tmp_path / 'card' / f'IMG_{number:04}.jpg', content(LARGE, number))
+        entry = index.reserve(src, LARGE)
+        dest_path = os.path.join(destination, '2023', 'July', f'IMG_{number:04}.jpg')
+        shutil.copyfile(src, dest_path)
+        index.commit(entry, dest_path)
+
+    assert len(index._table) >= 4
+    assert index.files == 5
+    again = write(tmp_path / 'again' / 'copy.jpg', content(LARGE, 4))
+    assert index.reserve(again, LARGE) is None
+    # The merged row points at the destination file, not at the source
+    os.remove(tmp_path / 'card' / 'IMG_0004.jpg')
+    assert index.reserve(again, LARGE) is None
+
+
+def test_digest_of_a_hashed_copy_cached_for_source_and_destination(destination, tmp_path):
+    cache = MetadataCache(str(tmp_path / 'cache.db'))
+    index = build(destination, cache=cache)
+    src = write(tmp_path / 'card' / 'IMG_0003.jpg', content(LARGE, 3))
+    entry = index.reserve(src, LARGE)
+    dest_path = os.path.join(destination, '2023', 'July', 'IMG_0003.jpg')
+    shutil.copyfile(src, dest_path)
+    index.commit(entry, dest_path, full_digest(src))
+
+    # A rerun compares the source without reading it again
+    assert cache.get_digest(os.stat(src)) == full_digest(src)
+    assert cache.get_digest(os.stat(dest_path)) == full_digest(src)
+    cache.close()
+
+
+def test_memory_of_the_entries_not_merged_yet(destination, tmp_path):
+    index = build(destination)
+    merged = index.nbytes()
+    for number in range(3, 6):
+        src = write(tmp_path / 'card' / f'IMG_{number:04}.jpg', content(SMALL + number, number))
+        assert index.reserve(src, SMALL + number) is not None
+    assert index.nbytes() > merged + 3 * 100
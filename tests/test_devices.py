@@ -0,0 +1,45 @@
+"""Device detection, and the writers of a destination on a spinning disk"""
+
+import os
+import threading
+import time
+
+from photo_organizer_engine import devices, engine, storage
+from photo_organizer_engine.devices import folder_rotational
+from photo_organizer_engine.engine import OrganizerConfig, organize
+from tests.samples import SMALL, content, write
+
+
+def test_folder_not_created_yet_uses_its_parent(tmp_path, monkeypatch):
+    asked = []
+    monkeypatch.setattr(devices, 'is_rotational', lambda device: asked.append(device) or True)
+    assert folder_rotational(str(tmp_path / 'dest' / '2023' / 'August'))
+    assert asked == [os.stat(tmp_path).st_dev]
+
+
+def test_spinning_destination_limits_writers(tmp_path, monkeypatch):
+    source = tmp_path / 'card'
+    for number in range(8):
+        write(source / f'IMG_{number:04}.jpg', content(SMALL + number, number))
+    # Sources on an SSD, destination on a spinning disk
+    monkeypatch.setattr(devices, 'is_rotational', lambda device: False)
+    monkeypatch.setattr(engine, 'folder_rotational', lambda folder: True)
+    real_copy = storage.copy_atomic
+    writing = [0, 0]
+    lock = threading.Lock()
+
+    def slow_copy(src, dst, hardlink=False):
+        with lock:
+            writing[0] += 1
+            writing[1] = max(writing)
+        time.sleep(0.02)
+        with lock:
+            writing[0] -= 1
+        return real_copy(src, dst, hardlink)
+
+    monkeypatch.setattr(storage, 'copy_atomic', slow_copy)
+    config = OrganizerConfig(str(source), str(tmp_path / 'dest'), sort_by_date=False,
+                             copy_workers=4, hdd_workers=2)
+    result = organize(config)
+    assert (result.processed, result.errors) == (8, 0)
+    assert writing[1] == 2
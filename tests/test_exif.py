@@ -0,0 +1,109 @@
+"""Fast EXIF reader: TIFF IFDs in both byte orders, JPEG segments, and damaged files"""
+
+from datetime import datetime
+
+import pytest
+
+from photo_organizer_engine.exif import (
+    parse_exif_datetime, parse_iso_datetime, read_exif_date, read_exif_preview, read_exif_thumbnail,
+)
+from tests.samples import THUMBNAIL, damaged, jpeg, tiff
+
+ORIGINAL = datetime(2023, 8, 14, 10, 22, 31)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2023:08:14 10:22:31', ORIGINAL),
+    (b'2023:08:14 10:22:31\x00', ORIGINAL),
+    ('2023-08-14 10:22:31', ORIGINAL),
+    ('0000:00:00 00:00:00', None),
+    ('    :  :     :  :  ', None),
+    ('2023:08:14', None),
+    (None, None),
+])
+def test_parse_exif_datetime(value, expected):
+    assert parse_exif_datetime(value) == expected
+
+
+def test_parse_iso_datetime():
+    assert parse_iso_datetime('2023-08-14T10:22:31+02:00') == ORIGINAL
+    assert parse_iso_datetime('2023-08-14') == datetime(2023, 8, 14)
+    assert parse_iso_datetime('2023-13-14') is None
+
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+def test_tiff_in_both_byte_orders(sample, endian):
+    path = sample('IMG_0001.dng', tiff(date_time='2024:01:01 00:00:00',
+                                        date_original='2023:08:14 10:22:31', endian=endian))
+    assert read_exif_date(path) == ORIGINAL
+
+
+def test_date_tags_in_order_of_preference(sample):
+    digitized = tiff(date_time='2024:01:01 00:00:00', date_digitized='2023:08:15 09:00:00')
+    assert read_exif_date(sample('digitized.tif', digitized)) == datetime(2023, 8, 15, 9, 0, 0)
+    assert read_exif_date(sample('datetime.tif', tiff(date_time='2024:01:01 00:00:00'))) == datetime(2024, 1, 1)
+    # An unset original date falls through to the next tag
+    unset = tiff(date_time='2024:01:01 00:00:00', date_original='0000:00:00 00:00:00')
+    assert read_exif_date(sample('unset.tif', unset)) == datetime(2024, 1, 1)
+    assert read_exif_date(sample('none.tif', tiff())) is None
+
+
+def test_jpeg_segments_before_exif(sample):
+    xmp = (0xE1, b'http://ns.adobe.com/xap/1.0/\x00<x:xmpmeta/>')
+    icc = (0xE2, b'ICC_PROFILE\x00' + bytes(40))
+    path = sample('IMG_0001.jpg', jpeg(tiff(date_original='2023:08:14 10:22:31', endian='>'), [xmp, icc]))
+    assert read_exif_date(path) == ORIGINAL
+
+
+def test_jpeg_without_exif(sample):
+    assert read_exif_date(sample('IMG_0001.jpg', jpeg())) is None
+
+
+def test_jpeg_written_by_pillow(sample, tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    exif = Image.Exif()
+    exif[0x0132] = '2024:01:01 00:00:00'
+    exif.get_ifd(0x8769)[0x9003] = '2023:08:14 10:22:31'
+    path = str(tmp_path / 'pillow.jpg')
+    Image.new('RGB', (8, 8)).save(path, exif=exif)
+    assert read_exif_date(path) == ORIGINAL
+
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+def test_thumbnail(sample, endian):
+    path = sample('IMG_0001.jpg', jpeg(tiff(date_original='2023:08:14 10:22:31', thumbnail=THUMBNAIL,
+                                             endian=endian)))
+    assert read_exif_thumbnail(path) == THUMBNAIL
+    assert read_exif_date(path) == ORIGINAL
+    assert read_exif_thumbnail(sample('none.jpg', jpeg(tiff(date_original='2023:08:14 10:22:31')))) is None
+
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+def test_preview_with_the_image_size(sample, endian):
+    path = sample('IMG_0001.jpg', jpeg(tiff(thumbnail=THUMBNAIL, size=(4000, 3000), endian=endian)))
+    assert read_exif_preview(path) == (THUMBNAIL, (4000, 3000))
+    assert read_exif_preview(sample('nosize.jpg', jpeg(tiff(thumbnail=THUMBNAIL)))) == (THUMBNAIL, None)
+    assert read_exif_preview(sample('none.jpg', jpeg(tiff(size=(4000, 3000))))) == (None, None)
+
+
+def test_not_an_image(sample):
+    assert read_exif_date(sample('notes.txt', b'2023:08:14 10:22:31')) is None
+    assert read_exif_date(sample('empty.jpg', b'')) is None
+    assert read_exif_date(sample('missing', b'') + '.nothing') is None
+
+
+@pytest.mark.parametrize('name, data', [
+    ('tiff', tiff(date_time='2024:01:01 00:00:00', date_original='2023:08:14 10:22:31', thumbnail=THUMBNAIL,
+                  size=(4000, 3000))),
+    ('jpeg', jpeg(tiff(date_original='2023:08:14 10:22:31', thumbnail=THUMBNAIL, endian='>'))),
+])
+def test_damaged_files_never_raise(sample, name, data):
+    path = sample(name, b'')
+    for variant in damaged(data):
+        with open(path, 'wb') as f:
+            f.write(variant)
+        date = read_exif_date(path)
+        assert date is None or isinstance(date, datetime)
+        thumbnail = read_exif_thumbnail(path)
+        assert thumbnail is None or thumbnail.startswith(b'\xff\xd8')
+        assert read_exif_preview(path)[0] == thumbnail
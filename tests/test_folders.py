@@ -0,0 +1,39 @@
+"""Destination folder index: free names, and one index per folder however it is spelled"""
+
+import os
+
+from photo_organizer_engine.folders import DestinationFolders
+
+
+def test_clashing_names_get_a_suffix(tmp_path):
+    (tmp_path / 'IMG_0001.jpg').write_bytes(b'')
+    folders = DestinationFolders()
+    first = folders.claim(str(tmp_path), 'IMG_0001.jpg')
+    second = folders.claim(str(tmp_path), 'IMG_0001.jpg')
+    assert [os.path.basename(first), os.path.basename(second)] == ['IMG_0001_1.jpg', 'IMG_0001_2.jpg']
+
+
+def test_trailing_separator_is_the_same_folder(tmp_path):
+    folders = DestinationFolders()
+    folder = str(tmp_path) + os.sep
+    written = folders.claim(folder, 'IMG_0001.jpg')
+    folders.done(written)
+    dropped = folders.claim(folder, 'IMG_0001.jpg')
+    folders.release(dropped)
+
+    assert folders.listed == 1
+    assert [index.pending for index in folders._folders.values()] == [0]
+    # The released name is free again, the written one is not
+    index, = folders._folders.values()
+    assert index.names == {os.path.normcase('IMG_0001.jpg')}
+
+
+def test_only_idle_folders_are_forgotten(tmp_path):
+    folders = DestinationFolders(max_names=4)
+    busy = folders.claim(str(tmp_path / 'a'), 'IMG_0001.jpg')
+    for name in ('b', 'c', 'd', 'e', 'f'):
+        folders.done(folders.claim(str(tmp_path / name), 'IMG_0001.jpg'))
+
+    assert os.path.normcase(os.path.normpath(str(tmp_path / 'a'))) in folders._folders
+    assert folders.evicted > 0
+    folders.done(busy)
@@ -0,0 +1,57 @@
+"""Tiered digests: size, head/tail digest, then the full digest only when needed"""
+
+from photo_organizer_engine import dedupe
+from photo_organizer_engine.dedupe import DestinationIndex
+from photo_organizer_engine.hashing import (
+    PARTIAL_BLOCK, PARTIAL_COVERS_ALL, files_are_identical, full_digest, partial_digest, thread_bytes_read,
+)
+from photo_organizer_engine.scanner import iter_files
+from tests.samples import LARGE, SMALL, content, write
+
+
+def build(destination):
+    return DestinationIndex().build(iter_files(destination, ('.jpg',)))
+
+
+def test_partial_digest_reads_head_and_tail(tmp_path):
+    path = write(tmp_path / 'a', content(LARGE, 1))
+    before = thread_bytes_read()
+    partial_digest(path, LARGE)
+    assert thread_bytes_read() - before == 2 * PARTIAL_BLOCK
+    # Small files are covered whole: their partial digest is their full digest
+    small = write(tmp_path / 'b', content(SMALL, 1))
+    assert partial_digest(small) == full_digest(small)
+
+
+def test_head_and_tail_alike_middle_different(destination, tmp_path):
+    index = build(destination)
+    data = bytearray(content(LARGE, 2))
+    data[LARGE // 2] ^= 0xFF
+    src = write(tmp_path / 'card' / 'edited.jpg', bytes(data))
+    assert index.reserve(src, LARGE) is not None
+
+
+def test_full_digest_only_when_partial_digests_match(destination, tmp_path, monkeypatch):
+    index = build(destination)
+    calls = []
+    real_full_digest = dedupe.full_digest
+    monkeypatch.setattr(dedupe, 'full_digest', lambda path, cache=None: calls.append(path) or
+                        real_full_digest(path, cache))
+    # Different head: rejected on the partial digest
+    assert index.reserve(write(tmp_path / 'card' / 'a.jpg', content(LARGE, 9)), LARGE) is not None
+    assert calls == []
+    # Same head and tail: the full digest decides
+    assert index.reserve(write(tmp_path / 'card' / 'b.jpg', content(LARGE, 2)), LARGE) is None
+    assert len(calls) == 1
+
+
+def test_files_are_identical(tmp_path):
+    a = write(tmp_path / 'a', content(LARGE, 1))
+    b = write(tmp_path / 'b', content(LARGE, 1))
+    edited = bytearray(content(LARGE, 1))
+    edited[PARTIAL_COVERS_ALL] ^= 1
+    c = write(tmp_path / 'c', bytes(edited))
+    assert files_are_identical(a, b)
+    assert not files_are_identical(a, c)
+    assert not files_are_identical(a, write(tmp_path / 'd', content(SMALL, 1)))
+    assert not files_are_identical(a, str(tmp_path / 'missing'))
@@ -0,0 +1,78 @@
+"""Write-ahead journal: records of a previous attempt, and resuming an interrupted run"""
+
+import os
+
+from photo_organizer_engine import storage
+from photo_organizer_engine.engine import OrganizerConfig, organize
+from photo_organizer_engine.journal import PARTIAL_SUFFIX, Journal, default_journal_path
+from tests.samples import SMALL, content, write
+
+
+def test_completed_files_of_a_previous_attempt(tmp_path):
+    path = str(tmp_path / '.photo_organizer' / 'journal.jsonl')
+    src = write(tmp_path / 'card' / 'IMG_0001.jpg', content(SMALL, 1))
+    duplicate = write(tmp_path / 'card' / 'IMG_0002.jpg', content(SMALL, 1))
+    st = os.stat(src)
+
+    journal = Journal(path)
+    assert not journal.resuming
+    journal.plan(src, str(tmp_path / 'dest' / 'IMG_0001.jpg'))
+    journal.done(src, st, str(tmp_path / 'dest' / 'IMG_0001.jpg'))
+    journal.duplicate(duplicate, os.stat(duplicate))
+    journal.close()
+
+    journal = Journal(path)
+    assert journal.resuming
+    assert journal.is_completed(src, st)
+    assert journal.is_completed(duplicate, os.stat(duplicate))
+    # Modified since: handled again
+    os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert not journal.is_completed(src, os.stat(src))
+    journal.close(finished=True)
+    assert not os.path.exists(path)
+    assert not os.path.exists(os.path.dirname(path))
+
+
+def test_interrupted_copy_is_cleaned_up(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    dst = str(tmp_path / 'dest' / 'IMG_0001.jpg')
+    write(dst + PARTIAL_SUFFIX, b'half a photo')
+    journal = Journal(path)
+    journal.plan(str(tmp_path / 'card' / 'IMG_0001.jpg'), dst)
+    journal.close()
+    # Torn last record of a crashed run
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "done", "src": "/card/IMG_0')
+
+    journal = Journal(path)
+    assert not os.path.exists(dst + PARTIAL_SUFFIX)
+    assert not journal.resuming
+    journal.close()
+
+
+def test_run_resumes_after_a_failed_copy(tmp_path, monkeypatch):
+    source = tmp_path / 'card'
+    for number in range(6):
+        write(source / f'IMG_{number:04}.jpg', content(SMALL + number, number))
+    config = OrganizerConfig(str(source), str(tmp_path / 'dest'), copy_workers=2, metadata_workers=2)
+    journal_path = default_journal_path(config)
+
+    real_copy = storage.copy_atomic
+
+    def failing_copy(src, dst, hardlink=False):
+        if os.path.basename(src) == 'IMG_0003.jpg':
+            raise OSError('disk unplugged')
+        return real_copy(src, dst, hardlink)
+
+    monkeypatch.setattr(storage, 'copy_atomic', failing_copy)
+    first = organize(config)
+    assert (first.processed, first.errors) == (5, 1)
+    # Kept for the next attempt
+    assert os.path.exists(journal_path)
+
+    monkeypatch.setattr(storage, 'copy_atomic', real_copy)
+    second = organize(config)
+    assert (second.resumed, second.processed, second.errors) == (5, 1, 0)
+    assert not os.path.exists(journal_path)
+    organized = [name for _, _, names in os.walk(tmp_path / 'dest') for name in names]
+    assert sorted(organized) == [f'IMG_{number:04}.jpg' for number in range(6)]
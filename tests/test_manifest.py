@@ -0,0 +1,70 @@
+"""Planning a run into a manifest, and applying hand-edited manifests"""
+
+import json
+import os
+
+from photo_organizer_engine.engine import OrganizerConfig, organize
+from photo_organizer_engine.manifest import execute_manifest, read_manifest
+from tests.samples import SMALL, content, write
+
+
+def plan(tmp_path, count=3, **options):
+    source = tmp_path / 'card'
+    for number in range(count):
+        write(source / f'IMG_{number:04}.jpg', content(SMALL + number, number))
+    path = str(tmp_path / 'plan.jsonl')
+    organize(OrganizerConfig(str(source), str(tmp_path / 'dest'), sort_by_date=False, plan_path=path,
+                             **options))
+    return path
+
+
+def edit(path, change):
+    """Rewrite the transfer records of a manifest through `change(record)`"""
+    with open(path, encoding='utf-8') as f:
+        header, *records = [json.loads(line) for line in f]
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in [header] + [change(record) or record for record in records]:
+            f.write(json.dumps(record) + '\n')
+
+
+def test_plan_then_apply_twice(tmp_path):
+    path = plan(tmp_path)
+    header, transfers, duplicates = read_manifest(path)
+    assert (len(transfers), duplicates) == (3, 0)
+    assert not os.path.exists(tmp_path / 'dest' / 'IMG_0000.jpg')
+
+    first = execute_manifest(path)
+    assert (first.processed, first.errors) == (3, 0)
+    second = execute_manifest(path)
+    assert (second.processed, second.resumed, second.errors) == (0, 3, 0)
+
+
+def test_unknown_source_root_is_an_error(tmp_path):
+    path = plan(tmp_path)
+    roots = iter([1, 'x', None])
+
+    def bad_root(record):
+        if record['src'] != 'IMG_0000.jpg':
+            record['root'] = next(roots)
+
+    edit(path, bad_root)
+    result = execute_manifest(path)
+    assert (result.processed, result.errors) == (1, 2)
+
+
+def test_existing_destination_checked_against_the_source(tmp_path):
+    path = plan(tmp_path)
+    # The planned size, but the source has changed since
+    write(tmp_path / 'dest' / 'IMG_0001.jpg', content(SMALL + 1, 9))
+    write(tmp_path / 'card' / 'IMG_0001.jpg', content(SMALL + 100, 1))
+    result = execute_manifest(path)
+    assert (result.processed, result.resumed, result.errors) == (2, 0, 1)
+
+
+def test_existing_destination_compared_by_content_with_checksums(tmp_path):
+    path = plan(tmp_path, checksums=True)
+    # Same size as the source, other content
+    write(tmp_path / 'dest' / 'IMG_0001.jpg', content(SMALL + 1, 9))
+    result = execute_manifest(path)
+    assert (result.processed, result.resumed, result.errors) == (2, 0, 1)
+    assert execute_manifest(path).resumed == 2
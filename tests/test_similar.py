@@ -0,0 +1,51 @@
+"""Perceptual hashes computed from the EXIF thumbnail first"""
+
+import io
+import struct
+
+import pytest
+
+from photo_organizer_engine.similar import image_hash
+from tests.samples import tiff
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def encoded(image):
+    data = io.BytesIO()
+    image.save(data, 'JPEG')
+    return data.getvalue()
+
+
+def gradient(width=160, height=120):
+    """JPEG darkening from left to right, in the usual shape of a camera thumbnail"""
+    return encoded(Image.linear_gradient('L').rotate(-90).resize((width, height)))
+
+
+def white_photo(exif, width=64, height=48):
+    """JPEG of a white photo, with an APP1 Exif segment holding the TIFF structure `exif`"""
+    photo = encoded(Image.new('L', (width, height), 255))
+    payload = b'Exif\x00\x00' + exif
+    return photo[:2] + b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload + photo[2:]
+
+
+def test_raw_pillow_cannot_open_hashed_from_its_thumbnail(sample):
+    # IFDs without any image data: only the thumbnail can be decoded
+    path = sample('IMG_0001.cr2', tiff(thumbnail=gradient(), size=(4000, 3000)))
+    with pytest.raises(Exception):
+        Image.open(path)
+    value, pixels = image_hash(path)
+    assert pixels == 4000 * 3000
+    assert value == image_hash(sample('thumbnail.jpg', gradient()))[0]
+
+
+def test_size_read_from_the_header_when_not_in_the_exif_data(sample):
+    value, pixels = image_hash(sample('IMG_0001.jpg', white_photo(tiff(thumbnail=gradient()))))
+    assert pixels == 64 * 48
+    assert value == image_hash(sample('thumbnail.jpg', gradient()))[0]
+
+
+def test_thumbnail_of_another_shape_ignored(sample):
+    # Hashed from the photo itself: uniformly white, no gradient
+    path = sample('IMG_0001.jpg', white_photo(tiff(thumbnail=gradient(120, 120), size=(64, 48))))
+    assert image_hash(path) == (0, 64 * 48)
@@ -0,0 +1,235 @@
+"""S3Storage against moto's in-memory S3 (skipped when boto3 or moto is missing)"""
+
+import base64
+import hashlib
+import json
+import os
+
+import pytest
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+from photo_organizer_engine.checksums import CHECKSUM_FILE, ChecksumWriter, checksum_line
+from photo_organizer_engine.engine import OrganizerConfig, organize
+from photo_organizer_engine.hashing import full_digest, partial_digest
+from photo_organizer_engine.storage import (
+    DIGEST_METADATA, METHOD_MULTIPART, METHOD_UPLOAD, PARTIAL_DIGEST_METADATA, S3Storage,
+)
+
+BUCKET = 'photo-organizer-tests'
+ROOT = f's3://{BUCKET}/sorted'
+# Smallest part S3 accepts (but for the last one)
+PART_SIZE = 5 * 1024 * 1024
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """boto3 client of an empty bucket in moto"""
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        monkeypatch.setenv(name, 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with moto.mock_aws():
+        client = boto3.client('s3')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def open_s3(sent=None):
+    """S3Storage of ROOT; `sent`, if given, receives (operation, headers) of every request"""
+    storage = S3Storage(ROOT, part_size=PART_SIZE, multipart_threshold=PART_SIZE)
+    if sent is not None:
+        def record(request, event_name, **kwargs):
+            headers = {name: value.decode() if isinstance(value, bytes) else value
+                       for name, value in request.headers.items()}
+            sent.append((event_name.rsplit('.', 1)[-1], headers))
+        storage.client.meta.events.register('before-send.s3', record)
+    return storage
+
+
+@pytest.fixture
+def storage(s3):
+    storage = open_s3()
+    yield storage
+    storage.close()
+
+
+def write_file(path, size, seed=0):
+    data = hashlib.shake_256(f'{seed}'.encode()).digest(size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return data
+
+
+def content_md5(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+
+def read_object(s3, key):
+    response = s3.get_object(Bucket=BUCKET, Key=key)
+    return response['Body'].read(), response['Metadata']
+
+
+def test_single_part_upload(s3, tmp_path):
+    src = str(tmp_path / 'IMG_0001.jpg')
+    data = write_file(src, 300_000)
+    sent = []
+    storage = open_s3(sent)
+    try:
+        method, digest = storage.copy(src, f'{ROOT}/2023/August/IMG_0001.jpg')
+    finally:
+        storage.close()
+
+    assert method == METHOD_UPLOAD
+    assert digest == full_digest(src)
+    body, metadata = read_object(s3, 'sorted/2023/August/IMG_0001.jpg')
+    assert body == data
+    assert metadata[DIGEST_METADATA] == digest
+    assert metadata[PARTIAL_DIGEST_METADATA] == partial_digest(src)
+    puts = [headers for operation, headers in sent if operation == 'PutObject']
+    assert len(puts) == 1
+    assert puts[0]['Content-MD5'] == content_md5(data)
+
+
+def test_multipart_upload(s3, tmp_path):
+    src = str(tmp_path / 'clip.mp4')
+    data = write_file(src, 2 * PART_SIZE + 12345)
+    sent = []
+    storage = open_s3(sent)
+    try:
+        method, digest = storage.copy(src, f'{ROOT}/2023/August/clip.mp4')
+        # The full digest is not in the metadata of a multipart object: read back
+        assert storage.full_digest(f'{ROOT}/2023/August/clip.mp4') == digest
+    finally:
+        storage.close()
+
+    assert method == METHOD_MULTIPART
+    assert digest == full_digest(src)
+    body, metadata = read_object(s3, 'sorted/2023/August/clip.mp4')
+    assert body == data
+    assert metadata[PARTIAL_DIGEST_METADATA] == partial_digest(src)
+    assert DIGEST_METADATA not in metadata
+    parts = [headers['Content-MD5'] for operation, headers in sent if operation == 'UploadPart']
+    expected = [content_md5(data[start:start + PART_SIZE]) for start in range(0, len(data), PART_SIZE)]
+    assert sorted(parts) == sorted(expected)
+
+
+def test_failed_multipart_upload_is_aborted(s3, tmp_path, monkeypatch):
+    from botocore.exceptions import ClientError
+
+    src = str(tmp_path / 'clip.mp4')
+    write_file(src, 3 * PART_SIZE)
+    storage = open_s3()
+    upload_part = storage.client.upload_part
+
+    def failing_upload_part(**parameters):
+        if parameters['PartNumber'] == 2:
+            raise ClientError({'Error': {'Code': 'BadDigest'}, 'ResponseMetadata': {'HTTPStatusCode': 400}},
+                              'UploadPart')
+        return upload_part(**parameters)
+
+    monkeypatch.setattr(storage.client, 'upload_part', failing_upload_part)
+    try:
+        with pytest.raises(OSError):
+            storage.copy(src, f'{ROOT}/clip.mp4')
+    finally:
+        storage.close()
+
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []) == []
+    assert 'Contents' not in s3.list_objects_v2(Bucket=BUCKET)
+
+
+def test_listing_answers_listdir(storage, tmp_path):
+    src = str(tmp_path / 'IMG_0001.jpg')
+    write_file(src, 1000)
+    for path in ('2023/August/IMG_0001.jpg', '2023/August/IMG_0002.jpg', '2023/July/IMG_0003.jpg',
+                 '2023/July/notes.txt', '2024/.hidden/IMG_0004.jpg', 'IMG_0005.jpg'):
+        storage.copy(src, f'{ROOT}/{path}')
+
+    fresh = open_s3()
+    try:
+        found = sorted(ref.path for ref in fresh.iter_files(ROOT, ('.jpg',)))
+        assert found == [f'{ROOT}/2023/August/IMG_0001.jpg', f'{ROOT}/2023/August/IMG_0002.jpg',
+                         f'{ROOT}/2023/July/IMG_0003.jpg', f'{ROOT}/IMG_0005.jpg']
+        assert fresh.requests['list_objects_v2'] == 1
+
+        assert sorted(fresh.listdir(ROOT)) == ['2023', '2024', 'IMG_0005.jpg']
+        assert sorted(fresh.listdir(f'{ROOT}/2023')) == ['August', 'July']
+        assert sorted(fresh.listdir(f'{ROOT}/2023/July')) == ['IMG_0003.jpg', 'notes.txt']
+        # Below the listed root, a folder without names is empty
+        assert fresh.listdir(f'{ROOT}/2025/January') == []
+        assert fresh.requests['list_objects_v2'] == 1
+
+        # Asked again, the folder is listed: names written since are not in the flat listing
+        storage.copy(src, f'{ROOT}/2023/July/IMG_0006.jpg')
+        assert sorted(fresh.listdir(f'{ROOT}/2023/July')) == ['IMG_0003.jpg', 'IMG_0006.jpg', 'notes.txt']
+        assert fresh.requests['list_objects_v2'] == 2
+    finally:
+        fresh.close()
+
+
+def test_rerun_dedupes_from_object_metadata(s3, tmp_path):
+    source = tmp_path / 'card'
+    for number, size in enumerate((100, 200_000, 300_000, 1_000_000)):
+        write_file(str(source / f'IMG_{number:04}.jpg'), size, seed=number)
+    # Same content as IMG_0002.jpg under another name
+    write_file(str(source / 'copy' / 'IMG_0099.jpg'), 300_000, seed=2)
+
+    def run(name):
+        report = tmp_path / f'{name}.json'
+        config = OrganizerConfig(str(source), ROOT, resume=False, copy_workers=2, metadata_workers=2,
+                                 report_path=str(report))
+        result = organize(config)
+        assert result.errors == 0
+        with open(report, encoding='utf-8') as f:
+            return result, json.load(f)['storage']['requests']
+
+    result, requests = run('first')
+    assert (result.processed, result.skipped_duplicates) == (4, 1)
+
+    result, requests = run('second')
+    assert (result.processed, result.skipped_duplicates) == (0, 5)
+    # Digests come from one HEAD per object: nothing is read back or uploaded
+    assert 'get_object' not in requests
+    assert 'put_object' not in requests
+    assert requests['list_objects_v2'] == 1
+
+
+def test_rename_is_a_server_side_copy(s3, tmp_path):
+    src = str(tmp_path / 'IMG_0001.jpg')
+    data = write_file(src, 200_000)
+    sent = []
+    storage = open_s3(sent)
+    try:
+        _, digest = storage.copy(src, f'{ROOT}/2023/IMG_0001.jpg')
+        del sent[:]
+        storage.rename(f'{ROOT}/2023/IMG_0001.jpg', f'{ROOT}/Review/1/IMG_0001.jpg')
+        assert not storage.exists(f'{ROOT}/2023/IMG_0001.jpg')
+    finally:
+        storage.close()
+
+    operations = {operation for operation, _ in sent}
+    assert 'CopyObject' in operations
+    assert 'DeleteObject' in operations
+    assert not operations & {'GetObject', 'PutObject', 'UploadPart'}
+    body, metadata = read_object(s3, 'sorted/Review/1/IMG_0001.jpg')
+    assert body == data
+    assert metadata[DIGEST_METADATA] == digest
+
+
+def test_checksum_lines_written_on_close(s3):
+    key = f'sorted/2023/August/{CHECKSUM_FILE}'
+    s3.put_object(Bucket=BUCKET, Key=key, Body=checksum_line('0' * 40, 'IMG_0000.jpg').encode())
+
+    storage = open_s3()
+    writer = ChecksumWriter(storage)
+    writer.add(f'{ROOT}/2023/August/IMG_0001.jpg', '1' * 40)
+    writer.add(f'{ROOT}/2023/August/IMG_0002.jpg', '2' * 40)
+    # Nothing can be appended to an object: written once, at the end
+    assert read_object(s3, key)[0] == checksum_line('0' * 40, 'IMG_0000.jpg').encode()
+    storage.close()
+
+    body, _ = read_object(s3, key)
+    assert body.decode() == (checksum_line('0' * 40, 'IMG_0000.jpg') + checksum_line('1' * 40, 'IMG_0001.jpg')
+                             + checksum_line('2' * 40, 'IMG_0002.jpg'))
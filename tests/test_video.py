@@ -0,0 +1,68 @@
+"""Creation dates of MP4/MOV clips from their box headers"""
+
+from datetime import datetime
+
+import pytest
+
+from photo_organizer_engine.video import QUICKTIME_EPOCH_OFFSET, read_video_date
+from tests.samples import damaged, mp4
+
+CAPTURED = datetime(2023, 8, 14, 10, 22, 31)
+# 2023-08-15 00:00:00 UTC, in seconds since 1904
+MVHD_TIME = 1692057600 + QUICKTIME_EPOCH_OFFSET
+
+
+@pytest.mark.parametrize('quicktime_meta', [True, False])
+def test_quicktime_creation_date_first(sample, quicktime_meta):
+    clip = mp4(mvhd_time=MVHD_TIME, day='2022-01-01T00:00:00+01:00',
+               creation_date='2023-08-14T10:22:31+0200', quicktime_meta=quicktime_meta)
+    assert read_video_date(sample('IMG_0001.mov', clip)) == CAPTURED
+
+
+@pytest.mark.parametrize('itunes_day', [False, True])
+def test_udta_day(sample, itunes_day):
+    clip = mp4(mvhd_time=MVHD_TIME, day='2023-08-14T10:22:31+02:00', itunes_day=itunes_day)
+    assert read_video_date(sample('clip.mp4', clip)) == CAPTURED
+
+
+@pytest.mark.parametrize('version', [0, 1])
+def test_mvhd_in_local_time(sample, version):
+    clip = mp4(mvhd_time=MVHD_TIME, mvhd_version=version)
+    expected = datetime.fromtimestamp(MVHD_TIME - QUICKTIME_EPOCH_OFFSET)
+    assert read_video_date(sample('clip.mp4', clip)) == expected
+
+
+@pytest.mark.parametrize('moov_first', [False, True])
+@pytest.mark.parametrize('large_mdat', [False, True])
+def test_moov_before_or_after_mdat(sample, moov_first, large_mdat):
+    clip = mp4(day='2023-08-14T10:22:31+02:00', moov_first=moov_first, large_mdat=large_mdat)
+    assert read_video_date(sample('clip.mp4', clip)) == CAPTURED
+
+
+def test_unset_dates(sample):
+    # A zero mvhd time, and an encoder clock at the QuickTime epoch
+    assert read_video_date(sample('zero.mp4', mp4(mvhd_time=0))) is None
+    assert read_video_date(sample('epoch.mp4', mp4(mvhd_time=3600))) is None
+    assert read_video_date(sample('none.mp4', mp4())) is None
+    # An unset text date falls through to mvhd
+    clip = mp4(mvhd_time=MVHD_TIME, day='0000-00-00T00:00:00Z')
+    assert read_video_date(sample('unset.mp4', clip)) == datetime.fromtimestamp(
+        MVHD_TIME - QUICKTIME_EPOCH_OFFSET)
+
+
+def test_not_a_clip(sample):
+    assert read_video_date(sample('notes.mp4', b'not an mp4 file at all')) is None
+    assert read_video_date(sample('empty.mp4', b'')) is None
+
+
+@pytest.mark.parametrize('name, data', [
+    ('meta', mp4(mvhd_time=MVHD_TIME, creation_date='2023-08-14T10:22:31+0200', quicktime_meta=False)),
+    ('udta', mp4(mvhd_time=MVHD_TIME, mvhd_version=1, day='2023-08-14T10:22:31+02:00', itunes_day=True)),
+])
+def test_damaged_files_never_raise(sample, name, data):
+    path = sample(name, b'')
+    for variant in damaged(data):
+        with open(path, 'wb') as f:
+            f.write(variant)
+        date = read_video_date(path)
+        assert date is None or isinstance(date, datetime)